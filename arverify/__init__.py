@@ -0,0 +1,4 @@
+"""Helpers for computing and plotting the AR verification figures.
+
+Submodules are imported on demand; nothing heavy is pulled in here.
+"""
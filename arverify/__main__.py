@@ -0,0 +1,4 @@
+"""``python -m arverify``: see arverify/cli.py."""
+from arverify.cli import main
+
+main()
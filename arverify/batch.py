@@ -0,0 +1,231 @@
+"""Render the fig4 case-study maps for many valid times and lead times in one run.
+
+Every (valid time, lead) pair becomes one figure: the forecast-minus-ERA5 fields
+are regridded into a temporary directory (arverify/regrid.py) and drawn with
+the same panel code as fig4_models.py (arverify/casestudy.py).
+
+Each output gets a sidecar ``{output}.sha1`` holding a key over the drawing
+parameters, the source of the drawing and regridding modules (CODE_MODULES)
+and a fingerprint of every archive file the figure reads. A figure
+whose output exists with a matching key is skipped, so re-running a week's batch
+only renders the maps whose inputs or settings changed. Fingerprints use file
+size and modification time; ``--content-hash`` hashes the file bytes instead.
+
+    python -m arverify.batch 20240301_00 20240315_00 --every 24 --lead-days 3 5 7 \\
+        --models graphcast37 tigge aurora_ft fourcastnet fourcastnetv2 panguweather \\
+        --out-dir ./case_studies --animate
+
+With ``--catalog`` (arverify/catalog.py), init dates and time indices come from
+the catalog, and figures whose ERA5 forecast is not in it are reported as
+missing without touching the archive.
+"""
+import argparse
+import hashlib
+import importlib.util
+import json
+import multiprocessing
+import os
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timedelta
+
+import matplotlib
+import xarray as xr
+
+from arverify.casestudy import with_defaults
+from arverify.landfall import mask_path
+from arverify.regrid import FIG4_BOUNDS, METHODS, WEIGHTS_DIR, init_and_step, write_combined
+from arverify.scores import ARCHIVE_DIR, TRUTH, processed_path
+
+# Modules whose source is part of every figure key, so editing the drawing or regridding code re-renders
+CODE_MODULES = ("arverify.batch", "arverify.casestudy", "arverify.geometry", "arverify.regrid")
+ANIMATION_FORMATS = ("png", "jpg", "jpeg", "tif", "tiff", "webp", "bmp")  # raster formats PIL can read back
+
+_code_digest = None
+
+
+def code_digest():
+    """sha1 over the source files of CODE_MODULES, computed once per process."""
+    global _code_digest
+    if _code_digest is None:
+        digest = hashlib.sha1()
+        for name in CODE_MODULES:
+            with open(importlib.util.find_spec(name).origin, "rb") as f:
+                digest.update(f.read())
+        _code_digest = digest.hexdigest()
+    return _code_digest
+
+
+def valid_times(start, end, every_hours=24):
+    """Valid times from start to end inclusive, YYYYMMDD_HH strings."""
+    start_dt = datetime.strptime(start, "%Y%m%d_%H")
+    end_dt = datetime.strptime(end, "%Y%m%d_%H")
+    times = []
+    while start_dt <= end_dt:
+        times.append(start_dt.strftime("%Y%m%d_%H"))
+        start_dt += timedelta(hours=every_hours)
+    return times
+
+
+def figure_inputs(valid_time, lead_days, models, archive_dir=ARCHIVE_DIR, catalog=None):
+    """Archive files one figure reads, ERA5 first."""
+    date, _ = init_and_step(valid_time, lead_days, catalog=catalog)
+    return [path for model in [TRUTH] + list(models)
+            for path in (processed_path(date, model, archive_dir), mask_path(date, model, archive_dir))]
+
+
+def file_fingerprint(path, content=False):
+    if not os.path.exists(path):
+        return None
+    if not content:
+        stat = os.stat(path)
+        return [stat.st_size, stat.st_mtime_ns]
+    digest = hashlib.sha1()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def figure_key(valid_time, lead_days, models, options, settings, inputs, content=False):
+    payload = {
+        "code": code_digest(),
+        "valid_time": valid_time,
+        "lead_days": lead_days,
+        "models": list(models),
+        "options": options,
+        "settings": settings,
+        "inputs": {path: file_fingerprint(path, content) for path in inputs},
+    }
+    return hashlib.sha1(json.dumps(payload, sort_keys=True, default=str).encode()).hexdigest()
+
+
+def output_path(out_dir, valid_time, lead_days, fmt="png"):
+    return os.path.join(out_dir, f"{valid_time}_{lead_days}d.{fmt}")
+
+
+def is_up_to_date(path, key):
+    sidecar = f"{path}.sha1"
+    if not (os.path.exists(path) and os.path.exists(sidecar)):
+        return False
+    with open(sidecar) as f:
+        return f.read().strip() == key
+
+
+def figure_title(valid_time, lead_days):
+    valid_dt = datetime.strptime(valid_time, "%Y%m%d_%H")
+    return f'{lead_days}-Day Lead Time Forecasts Minus ERA5, Valid {valid_dt:%Y-%m-%d %H} UTC'
+
+
+def render_case(job):
+    """Regrid and draw one figure; returns (output path, "rendered" / "skipped" / "missing")."""
+    valid_time, lead_days, models, out_dir, options, settings, archive_dir, content, force, catalog = job
+    path = output_path(out_dir, valid_time, lead_days, settings["format"])
+    try:
+        inputs = figure_inputs(valid_time, lead_days, models, archive_dir, catalog)
+    except KeyError:
+        inputs = None
+    if inputs is None or not os.path.exists(inputs[0]):
+        print(f"Warning: no ERA5 file for {valid_time} at a {lead_days}-day lead. Skipping the figure.")
+        return path, "missing"
+    key = figure_key(valid_time, lead_days, models, options, settings, inputs, content)
+    if not force and is_up_to_date(path, key):
+        return path, "skipped"
+
+    matplotlib.use("Agg")
+    import matplotlib.pyplot as plt
+
+    from arverify.casestudy import apply_style, draw_figure
+
+    with tempfile.TemporaryDirectory() as work_dir:
+        write_combined(valid_time, lead_days, models, work_dir, archive_dir, bounds=FIG4_BOUNDS,
+                       method=settings["method"], cache_dir=WEIGHTS_DIR, catalog=catalog, diff=options["diff"])
+        datasets = {}
+        for model in models:
+            combined = os.path.join(work_dir, f"{model}_combined.nc")
+            if os.path.exists(combined):
+                with xr.open_dataset(combined) as ds:
+                    datasets[model] = ds.load()
+        apply_style(options)
+        fig = draw_figure(datasets, figure_title(valid_time, lead_days), options)
+        os.makedirs(out_dir, exist_ok=True)
+        fig.savefig(path, dpi=settings["dpi"], bbox_inches='tight')
+        plt.close(fig)
+    with open(f"{path}.sha1", "w") as f:
+        f.write(key)
+    return path, "rendered"
+
+
+def render_batch(times, lead_days, models, out_dir, options=None, archive_dir=ARCHIVE_DIR, method="bilinear",
+                 fmt="png", dpi=100, max_workers=1, content=False, force=False, catalog=None):
+    """Render (or skip) the figure of every valid time and lead; returns [(path, status)] in order."""
+    options = with_defaults(options)
+    settings = {"method": method, "format": fmt, "dpi": dpi}
+    jobs = [(valid_time, lead, list(models), out_dir, options, settings, archive_dir, content, force, catalog)
+            for lead in lead_days for valid_time in times]
+    if max_workers == 1:
+        return [render_case(job) for job in jobs]
+    methods = multiprocessing.get_all_start_methods()
+    context = multiprocessing.get_context("fork") if "fork" in methods else None
+    with ProcessPoolExecutor(max_workers=max_workers, mp_context=context) as pool:
+        return list(pool.map(render_case, jobs))
+
+
+def write_animation(frames, out_path, duration_ms=700):
+    """Stitch image files into an animated GIF, in the given order."""
+    from PIL import Image
+
+    images = [Image.open(frame).convert("RGB") for frame in frames]
+    size = images[0].size
+    images = [image if image.size == size else image.resize(size) for image in images]
+    images[0].save(out_path, save_all=True, append_images=images[1:], duration=duration_ms, loop=0)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Render fig4 case-study maps for many valid and lead times.")
+    parser.add_argument("start", help="first valid time, YYYYMMDD_HH")
+    parser.add_argument("end", nargs="?", help="last valid time, YYYYMMDD_HH (default: start)")
+    parser.add_argument("--every", type=int, default=24, help="hours between valid times")
+    parser.add_argument("--lead-days", nargs="+", type=int, default=[7])
+    parser.add_argument("--models", nargs="+", required=True)
+    parser.add_argument("--out-dir", default="./case_studies")
+    parser.add_argument("--format", default="png")
+    parser.add_argument("--dpi", type=int, default=100)
+    parser.add_argument("--method", choices=METHODS, default="bilinear")
+    parser.add_argument("--absolute", action="store_true", help="plot absolute fields instead of differences")
+    parser.add_argument("--darkmode", action="store_true")
+    parser.add_argument("--workers", type=int, default=1, help="figures rendered in parallel")
+    parser.add_argument("--content-hash", action="store_true", help="fingerprint inputs by content, not mtime")
+    parser.add_argument("--force", action="store_true", help="re-render even when up to date")
+    parser.add_argument("--animate", action="store_true",
+                        help=f"also write one GIF per lead time (--format {'/'.join(ANIMATION_FORMATS)})")
+    parser.add_argument("--archive-dir", default=ARCHIVE_DIR)
+    parser.add_argument("--catalog", help="archive catalog from python -m arverify.catalog")
+    args = parser.parse_args(argv)
+    if args.animate and args.format.lower() not in ANIMATION_FORMATS:
+        parser.error(f"--animate needs a raster --format ({', '.join(ANIMATION_FORMATS)}), not {args.format}")
+
+    times = valid_times(args.start, args.end or args.start, args.every)
+    options = {"diff": not args.absolute, "darkmode": args.darkmode}
+    catalog = None
+    if args.catalog:
+        from arverify.catalog import Catalog
+        catalog = Catalog.load(args.catalog)
+    results = render_batch(times, args.lead_days, args.models, args.out_dir, options, args.archive_dir,
+                           args.method, args.format, args.dpi, args.workers, args.content_hash, args.force,
+                           catalog)
+    counts = {}
+    for _, status in results:
+        counts[status] = counts.get(status, 0) + 1
+    print(", ".join(f"{n} {status}" for status, n in sorted(counts.items())))
+
+    if args.animate:
+        for lead in args.lead_days:
+            frames = [path for path, status in results
+                      if status != "missing" and path.endswith(f"_{lead}d.{args.format}")]
+            if frames:
+                write_animation(frames, os.path.join(args.out_dir, f"{args.start}_{lead}d.gif"))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,92 @@
+"""Moving-block bootstrap confidence intervals for the lead-time curves.
+
+The ±1 SEM bands in fig1.py and fig3.py treat every init date as independent,
+but forecasts from consecutive days share weather regimes and their errors are
+autocorrelated. Resampling blocks of consecutive cases keeps that dependence.
+
+All resamples of a (case x lead) matrix are drawn at once: the block starts are
+one integer array, they are turned into per-case multiplicities with a single
+``bincount``, and every resampled mean is then a row of one matrix product
+``counts @ data``. Independent (variable, model) matrices are spread over a
+process pool; each job gets its own random stream derived from the base seed and
+the job key, so results do not depend on job order or on the number of workers.
+"""
+import multiprocessing
+import zlib
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+
+def default_block_length(n_cases):
+    """n ** (1/3), a common default for the moving-block bootstrap."""
+    return max(1, int(round(n_cases ** (1 / 3))))
+
+
+def block_bootstrap_counts(n_cases, n_boot, block_length, rng):
+    """How often each case is drawn in each resample, as an (n_boot, n_cases) array.
+
+    Blocks wrap around the end of the series (circular block bootstrap) so every
+    case is equally likely to be drawn.
+    """
+    n_blocks = -(-n_cases // block_length)
+    starts = rng.integers(0, n_cases, size=(n_boot, n_blocks))
+    idx = (starts[:, :, None] + np.arange(block_length)).reshape(n_boot, -1)[:, :n_cases] % n_cases
+    flat = idx + (np.arange(n_boot) * n_cases)[:, None]
+    return np.bincount(flat.ravel(), minlength=n_boot * n_cases).reshape(n_boot, n_cases)
+
+
+def bootstrap_means(data, counts):
+    """Resampled nan-means of a (case x lead) matrix, one row per resample."""
+    data = np.asarray(data, dtype=np.float64)
+    valid = ~np.isnan(data)
+    counts = counts.astype(np.float64)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        return (counts @ np.where(valid, data, 0.0)) / (counts @ valid)
+
+
+def bootstrap_ci(data, n_boot=10000, block_length=None, alpha=0.05, seed=0):
+    """Percentile block-bootstrap interval of the case mean at every lead.
+
+    Returns (lower, upper), each of length n_leads. seed may be an int or a
+    np.random.SeedSequence.
+    """
+    data = np.asarray(data, dtype=np.float64)
+    n_cases = data.shape[0]
+    if block_length is None:
+        block_length = default_block_length(n_cases)
+    rng = np.random.default_rng(seed)
+    means = bootstrap_means(data, block_bootstrap_counts(n_cases, n_boot, block_length, rng))
+    # Leads with no samples at all come back as all-NaN columns
+    lower = np.full(data.shape[1], np.nan)
+    upper = np.full(data.shape[1], np.nan)
+    ok = ~np.all(np.isnan(means), axis=0)
+    quantile = np.nanquantile if np.isnan(means[:, ok]).any() else np.quantile
+    lower[ok], upper[ok] = quantile(means[:, ok], [alpha / 2, 1 - alpha / 2], axis=0)
+    return lower, upper
+
+
+def job_seed(seed, key):
+    """Seed sequence for one job, fixed by the base seed and the job key."""
+    return np.random.SeedSequence([seed, zlib.crc32(repr(key).encode())])
+
+
+def _ci_job(args):
+    key, data, n_boot, block_length, alpha, seed = args
+    return key, bootstrap_ci(data, n_boot, block_length, alpha, job_seed(seed, key))
+
+
+def bootstrap_cis(matrices, n_boot=10000, block_length=None, alpha=0.05, seed=0, max_workers=None):
+    """bootstrap_ci for every entry of {key: (case x lead) matrix}, on a process pool.
+
+    Keys are typically (variable, model). Returns {key: (lower, upper)}.
+    max_workers=1 runs everything in this process.
+    """
+    jobs = [(key, np.asarray(data), n_boot, block_length, alpha, seed) for key, data in matrices.items()]
+    if max_workers == 1 or len(jobs) < 2:
+        return dict(map(_ci_job, jobs))
+    # The figure scripts run top-level code, so children must not re-import __main__
+    methods = multiprocessing.get_all_start_methods()
+    context = multiprocessing.get_context("fork") if "fork" in methods else None
+    with ProcessPoolExecutor(max_workers=max_workers, mp_context=context) as pool:
+        return dict(pool.map(_ci_job, jobs))
@@ -0,0 +1,234 @@
+"""On-disk cache of the plot data the figure scripts compute, keyed by the content of their inputs.
+
+fig1.py, fig2.py and fig3.py spend nearly all of their time reading the
+metric files and reducing them. They compute means, standard errors, bootstrap
+intervals and box statistics. The figure itself only needs these few small
+arrays. ``memoize`` keys them by:
+
+* a hash of the contents of every input file or store directory
+* the parameters of the computation (variables, thresholds, windows, ...)
+* a version string the script bumps when the computation changes
+
+Re-rendering with a different style (``darkmode``, fonts, ``save_path``)
+finds the same key and reads one small .npz instead of the inputs.
+
+Hashing a file means reading it, so each file's digest is remembered by (size,
+mtime) in ``digests.json``. A repeat run then only stats the inputs. A file
+that changes gets a new digest, and so a new key. A file that is only touched
+is re-read once, but keeps its digest and its cache entries.
+
+Results are nested dicts and lists of arrays and numbers. They are stored as
+``.npz`` without pickling, with their structure in a JSON layout. The cache
+directory is capped at ``MAX_BYTES``. Past that, the least recently used
+entries go first; a hit refreshes an entry's mtime.
+
+    python -m arverify.cache --stats
+    python -m arverify.cache --prune 16     # shrink to 16 MB
+    python -m arverify.cache --clear
+
+The figure scripts skip the cache with ``cache=False`` (``python -m arverify fig1 --no-cache``).
+"""
+import argparse
+import glob
+import hashlib
+import json
+import os
+
+import numpy as np
+
+CACHE_DIR = "./data/plot_cache"
+DIGESTS_FILE = "digests.json"
+MAX_BYTES = 64 * 2**20
+CHUNK = 2**20
+
+_digests = {}
+_changed = set()  # cache dirs whose digests.json is out of date
+
+
+def load_digests(cache_dir):
+    if cache_dir not in _digests:
+        path = os.path.join(cache_dir, DIGESTS_FILE)
+        try:
+            with open(path) as f:
+                _digests[cache_dir] = json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            _digests[cache_dir] = {}
+    return _digests[cache_dir]
+
+
+def save_digests(cache_dir):
+    os.makedirs(cache_dir, exist_ok=True)
+    path = os.path.join(cache_dir, DIGESTS_FILE)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(_digests.get(cache_dir, {}), f)
+    os.replace(tmp_path, path)
+
+
+def file_digest(path, cache_dir=CACHE_DIR):
+    """sha1 of a file's contents, remembered by (size, mtime) so an unchanged file is not re-read."""
+    path = os.path.abspath(path)
+    stat = os.stat(path)
+    known = load_digests(cache_dir)
+    entry = known.get(path)
+    if entry is not None and entry[:2] == [stat.st_size, stat.st_mtime_ns]:
+        return entry[2]
+    digest = hashlib.sha1()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(CHUNK), b""):
+            digest.update(block)
+    known[path] = [stat.st_size, stat.st_mtime_ns, digest.hexdigest()]
+    _changed.add(cache_dir)
+    return known[path][2]
+
+
+def input_files(paths):
+    """Every file of paths, store directories expanded, in a fixed order; missing paths are kept as such."""
+    for path in paths:
+        if os.path.isdir(path):
+            for root, dirs, files in os.walk(path):
+                dirs.sort()
+                for name in sorted(files):
+                    yield os.path.join(root, name)
+        else:
+            yield path
+
+
+def result_key(name, inputs, params, cache_dir=CACHE_DIR):
+    """Hex key of a computation: its name, the contents of its inputs and its parameters."""
+    digest = hashlib.sha1(name.encode())
+    for path in input_files(inputs):
+        digest.update(path.encode())
+        digest.update(file_digest(path, cache_dir).encode() if os.path.exists(path) else b"missing")
+    digest.update(json.dumps(params, sort_keys=True, default=repr).encode())
+    return digest.hexdigest()[:20]
+
+
+def encode_key(key):
+    return {"t": [encode_key(k) for k in key]} if isinstance(key, tuple) else key
+
+
+def decode_key(key):
+    return tuple(decode_key(k) for k in key["t"]) if isinstance(key, dict) else key
+
+
+def pack(value, arrays):
+    """JSON layout of a nested dict / list / array / number value, adding its arrays to arrays."""
+    if isinstance(value, dict):
+        return {"dict": [[encode_key(k), pack(v, arrays)] for k, v in value.items()]}
+    if isinstance(value, (list, tuple)):
+        return {"list": [pack(v, arrays) for v in value], "tuple": isinstance(value, tuple)}
+    if value is None:
+        return {"none": True}
+    name = f"a{len(arrays)}"
+    arrays[name] = np.asarray(value)
+    return {"array": name, "scalar": np.ndim(value) == 0}
+
+
+def unpack(layout, arrays):
+    if "dict" in layout:
+        return {decode_key(k): unpack(v, arrays) for k, v in layout["dict"]}
+    if "list" in layout:
+        items = [unpack(v, arrays) for v in layout["list"]]
+        return tuple(items) if layout["tuple"] else items
+    if "none" in layout:
+        return None
+    array = arrays[layout["array"]]
+    return array.item() if layout["scalar"] else array
+
+
+def write_entry(path, value):
+    arrays = {}
+    layout = pack(value, arrays)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f"{path[:-4]}.tmp.npz"
+    np.savez(tmp_path, __layout__=np.array(json.dumps(layout)), **arrays)
+    os.replace(tmp_path, path)
+
+
+def read_entry(path):
+    with np.load(path, allow_pickle=False) as f:
+        arrays = {name: f[name] for name in f.files}
+    return unpack(json.loads(str(arrays.pop("__layout__"))), arrays)
+
+
+def entries(cache_dir=CACHE_DIR):
+    """[(mtime, size, path)] of the cache entries, least recently used first."""
+    found = []
+    for path in glob.glob(os.path.join(cache_dir, "*.npz")):
+        if path.endswith(".tmp.npz"):
+            continue
+        try:
+            stat = os.stat(path)
+        except FileNotFoundError:
+            continue
+        found.append((stat.st_mtime_ns, stat.st_size, path))
+    return sorted(found)
+
+
+def evict(cache_dir=CACHE_DIR, max_bytes=MAX_BYTES, keep=None):
+    """Delete least recently used entries until the cache holds at most max_bytes; returns the number deleted."""
+    found = entries(cache_dir)
+    total = sum(size for _, size, _ in found)
+    removed = 0
+    for _, size, path in found:
+        if total <= max_bytes:
+            break
+        if path == keep:
+            continue
+        os.remove(path)
+        total -= size
+        removed += 1
+    return removed
+
+
+def memoize(name, inputs, params, compute, cache_dir=CACHE_DIR, max_bytes=MAX_BYTES, enabled=True):
+    """compute()'s result from the cache when its inputs and params are unchanged, else compute and store it.
+
+    inputs are the files and store directories compute reads (missing ones are
+    part of the key too); params is anything JSON-like that changes the result.
+    """
+    if not enabled:
+        return compute()
+    key = result_key(name, inputs, params, cache_dir)
+    if cache_dir in _changed:
+        save_digests(cache_dir)
+        _changed.discard(cache_dir)
+    path = os.path.join(cache_dir, f"{name}_{key}.npz")
+    if os.path.exists(path):
+        try:
+            value = read_entry(path)
+            os.utime(path)
+            return value
+        except (OSError, ValueError, KeyError) as err:
+            print(f"Warning: unreadable cache entry {path} ({err}). Recomputing.")
+    value = compute()
+    write_entry(path, value)
+    evict(cache_dir, max_bytes, keep=path)
+    return value
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Inspect, shrink or clear the cache of computed plot data.")
+    parser.add_argument("--cache-dir", default=CACHE_DIR)
+    parser.add_argument("--stats", action="store_true", help="list the entries, least recently used first")
+    parser.add_argument("--prune", type=float, metavar="MB", help="evict entries until the cache fits in MB")
+    parser.add_argument("--clear", action="store_true", help="delete every entry and the file digests")
+    args = parser.parse_args(argv)
+
+    if args.clear:
+        for _, _, path in entries(args.cache_dir):
+            os.remove(path)
+        if os.path.exists(os.path.join(args.cache_dir, DIGESTS_FILE)):
+            os.remove(os.path.join(args.cache_dir, DIGESTS_FILE))
+    if args.prune is not None:
+        print(f"Evicted {evict(args.cache_dir, int(args.prune * 2**20))} entries")
+    found = entries(args.cache_dir)
+    if args.stats:
+        for _, size, path in found:
+            print(f"{size / 1024:10.1f} kB  {os.path.basename(path)}")
+    print(f"{len(found)} entries, {sum(size for _, size, _ in found) / 2**20:.2f} MB in {args.cache_dir}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,226 @@
+"""Init-date index of the metric products, and case filters resolved against it.
+
+Every product records the init date of each of its cases:
+
+* the fig_1 pickles: a ``dates.json`` next to them
+* the fig_1 metric cube: its index
+* the fig_2 ragged stores: their index plus per-value case ids
+* the fig_3 netCDFs: a ``dates`` attribute, which arverify/loading.py turns
+  into a coordinate
+
+A CaseIndex is built once per product. It keeps the dates sorted, with their
+order, so a date range is two ``searchsorted`` calls and comes back as a
+slice. It also precomputes one boolean bitmap per:
+
+* month and season
+* AR category and named event, from a labels file
+* "all_present": every model has a score that day
+
+A filter is a few terms joined by ``&``:
+
+    20231201-20240229            init dates in a range (either end may be left open)
+    DJF  /  month=12,1           seasons and months
+    category>=3  /  event=Feb24  AR category and named events from the labels file
+    all_present                  cases every model has
+
+``CaseIndex.select`` turns a filter into a slice when it is a single range,
+and otherwise into the sorted row indices of the range with the bitmaps
+ANDed in. The figure scripts take the filter as their ``case_filter`` setting,
+e.g. ``python -m arverify fig1 --cases "DJF & all_present"``.
+
+A labels file is JSON:
+
+    {"categories": {"20240201": 4, ...}, "events": {"Feb24": ["20240201", "20240202"]}}
+"""
+import ast
+import json
+import os
+import re
+
+import numpy as np
+
+DATES_FILE = "dates.json"
+SEASONS = {"DJF": (12, 1, 2), "MAM": (3, 4, 5), "JJA": (6, 7, 8), "SON": (9, 10, 11)}
+CATEGORIES = range(6)  # 0 = no AR category, 1-5 on the Ralph et al. (2019) scale
+
+
+def parse_dates(value):
+    """Init dates as YYYYMMDD strings, from a list, an array or the string repr of a list."""
+    if isinstance(value, str):
+        value = ast.literal_eval(value) if value.lstrip().startswith("[") else value.replace(",", " ").split()
+    return [str(date) for date in np.atleast_1d(value)]
+
+
+def read_dates(data_dir):
+    """The init dates in data_dir's dates.json, or None if there is none."""
+    path = os.path.join(data_dir, DATES_FILE)
+    if not os.path.exists(path):
+        return None
+    with open(path) as f:
+        return parse_dates(json.load(f))
+
+
+def write_dates(data_dir, dates):
+    os.makedirs(data_dir, exist_ok=True)
+    with open(os.path.join(data_dir, DATES_FILE), "w") as f:
+        json.dump(list(dates), f)
+
+
+def load_labels(path):
+    """(categories {date: int}, events {name: [dates]}) from a labels file; empty for None."""
+    if not path:
+        return {}, {}
+    with open(path) as f:
+        labels = json.load(f)
+    return ({str(date): int(cat) for date, cat in labels.get("categories", {}).items()},
+            {name: parse_dates(dates) for name, dates in labels.get("events", {}).items()})
+
+
+def to_days(dates):
+    return np.array([f"{d[:4]}-{d[4:6]}-{d[6:8]}" for d in dates], dtype="datetime64[D]")
+
+
+class CaseIndex:
+    """Sorted init dates and per-case bitmaps of one product's case axis."""
+
+    def __init__(self, dates, present=None, categories=None, events=None):
+        self.dates = parse_dates(dates) if len(dates) else []
+        days = to_days(self.dates)
+        self.n = len(days)
+        self.order = np.argsort(days, kind="stable")
+        self.sorted_days = days[self.order]
+        self.in_order = bool(np.all(self.order == np.arange(self.n)))
+        months = days.astype("datetime64[M]").astype(np.int64) % 12 + 1
+        self.bitmaps = {f"month={m}": months == m for m in range(1, 13)}
+        for season, season_months in SEASONS.items():
+            self.bitmaps[season] = np.isin(months, season_months)
+        if categories is not None:
+            category = np.array([categories.get(date, 0) for date in self.dates], dtype=np.int64)
+            for c in CATEGORIES:
+                self.bitmaps[f"category={c}"] = category == c
+        for name, event_dates in (events or {}).items():
+            self.bitmaps[f"event={name}"] = np.isin(self.dates, event_dates)
+        if present is not None:
+            self.bitmaps["all_present"] = np.asarray(present, dtype=bool)
+
+    @classmethod
+    def from_metrics(cls, dates, per_model, categories=None, events=None):
+        """Index of {model: (case, lead)} arrays; all_present marks cases with a score from every model."""
+        present = np.ones(len(dates), dtype=bool)
+        for values in per_model.values():
+            values = np.asarray(values)[:len(dates)]
+            has = np.zeros(len(dates), dtype=bool)
+            has[:len(values)] = ~np.all(np.isnan(values.reshape(len(values), -1)), axis=1)
+            present &= has
+        return cls(dates, present, categories, events)
+
+    def date_range(self, start=None, end=None):
+        """Rows with start <= init date <= end: a slice when the dates are in order, else sorted indices."""
+        lo = 0 if start is None else int(np.searchsorted(self.sorted_days, to_days([start])[0], "left"))
+        hi = self.n if end is None else int(np.searchsorted(self.sorted_days, to_days([end])[0], "right"))
+        if self.in_order:
+            return slice(lo, hi)
+        return np.sort(self.order[lo:hi])
+
+    def bitmap(self, term):
+        """The bitmap of one non-range term, e.g. "DJF", "month=1,2", "category>=3"."""
+        term = term.replace(" ", "")
+        if term.startswith("month="):
+            return np.any([self.bitmaps[f"month={int(m)}"] for m in term[len("month="):].split(",")], axis=0)
+        match = re.fullmatch(r"category(>=|<=|>|<|=)(\d)", term)
+        if match and "category=0" in self.bitmaps:
+            op, value = match.group(1), int(match.group(2))
+            keep = [c for c in CATEGORIES if {">=": c >= value, "<=": c <= value, ">": c > value,
+                                              "<": c < value, "=": c == value}[op]]
+            return np.any([self.bitmaps[f"category={c}"] for c in keep] + [np.zeros(self.n, dtype=bool)], axis=0)
+        if term.upper() in SEASONS:
+            return self.bitmaps[term.upper()]
+        if term not in self.bitmaps:
+            raise ValueError(f"Unknown case filter term {term!r}; available: date ranges, month=..., "
+                             f"{', '.join(k for k in self.bitmaps if not k.startswith(('month=', 'category=')))}"
+                             f"{', category...' if 'category=0' in self.bitmaps else ''}")
+        return self.bitmaps[term]
+
+    def select(self, spec):
+        """Rows matching a filter string: a slice for a plain date range, else sorted row indices."""
+        rows = slice(0, self.n)
+        masks = []
+        for term in (part.strip() for part in (spec or "").split("&")):
+            if not term:
+                continue
+            match = re.fullmatch(r"(\d{8})?\s*[-:]\s*(\d{8})?|(\d{8})", term)
+            if match:
+                start, end = (match.group(3), match.group(3)) if match.group(3) else match.group(1, 2)
+                rows = self.intersect(rows, self.date_range(start, end))
+            else:
+                masks.append(self.bitmap(term))
+        if not masks:
+            return rows
+        keep = np.logical_and.reduce(masks)
+        if isinstance(rows, slice):
+            return rows.start + np.flatnonzero(keep[rows])
+        return rows[keep[rows]]
+
+    def intersect(self, a, b):
+        if isinstance(a, slice) and isinstance(b, slice):
+            return slice(max(a.start, b.start), max(min(a.stop, b.stop), max(a.start, b.start)))
+        return np.intersect1d(np.arange(self.n)[a], np.arange(self.n)[b])
+
+    def row_mask(self, rows):
+        mask = np.zeros(self.n, dtype=bool)
+        mask[rows] = True
+        return mask
+
+
+def count(rows, n):
+    return len(range(n)[rows]) if isinstance(rows, slice) else len(rows)
+
+
+def filter_metrics(per_model, dates, spec, labels_path=None):
+    """{model: (case, lead)} cut to the cases matching spec; unchanged (with a warning) without dates."""
+    if dates is None:
+        print("Warning: these scores have no init dates (python -m arverify.migrate --dates ... adds them). "
+              "Ignoring the case filter.")
+        return per_model
+    categories, events = load_labels(labels_path)
+    index = CaseIndex.from_metrics(dates, per_model, categories if labels_path else None, events)
+    rows = index.select(spec)
+    print(f"Case filter {spec!r}: {count(rows, index.n)} of {index.n} cases")
+    return {model: np.asarray(values)[rows] for model, values in per_model.items()}
+
+
+def filter_landfall_errors(leads, spec, labels_path=None):
+    """RaggedLeads with only the errors of cases matching spec; unchanged (with a warning) without case ids."""
+    if not leads.dates or np.any(np.asarray(leads.case_ids) < 0):
+        print("Warning: these landfall errors have no case ids (write them with python -m arverify.landfall "
+              "--ragged). Ignoring the case filter.")
+        return leads
+    categories, events = load_labels(labels_path)
+    index = CaseIndex(leads.dates, None, categories if labels_path else None, events)
+    return leads.subset_cases(index.row_mask(index.select(spec)))
+
+
+def filter_fig3(ds, spec, labels_path=None):
+    """Recompute the fig_3 means / std / count of an ``open_models`` Dataset from the matching cases.
+
+    Needs the per-case ``{metric}_{threshold}_cases`` variables (contingency
+    ``--per-case``) and a ``dates`` coordinate; otherwise ds is returned unchanged
+    with a warning.
+    """
+    case_vars = [name for name in ds.data_vars if name.endswith("_cases")]
+    if not case_vars or "dates" not in ds.coords:
+        print("Warning: the fig_3 files have no per-case scores (python -m arverify.contingency --per-case). "
+              "Ignoring the case filter.")
+        return ds
+    present = np.all([ds[name].notnull().any("time").all("model").values for name in case_vars], axis=0)
+    categories, events = load_labels(labels_path)
+    index = CaseIndex(list(ds["dates"].values), present, categories if labels_path else None, events)
+    rows = index.select(spec)
+    print(f"Case filter {spec!r}: {count(rows, index.n)} of {index.n} cases")
+    ds = ds.isel(dates=rows)
+    for name in case_vars:
+        base = name[:-len("_cases")]
+        ds[base] = ds[name].mean("dates", skipna=True)
+        ds[f"{base}_std"] = ds[name].std("dates", skipna=True)
+        ds[f"{base}_count"] = ds[name].count("dates")
+    return ds
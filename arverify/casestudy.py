@@ -0,0 +1,343 @@
+"""Panel drawing for the fig4 case-study maps, serially or on a process pool.
+
+fig4_models.py draws six PlateCarree panels (IWV contourf, two SLP contour sets
+with labels, 850-hPa wind vectors, coastlines, gridlines and the AR outline).
+``draw_panel`` holds the drawing of one panel so that both render paths share it
+(coastlines and AR outlines come from the path cache in arverify/geometry.py):
+
+* ``draw_figure`` draws every panel into one figure (vector output, the default).
+* ``render_parallel`` gives each panel to a worker process. A worker builds a
+  figure with the same size, grid and spacing, draws only its panel (the last
+  one also draws the shared colorbar) on a transparent background and returns
+  the RGBA raster. The main process composites the layers in the order the
+  serial figure draws its axes, then the suptitle on top.
+
+Since every layer is rasterized on the same pixel grid, the composite matches
+``render_serial`` up to 8-bit rounding where anti-aliased edges of neighbouring
+panels overlap. The composite is for display only; a saved figure always comes
+from ``draw_figure``, so it stays vector and is cropped by ``bbox_inches``.
+
+Options are a dict with the keys of ``DEFAULT_OPTIONS``.
+"""
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+import cartopy.crs as ccrs
+import matplotlib as mpl
+import matplotlib.colors as mcolors
+import matplotlib.pyplot as plt
+import numpy as np
+import xarray as xr
+from cartopy.mpl.gridliner import LATITUDE_FORMATTER, LONGITUDE_FORMATTER
+from matplotlib.lines import Line2D
+from matplotlib.patches import Rectangle
+
+from arverify.geometry import contour_paths, draw_contour, draw_feature, feature_paths
+
+DEFAULT_OPTIONS = {
+    "darkmode": False,
+    "diff": True,  # difference from ERA5 rather than absolute values
+    "extent": [-180, -109.99, 15, 60.01],
+    "n_rows": 3,
+    "n_cols": 2,
+    "font_multiplier": 2.15,
+    "plot_quiver_key": 1,
+    "plot_x_labels": True,
+    "plot_y_labels": True,
+    "plot_colorbar": 1,
+    "plot_ar_outline": 1,
+}
+
+MODEL_NAMES = {
+    "graphcast37": "GraphCast",
+    "tigge": "HRES",
+    "fourcastnet": "FourCastNet",
+    "fourcastnetv2": "FourCastNetV2",
+    "panguweather": "PanguWeather",
+    "aurora_ft": "Aurora"
+}
+
+# Dark-mode IWV colormap (CW3E style), darkest first
+DARK_COLORS = np.array([
+    [0.49803922, 0.24705882, 0.64705882],
+    [0.38823529, 0.05098039, 0.48627451],
+    [0.60392157, 0.03529412, 0.32156863],
+    [0.81176471, 0.03529412, 0.16078431],
+    [0.98823529, 0.05490196, 0.10588235],
+    [0.98823529, 0.23137255, 0.11372549],
+    [0.99215686, 0.44313725, 0.13333333],
+    [0.99215686, 0.65098039, 0.16078431],
+    [0.99607843, 0.76470588, 0.18039216],
+    [0.99607843, 0.87843137, 0.2       ],
+    [1.        , 0.99215686, 0.21960784],
+
+    [0.1, 0.1, 1      ],
+
+    [0.70196078, 0.90196078, 0.18039216],
+    [0.39607843, 0.80784314, 0.14901961],
+    [0.12156863, 0.71372549, 0.12941176],
+    [0.12156863, 0.78431373, 0.34117647],
+    [0.14509804, 0.88235294, 0.63529412],
+    [0.16862745, 0.97647059, 0.9254902 ],
+    [0.12941176, 0.77254902, 0.99215686],
+    [0.07843137, 0.45882353, 0.98431373],
+    [0.04313725, 0.18039216, 0.98431373],
+    [0.02745098, 0.10588235, 0.78823529],
+    [1.        , 1.        , 1.        ]
+])
+
+
+def with_defaults(options=None):
+    return {**DEFAULT_OPTIONS, **(options or {})}
+
+
+def apply_style(options):
+    """Font sizes (and the dark style) of the case-study figures."""
+    if options["darkmode"]:
+        plt.style.use('dark_background')
+    font_multiplier = options["font_multiplier"]
+    plt.rcParams['font.size'] = 17 * font_multiplier
+    plt.rcParams['axes.labelsize'] = 17 * font_multiplier
+    plt.rcParams['axes.titlesize'] = 15 * font_multiplier
+    plt.rcParams['xtick.labelsize'] = 15 * font_multiplier
+    plt.rcParams['ytick.labelsize'] = 15 * font_multiplier
+    plt.rcParams['legend.fontsize'] = 17 * font_multiplier
+    plt.rcParams['figure.titlesize'] = 15 * font_multiplier
+
+
+def iwv_cmap(darkmode):
+    if not darkmode:
+        return plt.get_cmap('coolwarm')
+    # flip the colormap to match the data, and make the lowest color transparent
+    rgba_colors = np.concatenate([DARK_COLORS[::-1], np.ones((len(DARK_COLORS), 1))], axis=1)
+    rgba_colors[0, 3] = 0
+    return mcolors.ListedColormap(rgba_colors)
+
+
+def bkr_cmap(center_transparent=True):
+    """Blue to black to red, with a transparent band around zero."""
+    blues = np.array([(0, 0, i/128, 1) for i in range(128)])
+    reds = np.array([(i/128, 0, 0, 1) for i in range(128)])
+    colors = np.vstack((blues[::-1], reds))
+    if center_transparent:
+        center_idx = len(colors) // 2
+        width = 10  # Width of transparent region
+        colors[center_idx-width:center_idx+width, 3] = 0
+    return mcolors.ListedColormap(colors)
+
+
+def case_study_figure(options, dpi=None):
+    """The empty figure: one PlateCarree axes per grid cell, spacing already final.
+
+    The spacing is set before anything is drawn because contour label placement
+    depends on the axes' size on screen.
+    """
+    n_rows, n_cols = options["n_rows"], options["n_cols"]
+    fig = plt.figure(figsize=(11 * n_cols, 7 * n_rows), dpi=dpi)
+    gs = mpl.gridspec.GridSpec(n_rows, n_cols, figure=fig, wspace=0)
+    axes = [fig.add_subplot(gs[row, col], projection=ccrs.PlateCarree())
+            for row in range(n_rows) for col in range(n_cols)]
+    fig.subplots_adjust(left=0.05, right=0.88, bottom=0.05, top=0.9, wspace=0.6, hspace=0.12)
+    return fig, axes
+
+
+def draw_panel(ax, ds, model, idx, options):
+    """Draw one model's panel into ax; idx is the panel's position in the grid.
+
+    Returns (IWV contour set or None, levels, cmap) for the shared colorbar.
+    """
+    darkmode, diff = options["darkmode"], options["diff"]
+    font_multiplier = options["font_multiplier"]
+    U850 = ds['U850'].values
+    V850 = ds['V850'].values
+    PSL = ds['PSL'].values
+    TMQ = ds['TMQ'].values
+    ar_mask_model = ds['ar_mask'].values
+    lons = ds['lon'].values
+    lats = ds['lat'].values
+
+    ax.set_extent(options["extent"], crs=ccrs.PlateCarree())
+    xlocs_labels = np.array([-175, -155, -135, -115])
+    ylocs_labels = np.arange(20, 70, 10)
+
+    cf_tmq = None
+    TMQ = np.where(TMQ > 60, 60, TMQ)
+    if diff:
+        if model == "ERA5":
+            levels = np.arange(18, 64, 2)
+            cmap = iwv_cmap(darkmode)
+        else:
+            levels = np.arange(-25, 26, 2)
+            cmap = bkr_cmap() if darkmode else iwv_cmap(darkmode)
+            norm = mcolors.BoundaryNorm(levels, cmap.N)
+            cf_tmq = ax.contourf(lons, lats, TMQ, levels=levels, cmap=cmap, norm=norm,
+                                 transform=ccrs.PlateCarree())
+    else:
+        levels = np.arange(18, 64, 2)
+        cmap = iwv_cmap(darkmode)
+        cf_tmq = ax.contourf(lons, lats, TMQ, levels=levels, cmap=cmap, transform=ccrs.PlateCarree())
+
+    if options["plot_ar_outline"]:
+        draw_contour(ax, contour_paths(ar_mask_model, lats, lons, level=0.5), colors='k', linewidths=3.,
+                     linestyles="--")
+        ar_outline_proxy = Line2D([0], [0], color='k', linewidth=3., linestyle="--", label='AR Outline')
+        if idx == 0:
+            ax.legend(handles=[ar_outline_proxy], loc='lower right', bbox_to_anchor=(1, 0), prop={'size': 20},
+                      frameon=True)
+
+    # Sea level pressure contours
+    contour_color = "gray" if darkmode else "dimgray"
+    if diff and model != "ERA5":
+        cf_psl = ax.contour(lons, lats, PSL, levels=np.arange(-30, 34, 4), colors=contour_color, linewidths=1,
+                            transform=ccrs.PlateCarree())
+        ax.contour(lons, lats, PSL, levels=np.arange(-28, 30, 4), colors=contour_color, linewidths=1,
+                   transform=ccrs.PlateCarree())
+    else:
+        cf_psl = ax.contour(lons, lats, PSL, levels=np.arange(952, 1048, 4), colors=contour_color, linewidths=1,
+                            transform=ccrs.PlateCarree())
+        ax.contour(lons, lats, PSL, levels=np.arange(954, 1046, 4), colors=contour_color, linewidths=1,
+                   transform=ccrs.PlateCarree())
+    label_color = "black" if not darkmode else "white"
+    labels = ax.clabel(cf_psl, inline=True, fontsize=20, fmt='%d', colors=label_color)
+    for label in labels:
+        label.set_bbox(dict(facecolor='white' if not darkmode else 'black', edgecolor='none', pad=2, alpha=0.8))
+
+    # Wind vectors
+    barb_slice = slice(None, None, 10)
+    quiver_color = "w" if darkmode else "k"
+    Q = ax.quiver(lons[barb_slice], lats[barb_slice], U850[barb_slice, barb_slice], V850[barb_slice, barb_slice],
+                  pivot='middle', transform=ccrs.PlateCarree(), scale=450, color=quiver_color)
+
+    coastline_color = "w" if darkmode else "k"
+    draw_feature(ax, feature_paths("coastline", "110m", ax.projection, options["extent"]),
+                 edgecolor=coastline_color, linewidth=3)
+
+    # Gridline labels only on the leftmost column and the bottom row
+    n_rows, n_cols = options["n_rows"], options["n_cols"]
+    gl = ax.gridlines(crs=ccrs.PlateCarree(), draw_labels=True, linewidth=1, color='black', alpha=0,
+                      linestyle='--', xlocs=xlocs_labels, ylocs=ylocs_labels)
+    gl.top_labels = False
+    gl.right_labels = False
+    gl.left_labels = (idx % n_cols == 0) and options["plot_y_labels"]
+    gl.bottom_labels = (idx // n_cols == n_rows - 1) and options["plot_x_labels"]
+    gl.xformatter = LONGITUDE_FORMATTER
+    gl.yformatter = LATITUDE_FORMATTER
+    gl.xlabel_style = {'size': 15 * font_multiplier, 'color': 'black'}
+    gl.ylabel_style = {'size': 15 * font_multiplier, 'color': 'black'}
+
+    if options["plot_quiver_key"] and idx == 0:
+        rect_facecolor = 'k' if darkmode else 'white'
+        rect_edgecolor = 'w' if darkmode else 'k'
+        ax.add_patch(Rectangle((0.792, 0.9), 0.2, 0.09, facecolor=rect_facecolor, edgecolor=rect_edgecolor,
+                               transform=ax.transAxes, zorder=7, alpha=0.8))
+        key = ax.quiverkey(Q, X=0.845, Y=0.94, U=20, label='20 m/s', labelpos='E', labelcolor=label_color,
+                           color=quiver_color, coordinates='axes', fontproperties={'size': 23})
+        key.set_zorder(8)
+
+    ax.set_title(MODEL_NAMES.get(model, model.capitalize()), pad=5, fontsize=18*font_multiplier)
+    return cf_tmq, levels, cmap
+
+
+def draw_colorbar(fig, cf_tmq, levels, cmap, options):
+    cax = fig.add_axes([0.893, 0.108, 0.025, 0.772])
+    if options["diff"]:
+        norm = mcolors.BoundaryNorm(levels, cmap.N)
+        cbar = fig.colorbar(cf_tmq, cax=cax, norm=norm, boundaries=levels, ticks=levels[::2])
+        cbar.set_label('IWV Difference (mm)', labelpad=0)
+        cbar.set_ticks(np.arange(levels[0], levels[-1]+1, 5))
+    else:
+        norm = plt.Normalize(levels[0], levels[-1])
+        cbar = fig.colorbar(cf_tmq, cax=cax, norm=norm)
+        cbar.set_label('Integrated Water Vapor (mm)')
+        cbar.set_ticks(np.arange(levels[0], levels[-1]+1, 6))
+    return cbar
+
+
+def draw_suptitle(fig, title, options):
+    fig.suptitle(title, x=0.5, y=0.96, fontsize=20*options["font_multiplier"])
+
+
+def draw_figure(datasets, title, options=None, dpi=None):
+    """Every panel in one figure. datasets is {model: Dataset}, in panel order."""
+    options = with_defaults(options)
+    fig, axes = case_study_figure(options, dpi)
+    cf_tmq = levels = cmap = None
+    for idx, (model, ds) in enumerate(datasets.items()):
+        cf_tmq, levels, cmap = draw_panel(axes[idx], ds, model, idx, options)
+    draw_suptitle(fig, title, options)
+    if options["plot_colorbar"] and cf_tmq is not None:
+        draw_colorbar(fig, cf_tmq, levels, cmap, options)
+    return fig
+
+
+def figure_rgba(fig):
+    """Rasterize a figure into an (height, width, 4) uint8 array and close it."""
+    fig.canvas.draw()
+    rgba = np.array(fig.canvas.buffer_rgba())
+    plt.close(fig)
+    return rgba
+
+
+def _render_layer(job):
+    """Worker: one panel (or, with model None, the suptitle) on a transparent figure."""
+    model, path, idx, title, options, dpi, last = job
+    apply_style(options)
+    fig, axes = case_study_figure(options, dpi)
+    fig.patch.set_alpha(0)
+    for i, ax in enumerate(axes):
+        if i != idx:
+            ax.set_visible(False)
+    if model is None:
+        draw_suptitle(fig, title, options)
+        return figure_rgba(fig)
+    with xr.open_dataset(path) as ds:
+        cf_tmq, levels, cmap = draw_panel(axes[idx], ds.load(), model, idx, options)
+    if last and options["plot_colorbar"] and cf_tmq is not None:
+        draw_colorbar(fig, cf_tmq, levels, cmap, options)
+    return figure_rgba(fig)
+
+
+def composite(background, layers):
+    """Alpha-composite straight-alpha RGBA layers, in order, over an opaque background color."""
+    out = np.empty(layers[0].shape[:2] + (3,))
+    out[...] = np.asarray(mcolors.to_rgb(background))
+    for layer in layers:
+        alpha = layer[..., 3:] / 255.0
+        out = layer[..., :3] / 255.0 * alpha + out * (1 - alpha)
+    rgba = np.empty(out.shape[:2] + (4,), dtype=np.uint8)
+    rgba[..., :3] = np.round(out * 255)
+    rgba[..., 3] = 255
+    return rgba
+
+
+def render_parallel(paths, title, options=None, dpi=100, max_workers=None):
+    """RGBA raster of the figure, one worker process per panel.
+
+    paths is {model: combined netCDF path}, in panel order.
+    """
+    options = with_defaults(options)
+    jobs = [(model, path, idx, title, options, dpi, idx == len(paths) - 1)
+            for idx, (model, path) in enumerate(paths.items())]
+    jobs.append((None, None, -1, title, options, dpi, False))
+    methods = multiprocessing.get_all_start_methods()
+    context = multiprocessing.get_context("fork") if "fork" in methods else None
+    with ProcessPoolExecutor(max_workers=max_workers or len(jobs), mp_context=context) as pool:
+        layers = list(pool.map(_render_layer, jobs))
+    return composite("black" if options["darkmode"] else "white", layers)
+
+
+def render_serial(paths, title, options=None, dpi=100):
+    """RGBA raster of the serially drawn figure, for comparison with render_parallel."""
+    options = with_defaults(options)
+    datasets = {}
+    for model, path in paths.items():
+        with xr.open_dataset(path) as ds:
+            datasets[model] = ds.load()
+    return figure_rgba(draw_figure(datasets, title, options, dpi))
+
+
+def show_raster(rgba, dpi=100):
+    """Display an RGBA raster at its native size."""
+    fig = plt.figure(figsize=(rgba.shape[1] / dpi, rgba.shape[0] / dpi), dpi=dpi)
+    fig.figimage(rgba)
+    return fig
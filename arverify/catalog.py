@@ -0,0 +1,245 @@
+"""Catalog of the archive's forecast files, for time lookups without opening netCDF.
+
+    python -m arverify.catalog --archive-dir /glade/campaign/univ/ucub0156/runs --out ./data/catalog.json
+    python -m arverify.catalog --lookup 20240315_00 --models ERA5 tigge graphcast37
+
+The catalog is built by one scan of ``processed/{date}/{model}/{model}.nc``.
+For each file it reads the time coordinate once and stores it compactly: the
+first valid time and a fixed step when the axis is regular, or every offset
+when it is not. Sizes and modification times are kept too, so a rescan with
+``--update`` only re-reads the files that changed.
+
+Loading builds two dicts:
+
+* (model, init date) -> file entry
+* (model, valid hour) -> [(init date, time index)]
+
+So these are all O(1) and need no file access:
+
+* the time index of a lead
+* the valid time of an index
+* every lagged forecast valid at a given time
+
+Init times are the date directories at 00 UTC, so a file whose axis starts at
+a later hour still gets the right lead. Mask files (``masked/{date}/{model}_processed.nc``)
+share their processed file's time axis.
+"""
+import argparse
+import json
+import os
+from datetime import datetime, timedelta
+
+import numpy as np
+
+from arverify.landfall import mask_path
+from arverify.scores import ARCHIVE_DIR, TRUTH, processed_path
+
+CATALOG_PATH = "./data/catalog.json"
+FORMAT = "archive_catalog"
+FORMAT_VERSION = 1
+EPOCH = datetime(1970, 1, 1)
+
+
+def hour_key(dt):
+    """Hours since 1970 of a datetime, the catalog's key for valid times."""
+    return int((dt - EPOCH) // timedelta(hours=1))
+
+
+def parse_valid_time(valid_time):
+    """datetime of a YYYYMMDD_HH string (datetimes pass through)."""
+    return valid_time if isinstance(valid_time, datetime) else datetime.strptime(valid_time, "%Y%m%d_%H")
+
+
+def init_datetime(date):
+    return datetime.strptime(date, "%Y%m%d")
+
+
+def file_stat(path):
+    stat = os.stat(path)
+    return [stat.st_size, stat.st_mtime_ns]
+
+
+def read_offsets(path, date):
+    """Valid times of one file as whole hours after 00 UTC on its init date."""
+    import xarray as xr
+
+    with xr.open_dataset(path) as ds:
+        times = ds["time"].values
+    init = np.datetime64(init_datetime(date), "h")
+    return [int(offset) for offset in (times.astype("datetime64[h]") - init).astype(np.int64)]
+
+
+def compact(offsets):
+    """{"first", "step", "n"} for an evenly spaced axis, else {"offsets": [...]}."""
+    steps = np.diff(offsets)
+    if len(offsets) and (len(steps) == 0 or np.all(steps == steps[0])) and (len(steps) == 0 or steps[0] > 0):
+        return {"first": offsets[0], "step": int(steps[0]) if len(steps) else 0, "n": len(offsets)}
+    return {"offsets": list(offsets)}
+
+
+def expand(axis):
+    if "offsets" in axis:
+        return list(axis["offsets"])
+    return [axis["first"] + k * axis["step"] for k in range(axis["n"])]
+
+
+def archive_files(archive_dir, models=None, dates=None):
+    """(date, model, path) of every processed file under archive_dir, optionally only some models and dates."""
+    root = os.path.join(archive_dir, "processed")
+    if not os.path.isdir(root):
+        return
+    for date in sorted(dates or os.listdir(root)):
+        date_dir = os.path.join(root, date)
+        if not os.path.isdir(date_dir):
+            continue
+        for model in sorted(models or os.listdir(date_dir)):
+            path = processed_path(date, model, archive_dir)
+            if os.path.exists(path):
+                yield date, model, path
+
+
+class Catalog:
+    """File paths and time axes of every (model, init date) in the archive."""
+
+    def __init__(self, archive_dir, entries=()):
+        self.archive_dir = archive_dir
+        self.entries = {}
+        self.by_valid = {}
+        for entry in entries:
+            self.add(entry)
+
+    def add(self, entry):
+        key = (entry["model"], entry["date"])
+        self.entries[key] = entry
+        init = hour_key(init_datetime(entry["date"]))
+        offsets = expand(entry["axis"])
+        entry["_index"] = {offset: k for k, offset in enumerate(offsets)}
+        entry["_offsets"] = offsets
+        for k, offset in enumerate(offsets):
+            self.by_valid.setdefault((entry["model"], init + offset), []).append((entry["date"], k))
+
+    @classmethod
+    def scan(cls, archive_dir=ARCHIVE_DIR, models=None, dates=None, previous=None):
+        """Read the time axis of every processed file; entries of previous whose file is unchanged are reused.
+
+        When only some models or dates are scanned, the entries of previous
+        outside them are carried over as they are.
+        """
+        reuse = previous.entries if previous is not None and previous.archive_dir == archive_dir else {}
+        catalog = cls(archive_dir)
+        for (model, date), entry in reuse.items():
+            if (models and model not in models) or (dates and date not in dates):
+                catalog.add(entry)
+        for date, model, path in archive_files(archive_dir, models, dates):
+            stat = file_stat(path)
+            old = reuse.get((model, date))
+            if old is not None and old["stat"] == stat:
+                axis = old["axis"]
+            else:
+                axis = compact(read_offsets(path, date))
+            catalog.add({"model": model, "date": date, "stat": stat, "axis": axis,
+                         "mask": os.path.exists(mask_path(date, model, archive_dir))})
+        return catalog
+
+    @classmethod
+    def load(cls, path):
+        with open(path) as f:
+            data = json.load(f)
+        if data.get("format") != FORMAT:
+            raise ValueError(f"{path}: not an archive catalog")
+        if data.get("version", 1) > FORMAT_VERSION:
+            raise ValueError(f"{path}: catalog version {data['version']} is newer than this code reads ({FORMAT_VERSION})")
+        return cls(data["archive_dir"], data["entries"])
+
+    def save(self, path):
+        entries = [{key: value for key, value in entry.items() if not key.startswith("_")}
+                   for entry in self.entries.values()]
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump({"format": FORMAT, "version": FORMAT_VERSION, "archive_dir": self.archive_dir,
+                       "entries": entries}, f)
+        os.replace(tmp_path, path)
+
+    def __len__(self):
+        return len(self.entries)
+
+    def __contains__(self, key):
+        return tuple(key) in self.entries
+
+    def models(self):
+        return sorted({model for model, _ in self.entries})
+
+    def dates(self, model=TRUTH):
+        return sorted(date for m, date in self.entries if m == model)
+
+    def paths(self, model, date):
+        """(processed path, mask path or None) of one forecast."""
+        entry = self.entries[(model, date)]
+        return (processed_path(date, model, self.archive_dir),
+                mask_path(date, model, self.archive_dir) if entry["mask"] else None)
+
+    def index(self, model, date, lead_hours):
+        """Time index of the lead in one forecast's file, or None if the file does not hold it."""
+        return self.entries[(model, date)]["_index"].get(lead_hours)
+
+    def valid_time(self, model, date, index):
+        """Valid datetime of a time index of one forecast."""
+        return init_datetime(date) + timedelta(hours=self.entries[(model, date)]["_offsets"][index])
+
+    def n_times(self, model, date):
+        return len(self.entries[(model, date)]["_offsets"])
+
+    def forecasts_valid_at(self, model, valid_time):
+        """[(lead hours, init date, time index)] of every forecast of model valid at valid_time, shortest lead first."""
+        valid = hour_key(parse_valid_time(valid_time))
+        found = self.by_valid.get((model, valid), [])
+        return sorted((valid - hour_key(init_datetime(date)), date, index) for date, index in found)
+
+    def init_and_step(self, valid_time, lead_days, model=TRUTH):
+        """Init date and time index of model's forecast valid at valid_time, lead_days after its init.
+
+        The catalogued counterpart of ``regrid.init_and_step``; KeyError if the
+        archive holds no such forecast.
+        """
+        valid_dt = parse_valid_time(valid_time)
+        date = (valid_dt - timedelta(days=lead_days)).strftime("%Y%m%d")
+        lead_hours = hour_key(valid_dt) - hour_key(init_datetime(date))
+        index = self.index(model, date, lead_hours) if (model, date) in self.entries else None
+        if index is None:
+            raise KeyError(f"No {model} forecast initialized {date} valid {valid_dt:%Y-%m-%d %H} UTC in the catalog.")
+        return date, index
+
+
+def open_catalog(path=CATALOG_PATH, archive_dir=ARCHIVE_DIR, models=None, dates=None):
+    """The saved catalog at path, or else a scan of just the given models and dates (with a warning)."""
+    if os.path.exists(path):
+        return Catalog.load(path)
+    print(f"Warning: no archive catalog at {path} (python -m arverify.catalog builds it). Scanning the files needed.")
+    return Catalog.scan(archive_dir, models, dates)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Build or query the archive catalog of forecast files and time axes.")
+    parser.add_argument("--archive-dir", default=ARCHIVE_DIR)
+    parser.add_argument("--out", default=CATALOG_PATH, help="catalog file to write or read")
+    parser.add_argument("--models", nargs="+", help="only these models (default: all)")
+    parser.add_argument("--update", action="store_true",
+                        help="reuse the entries of unchanged files and keep those of models not in --models")
+    parser.add_argument("--lookup", metavar="YYYYMMDD_HH", help="list the forecasts valid at this time instead")
+    args = parser.parse_args(argv)
+
+    if args.lookup:
+        catalog = Catalog.load(args.out)
+        for model in args.models or catalog.models():
+            for lead_hours, date, index in catalog.forecasts_valid_at(model, args.lookup):
+                print(f"{model:<14} init {date}  lead {lead_hours:>4} h  index {index:>3}  {catalog.paths(model, date)[0]}")
+        return
+    previous = Catalog.load(args.out) if args.update and os.path.exists(args.out) else None
+    catalog = Catalog.scan(args.archive_dir, args.models, previous=previous)
+    catalog.save(args.out)
+    print(f"{len(catalog)} files, {len(catalog.models())} models -> {args.out}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,191 @@
+"""Command-line entry point for the figure scripts, for cron and batch jobs.
+
+    python -m arverify fig1 --save ./fig_1.pdf --error-band bootstrap
+    python -m arverify fig1 --significance tigge --save ./fig_1_significance.pdf
+    python -m arverify fig3 --threshold 500 --no-uswc --save ./fig_3_500km.pdf
+    python -m arverify fig3 --significance tigge --error-band bootstrap --save ./fig_3_significance.pdf
+    python -m arverify fig2 --cases "20231201-20240229" --save ./fig_2_winter.pdf
+    python -m arverify fig4 --parallel --save ./fig4_models.png
+    python -m arverify check-startup
+
+Each figure command sets the script's overrides (arverify/config.py), selects
+the non-interactive Agg backend and runs the unchanged script from the
+repository root, so its ``./data`` paths resolve. Only this module and argparse
+are imported up front. The plotting stack is imported by the script that runs,
+and not at all for ``--help`` or ``check-startup``.
+
+``check-startup`` times, each in a fresh interpreter, ``import arverify.cli``
+(which must stay under STARTUP_BUDGET and import none of HEAVY_MODULES) and the
+``arverify`` imports of the scripts in LIGHT_SCRIPTS (under SCRIPT_BUDGET, and
+none of SCRIPT_HEAVY_MODULES). It is not run on its own: benchmarks/bench_startup.py
+calls the same checks, so ``python -m benchmarks.run`` and ``asv run`` fail when
+an import regresses.
+"""
+import argparse
+import os
+import sys
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SCRIPTS = {
+    "fig1": "fig1.py",
+    "fig2": "fig2.py",
+    "fig3": "fig3.py",
+    "fig4": "fig4_models.py",
+    "fig4-era5": "fig4_ERA5.py",
+}
+HEAVY_MODULES = ("numpy", "matplotlib", "xarray", "pandas", "scipy", "cartopy", "dask")
+STARTUP_BUDGET = 0.2  # seconds for ``import arverify.cli``
+# fig1 and fig2 read numpy stores only; xarray and friends belong to fig3/fig4
+LIGHT_SCRIPTS = ("fig1", "fig2")
+SCRIPT_HEAVY_MODULES = ("xarray", "pandas", "scipy", "cartopy", "dask")
+SCRIPT_BUDGET = 0.5  # seconds for a script's ``arverify`` imports
+
+
+def run_script(name, overrides, show=False):
+    """Run one figure script with overrides, from the repository root."""
+    import runpy
+    import warnings
+
+    if not show:
+        os.environ["MPLBACKEND"] = "Agg"
+    from arverify.config import set_overrides
+
+    set_overrides(**overrides)
+    cwd = os.getcwd()
+    os.chdir(REPO_DIR)
+    try:
+        with warnings.catch_warnings():
+            # plt.show() at the end of every script is a no-op under Agg
+            warnings.filterwarnings("ignore", message=".*non-interactive.*")
+            runpy.run_path(SCRIPTS[name], run_name="__main__")
+    finally:
+        os.chdir(cwd)
+        set_overrides()
+
+
+def script_imports(name):
+    """The ``arverify`` modules a figure script imports at the top level."""
+    import ast
+
+    with open(os.path.join(REPO_DIR, SCRIPTS[name])) as f:
+        tree = ast.parse(f.read())
+    modules = []
+    for node in tree.body:
+        if isinstance(node, ast.ImportFrom) and (node.module or "").startswith("arverify"):
+            modules.append(node.module)
+        elif isinstance(node, ast.Import):
+            modules += [alias.name for alias in node.names if alias.name.startswith("arverify")]
+    return modules
+
+
+def time_imports(modules, heavy_modules=HEAVY_MODULES):
+    """Time importing modules in a fresh interpreter; returns (seconds, heavy modules loaded)."""
+    import json
+    import subprocess
+
+    imports = "; ".join(f"import {module}" for module in modules)
+    code = (f"import sys, time; t = time.perf_counter(); {imports}; t = time.perf_counter() - t; "
+            f"import json; print(json.dumps([t, [m for m in {tuple(heavy_modules)!r} if m in sys.modules]]))")
+    env = {**os.environ, "PYTHONPATH": os.pathsep.join(filter(None, [REPO_DIR, os.environ.get("PYTHONPATH")]))}
+    out = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, check=True, env=env,
+                         cwd=REPO_DIR)
+    seconds, heavy = json.loads(out.stdout.strip().splitlines()[-1])
+    return seconds, heavy
+
+
+def check_startup(budget=STARTUP_BUDGET, script_budget=SCRIPT_BUDGET):
+    """Run the import checks; returns a list of (label, seconds, budget, heavy modules loaded)."""
+    seconds, heavy = time_imports(["arverify.cli"])
+    results = [("import arverify.cli", seconds, budget, heavy)]
+    for name in LIGHT_SCRIPTS:
+        seconds, heavy = time_imports(script_imports(name), SCRIPT_HEAVY_MODULES)
+        results.append((f"{SCRIPTS[name]} arverify imports", seconds, script_budget, heavy))
+    return results
+
+
+def startup_failures(results):
+    """Messages for the checks in results that are over budget or import heavy modules."""
+    failures = []
+    for label, seconds, budget, heavy in results:
+        if seconds > budget:
+            failures.append(f"{label}: {seconds * 1000:.1f} ms is over the {budget * 1000:.0f} ms budget")
+        if heavy:
+            failures.append(f"{label}: imports {', '.join(heavy)}")
+    return failures
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog="python -m arverify", description="Render the paper figures headlessly.")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    def figure_command(name, help):
+        sub = commands.add_parser(name, help=help)
+        sub.add_argument("--save", metavar="PATH", help="write the figure to PATH")
+        sub.add_argument("--darkmode", action="store_true", default=None)
+        sub.add_argument("--show", action="store_true", help="use the interactive backend and show the figure")
+        return sub
+
+    def case_arguments(sub):
+        sub.add_argument("--cases", dest="case_filter", metavar="FILTER",
+                         help='only these init dates, e.g. "DJF & all_present" (see arverify/cases.py)')
+        sub.add_argument("--case-labels", type=os.path.abspath, metavar="JSON",
+                         help="AR categories / named events for category>=N and event=NAME filters")
+        return sub
+
+    fig1 = figure_command("fig1", "RMSE and bias against lead time")
+    fig1.add_argument("--error-band", choices=["sem", "bootstrap"])
+    fig1.add_argument("--region", help="region name from arverify/regions.py (default USWC)")
+    fig1.add_argument("--significance", metavar="MODEL",
+                      help="mark leads where each model differs significantly from MODEL (e.g. tigge)")
+    fig1.add_argument("--significance-test", choices=["permutation", "dm"])
+    case_arguments(fig1)
+    fig2 = case_arguments(figure_command("fig2", "landfall-latitude error box plots"))
+    fig3 = figure_command("fig3", "CSI / POD / FAR against lead time")
+    fig3.add_argument("--threshold", type=int, help="matching distance in km (500 or 1000)")
+    fig3.add_argument("--uswc", dest="USWC", action="store_const", const=1, help="US West Coast objects only")
+    fig3.add_argument("--no-uswc", dest="USWC", action="store_const", const=0, help="objects in every region")
+    fig3.add_argument("--region", help="region name from arverify/regions.py (overrides --uswc)")
+    fig3.add_argument("--landfalling", action="store_const", const=1, help="landfalling objects only")
+    fig3.add_argument("--error-band", choices=["sem", "bootstrap"])
+    fig3.add_argument("--significance", metavar="MODEL",
+                      help="mark leads where each model differs significantly from MODEL (needs per-case scores)")
+    fig3.add_argument("--significance-test", choices=["permutation", "dm"])
+    case_arguments(fig3)
+    for sub in (fig1, fig2, fig3):
+        sub.add_argument("--no-cache", dest="cache", action="store_const", const=False,
+                         help="recompute the plot data instead of reading it from ./data/plot_cache")
+    fig4 = figure_command("fig4", "forecast-minus-ERA5 case-study maps")
+    fig4.add_argument("--models", dest="model_list", nargs="+")
+    fig4.add_argument("--absolute", dest="diff", action="store_const", const=False, help="absolute fields")
+    fig4.add_argument("--parallel", dest="parallel_render", action="store_const", const=True,
+                      help="draw panels in worker processes (display only; --save draws serially)")
+    figure_command("fig4-era5", "the ERA5 case-study map")
+
+    check = commands.add_parser("check-startup",
+                                help="fail if importing the CLI or the fig1/fig2 dependencies regresses")
+    check.add_argument("--budget", type=float, default=STARTUP_BUDGET, help="seconds for arverify.cli")
+    check.add_argument("--script-budget", type=float, default=SCRIPT_BUDGET, help="seconds per script")
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    if args.command == "check-startup":
+        results = check_startup(args.budget, args.script_budget)
+        for label, seconds, budget, heavy in results:
+            print(f"{label}: {seconds * 1000:.1f} ms (budget {budget * 1000:.0f} ms)")
+        failures = startup_failures(results)
+        for failure in failures:
+            print(f"Failed: {failure}")
+        if failures:
+            sys.exit(1)
+        return
+
+    overrides = {key: value for key, value in vars(args).items() if key not in ("command", "save", "show")}
+    if args.save:
+        overrides.update(save=True, save_path=os.path.abspath(args.save))
+    run_script(args.command, overrides, show=args.show)
+
+
+if __name__ == "__main__":
+    main()
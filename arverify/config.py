@@ -0,0 +1,23 @@
+"""Run-time overrides for the figure scripts' settings.
+
+The scripts keep their settings as module globals at the top of the file.
+Each one that can be set from the command line reads its value through
+``param``, which returns the script's own default unless ``python -m arverify``
+(arverify/cli.py) supplied an override for this run:
+
+    save = param("save", False)
+
+Running a script directly, or cell by cell in an editor, behaves as before.
+This module is imported by every script, so it must stay free of heavy imports.
+"""
+OVERRIDES = {}
+
+
+def param(name, default):
+    return OVERRIDES.get(name, default)
+
+
+def set_overrides(**values):
+    """Replace the overrides with the given values (None means keep the default)."""
+    OVERRIDES.clear()
+    OVERRIDES.update({name: value for name, value in values.items() if value is not None})
@@ -0,0 +1,341 @@
+"""Object-based CSI / POD / FAR of the AR masks, in the fig_3 netCDF schema.
+
+Each time step of the forecast and ERA5 ``class_masks`` is split into connected
+AR objects. A forecast object is a hit if an ERA5 object at the same lead step
+lies within the distance threshold (great-circle distance between centroids),
+and vice versa:
+
+    POD = matched ERA5 objects / ERA5 objects
+    FAR = unmatched forecast objects / forecast objects
+    CSI = matched ERA5 objects / (ERA5 objects + unmatched forecast objects)
+
+Scores are computed per init date and lead step and averaged over init dates;
+the std and count of the per-date values go into the ``std`` / ``count``
+attributes fig3.py uses for its error band:
+
+    python -m arverify.contingency 20231101 20240331 --models tigge graphcast37 --out-dir ./data/fig_3
+
+``--variants`` writes every fig_3 filter variant from one pass:
+
+* all ARs (no suffix)
+* ``_USWC``: objects with a centroid in the USWC box
+* ``_landfalling``: objects that touch the USWC coastline cells of arverify/landfall.py
+* ``_USWC_landfalling``: both
+
+``--regions USWC PNW CA AK`` does the same for the named regions of
+arverify/regions.py and writes ``{model}_metrics_{region}.nc``.
+
+With ``--objects-dir``, the object tables come from the stores written by
+``python -m arverify.objects`` instead of from the mask files. Dates a store
+does not cover are still read from the masks.
+
+In both cases each date's masks are read and labelled once. ``object_pairs``
+then finds every same-step (forecast, ERA5) pair within the largest
+threshold once. Filtering both sides before matching gives the same nearest
+distances as the closest pair among the kept objects. So each variant is a
+boolean selection over that pair table followed by the counts.
+
+Matching uses a KD-tree on unit-sphere centroids, where chord length is a
+monotone function of great-circle distance. Lead steps are kept apart by an
+extra coordinate (lead step x 10, more than the largest chord), so one tree per
+init date covers every lead. Each object needs a single nearest-neighbour query,
+and all thresholds are then one comparison against that distance.
+"""
+import argparse
+import os
+import warnings
+
+import numpy as np
+import xarray as xr
+from scipy.spatial import cKDTree
+
+from arverify.landfall import ar_mask, coast_index, mask_path
+from arverify.objects import centroid_columns, label_objects, open_objects, wraps
+from arverify.regions import load_region_file, objects_in_region, region_bbox
+from arverify.scores import ARCHIVE_DIR, N_LEADS, TRUTH, USWC_BOUNDS, date_range
+
+EARTH_RADIUS_KM = 6371.0
+THRESHOLDS = (250, 500, 1000, 1500)
+METRICS = ("CSI", "POD", "FAR")
+TIME_SEPARATION = 10.0  # larger than any chord on the unit sphere (2)
+VARIANTS = ("", "_USWC", "_landfalling", "_USWC_landfalling")  # fig_3 file suffixes
+LANDFALL_COAST = "USWC"  # arverify/landfall.py coast whose cells make an object landfalling
+
+
+def object_table(mask, lats, lons, coast=None):
+    """Time step, centroid and cell count of every object in a (time, lat, lon) mask.
+
+    Centroids come from objects.centroid_columns, as in the object stores,
+    and on a global grid objects are joined across the 0/360 seam. With a CoastIndex, a
+    "landfalling" column flags the objects covering any of its cells.
+    """
+    labels, n = label_objects(mask, wraps(lons))
+    t, i, j = np.nonzero(labels)
+    table = centroid_columns(labels[t, i, j] - 1, n, t, np.asarray(lats, dtype=np.float64)[i],
+                             np.asarray(lons, dtype=np.float64)[j])
+    if coast is not None:
+        touched = np.zeros(n + 1, dtype=bool)
+        touched[labels[:, coast.lat_idx, coast.lon_idx].ravel()] = True
+        table["landfalling"] = touched[1:]
+    return table
+
+
+def subset_objects(table, keep):
+    return {key: values[keep] for key, values in table.items()}
+
+
+def in_bounds(table, bounds):
+    min_lon, max_lon, min_lat, max_lat = bounds
+    return (table["lon"] >= min_lon) & (table["lon"] <= max_lon) & \
+        (table["lat"] >= min_lat) & (table["lat"] <= max_lat)
+
+
+def chord_length(distance_km):
+    return 2 * np.sin(np.asarray(distance_km) / (2 * EARTH_RADIUS_KM))
+
+
+def chord_to_km(chord):
+    with np.errstate(invalid="ignore"):
+        return np.where(np.isfinite(chord), 2 * EARTH_RADIUS_KM * np.arcsin(np.minimum(chord / 2, 1)), np.inf)
+
+
+def object_points(table):
+    return np.column_stack([table["xyz"], table["time"] * TIME_SEPARATION])
+
+
+def nearest_distances(query, reference, max_km):
+    """Great-circle distance (km) from each query object to the nearest reference
+    object at the same time step; inf when none is within max_km."""
+    if len(reference["time"]) == 0 or len(query["time"]) == 0:
+        return np.full(len(query["time"]), np.inf)
+    tree = cKDTree(object_points(reference))
+    chord, _ = tree.query(object_points(query), k=1, distance_upper_bound=chord_length(max_km))
+    return chord_to_km(chord)
+
+
+def object_pairs(fc, obs, max_km):
+    """(forecast index, ERA5 index, km) of every same-step object pair within max_km."""
+    if len(fc["time"]) == 0 or len(obs["time"]) == 0:
+        return np.zeros(0, dtype=np.intp), np.zeros(0, dtype=np.intp), np.zeros(0)
+    pairs = cKDTree(object_points(fc)).sparse_distance_matrix(cKDTree(object_points(obs)), chord_length(max_km),
+                                                              output_type="ndarray")
+    return pairs["i"], pairs["j"], chord_to_km(pairs["v"])
+
+
+def tally(fc_time, fc_distance, obs_time, obs_distance, n_leads, thresholds):
+    """CSI, POD and FAR from each object's distance to its nearest match."""
+    thr = np.asarray(thresholds, dtype=np.float64)
+    n_fc = np.bincount(fc_time, minlength=n_leads)[:n_leads, None].astype(np.float64)
+    n_obs = np.bincount(obs_time, minlength=n_leads)[:n_leads, None].astype(np.float64)
+    fc_hits = np.zeros((n_leads, len(thr)))
+    obs_hits = np.zeros((n_leads, len(thr)))
+    np.add.at(fc_hits, fc_time, fc_distance[:, None] <= thr)
+    np.add.at(obs_hits, obs_time, obs_distance[:, None] <= thr)
+    false_alarms = n_fc - fc_hits
+    with np.errstate(invalid="ignore", divide="ignore"):
+        return {
+            "CSI": obs_hits / (n_obs + false_alarms),
+            "POD": obs_hits / n_obs,
+            "FAR": false_alarms / n_fc,
+        }
+
+
+def case_scores(fc, obs, n_leads=N_LEADS, thresholds=THRESHOLDS):
+    """CSI, POD and FAR of one init date for every lead step and threshold.
+
+    Returns {metric: (n_leads, n_thresholds) array}, NaN where undefined.
+    """
+    max_km = max(thresholds)
+    return tally(fc["time"], nearest_distances(fc, obs, max_km), obs["time"], nearest_distances(obs, fc, max_km),
+                 n_leads, thresholds)
+
+
+def filtered_scores(fc, obs, fc_filters, obs_filters, n_leads=N_LEADS, thresholds=THRESHOLDS):
+    """case_scores of every {name: boolean selection} applied to both sides, from one pair search."""
+    i, j, km = object_pairs(fc, obs, max(thresholds))
+    scores = {}
+    for name, fc_keep in fc_filters.items():
+        obs_keep = obs_filters[name]
+        pair = fc_keep[i] & obs_keep[j]
+        fc_distance = np.full(len(fc_keep), np.inf)
+        obs_distance = np.full(len(obs_keep), np.inf)
+        np.minimum.at(fc_distance, i[pair], km[pair])
+        np.minimum.at(obs_distance, j[pair], km[pair])
+        scores[name] = tally(fc["time"][fc_keep], fc_distance[fc_keep], obs["time"][obs_keep],
+                             obs_distance[obs_keep], n_leads, thresholds)
+    return scores
+
+
+def variant_filters(table, bounds=USWC_BOUNDS):
+    """{fig_3 suffix: boolean selection} for a table read with the landfall coast."""
+    uswc = in_bounds(table, bounds)
+    landfalling = table["landfalling"]
+    return {"": np.ones(len(uswc), dtype=bool), "_USWC": uswc, "_landfalling": landfalling,
+            "_USWC_landfalling": uswc & landfalling}
+
+
+def read_objects(path, n_leads=N_LEADS, coast=None):
+    """Object table of one mask file; coast names a landfall coast for the "landfalling" column."""
+    with xr.open_dataset(path) as ds:
+        masks = ds["class_masks"].isel(time=slice(0, n_leads))
+        lats, lons = masks["lat"].values, masks["lon"].values
+        index = coast_index(coast, lats, lons) if coast else None
+        return object_table(ar_mask(masks.values), lats, lons, index)
+
+
+def stored_objects(date, model, objects_dir, n_leads=N_LEADS, coast=None):
+    """(found, table) from the object store of model; found is False if the store does not cover date."""
+    store = open_objects(objects_dir, model)
+    if store is None or date not in store.dates or (coast and coast != store.coast):
+        return False, None
+    return True, store.case(date, n_leads, coast)
+
+
+def date_objects(date, model, bounds=USWC_BOUNDS, archive_dir=ARCHIVE_DIR, n_leads=N_LEADS, coast=None,
+                 objects_dir=None):
+    """Object table of one init date and model, cut to bounds; None if the mask file is missing.
+
+    With objects_dir, the table is read from the model's object store when it covers the date.
+    """
+    found, table = stored_objects(date, model, objects_dir, n_leads, coast) if objects_dir else (False, None)
+    if not found:
+        try:
+            table = read_objects(mask_path(date, model, archive_dir), n_leads, coast)
+        except FileNotFoundError:
+            return None
+    if table is None:
+        return None
+    return table if bounds is None else subset_objects(table, in_bounds(table, bounds))
+
+
+def contingency_scores(dates, model, bounds=USWC_BOUNDS, thresholds=THRESHOLDS, archive_dir=ARCHIVE_DIR,
+                       n_leads=N_LEADS, objects_dir=None):
+    """Per-date scores of one model: {metric: (case, lead, threshold) array}.
+
+    bounds restricts both forecast and ERA5 objects to those with a centroid in
+    the box (None keeps every object).
+    """
+    scores = {metric: np.full((len(dates), n_leads, len(thresholds)), np.nan) for metric in METRICS}
+    for case, date in enumerate(dates):
+        fc = date_objects(date, model, bounds, archive_dir, n_leads, objects_dir=objects_dir)
+        obs = date_objects(date, TRUTH, bounds, archive_dir, n_leads, objects_dir=objects_dir) \
+            if fc is not None else None
+        if fc is None or obs is None:
+            print(f"Warning: missing AR masks for {model} or {TRUTH} initialized {date}. Skipping the case.")
+            continue
+        for metric, values in case_scores(fc, obs, n_leads, thresholds).items():
+            scores[metric][case] = values
+    return scores
+
+
+def shared_pass_scores(dates, model, names, filters, thresholds=THRESHOLDS, archive_dir=ARCHIVE_DIR,
+                       n_leads=N_LEADS, coast=None, objects_dir=None):
+    """Per-date scores of one model under several object filters, in one pass over the dates.
+
+    filters(table) returns {name: boolean selection} for every name in names.
+    Returns {name: {metric: (case, lead, threshold) array}}; cases with missing
+    masks stay NaN, as in contingency_scores.
+    """
+    scores = {name: {metric: np.full((len(dates), n_leads, len(thresholds)), np.nan) for metric in METRICS}
+              for name in names}
+    for case, date in enumerate(dates):
+        fc = date_objects(date, model, None, archive_dir, n_leads, coast, objects_dir)
+        obs = date_objects(date, TRUTH, None, archive_dir, n_leads, coast, objects_dir) if fc is not None else None
+        if fc is None or obs is None:
+            print(f"Warning: missing AR masks for {model} or {TRUTH} initialized {date}. Skipping the case.")
+            continue
+        for name, values in filtered_scores(fc, obs, filters(fc), filters(obs), n_leads, thresholds).items():
+            for metric in METRICS:
+                scores[name][metric][case] = values[metric]
+    return scores
+
+
+def variant_scores(dates, model, thresholds=THRESHOLDS, archive_dir=ARCHIVE_DIR, n_leads=N_LEADS,
+                   bounds=USWC_BOUNDS, coast=LANDFALL_COAST, objects_dir=None):
+    """Per-date scores of every fig_3 variant: {suffix: {metric: (case, lead, threshold) array}}."""
+    return shared_pass_scores(dates, model, VARIANTS, lambda table: variant_filters(table, bounds), thresholds,
+                              archive_dir, n_leads, coast, objects_dir)
+
+
+def region_scores(dates, model, regions, thresholds=THRESHOLDS, archive_dir=ARCHIVE_DIR, n_leads=N_LEADS,
+                  objects_dir=None):
+    """Per-date scores of one model in several regions: {region: {metric: (case, lead, threshold) array}}."""
+    return shared_pass_scores(dates, model, regions, lambda table: {region: objects_in_region(table, region)
+                                                                    for region in regions},
+                              thresholds, archive_dir, n_leads, objects_dir=objects_dir)
+
+
+def metrics_dataset(scores, dates, model, bounds=USWC_BOUNDS, thresholds=THRESHOLDS, per_case=False):
+    """The fig_3 Dataset: case means of every metric at lead steps 1 .. n_leads-1.
+
+    With per_case, the per-date values are kept as ``{metric}_{threshold}_cases``
+    (dates x time), which fig3.py can bootstrap.
+    """
+    n_leads = next(iter(scores.values())).shape[1]
+    leads = np.arange(1, n_leads)
+    ds = xr.Dataset(coords={"time": leads})
+    for metric in METRICS:
+        for k, thr in enumerate(thresholds):
+            values = scores[metric][:, 1:, k]
+            with warnings.catch_warnings():
+                warnings.simplefilter("ignore", RuntimeWarning)  # leads where no date has a defined score
+                mean = np.nanmean(values, axis=0)
+                std = np.nanstd(values, axis=0)
+            ds[f"{metric}_{thr}"] = ("time", mean, {"std": std, "count": np.sum(~np.isnan(values), axis=0)})
+            if per_case:
+                ds[f"{metric}_{thr}_cases"] = (("dates", "time"), values)
+    ds.attrs["model_name"] = model
+    ds.attrs["dates"] = list(dates)
+    if bounds is not None:
+        ds.attrs["min_lon, max_lon, min_lat, max_lat"] = np.asarray(bounds)
+    return ds
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Compute fig_3 CSI/POD/FAR files from the AR masks.")
+    parser.add_argument("start", help="first init date, YYYYMMDD")
+    parser.add_argument("end", help="last init date, YYYYMMDD")
+    parser.add_argument("--models", nargs="+", required=True)
+    parser.add_argument("--thresholds", nargs="+", type=int, default=list(THRESHOLDS))
+    parser.add_argument("--all-regions", action="store_true", help="keep every object instead of the USWC box")
+    parser.add_argument("--variants", action="store_true",
+                        help="write the all / _USWC / _landfalling / _USWC_landfalling files in one pass")
+    parser.add_argument("--regions", nargs="+", help="named regions (arverify/regions.py) scored in one pass")
+    parser.add_argument("--region-file", help="JSON file of extra regions")
+    parser.add_argument("--per-case", action="store_true", help="also store the per-date scores")
+    parser.add_argument("--archive-dir", default=ARCHIVE_DIR)
+    parser.add_argument("--objects-dir", help="read the object tables of arverify/objects.py from here")
+    parser.add_argument("--out-dir", default="./data/fig_3")
+    args = parser.parse_args(argv)
+
+    bounds = None if args.all_regions else USWC_BOUNDS
+    suffix = "" if args.all_regions else "_USWC"
+    dates = date_range(args.start, args.end)
+    os.makedirs(args.out_dir, exist_ok=True)
+    if args.region_file:
+        load_region_file(args.region_file)
+    if args.variants:
+        for model in args.models:
+            for variant, scores in variant_scores(dates, model, args.thresholds, args.archive_dir,
+                                                     objects_dir=args.objects_dir).items():
+                ds = metrics_dataset(scores, dates, model, USWC_BOUNDS if "_USWC" in variant else None,
+                                     args.thresholds, args.per_case)
+                ds.to_netcdf(os.path.join(args.out_dir, f"{model}_metrics{variant}.nc"))
+        return
+    if args.regions:
+        for model in args.models:
+            for region, scores in region_scores(dates, model, args.regions, args.thresholds, args.archive_dir,
+                                                  objects_dir=args.objects_dir).items():
+                ds = metrics_dataset(scores, dates, model, region_bbox(region), args.thresholds, args.per_case)
+                ds.attrs["region"] = region
+                ds.to_netcdf(os.path.join(args.out_dir, f"{model}_metrics_{region}.nc"))
+        return
+    for model in args.models:
+        scores = contingency_scores(dates, model, bounds, args.thresholds, args.archive_dir,
+                                    objects_dir=args.objects_dir)
+        ds = metrics_dataset(scores, dates, model, bounds, args.thresholds, args.per_case)
+        ds.to_netcdf(os.path.join(args.out_dir, f"{model}_metrics{suffix}.nc"))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,178 @@
+"""One on-disk (variable, model, case, lead) cube for the fig_1 lead-time metrics.
+
+The six fig_1 pickles each hold {model: (case x lead) array} and have to be
+unpickled in full. A cube directory holds the same numbers in a single
+``values.npy`` laid out variable-major, so every (variable, model) slab is one
+contiguous block, plus an ``index.json`` naming the axes:
+
+    metrics_cube/
+        index.json   {"variables": [...], "models": [...], "present": [[var, model], ...],
+                      "dates": [init date of each case], ...}
+        values.npy   float64, shape (variable, model, case, lead)
+
+The dates are optional (cubes packed from undated pickles have none); with
+them, arverify/cases.py can cut the case axis by date range, season or event.
+
+``open_cube`` checks both files against the declared layout (arverify/schema.py)
+and memory-maps ``values.npy``, handing out views, so only the pages that are
+actually indexed are read. ``MetricCube.variable`` returns a read-only
+mapping that behaves like the old pickle dict, i.e. ``PICKLE_DATA[model_key]``
+and ``model_key in PICKLE_DATA`` keep working in fig1.py.
+
+Build one from the existing pickles with
+
+    python -m arverify.cube ./data/fig_1 ./data/fig_1/metrics_cube
+
+The writers of the fig_1 pickles (arverify/scores.py and friends) rewrite a
+``metrics_cube`` next to them, so the two cannot drift apart. fig1.py also
+checks ``is_current`` and falls back to the pickles when they are newer.
+"""
+import argparse
+import glob
+import json
+import os
+import pickle
+from collections.abc import Mapping
+
+import numpy as np
+
+from arverify.cases import DATES_FILE, read_dates
+from arverify.moments import newest_mtime
+from arverify.schema import CUBE, INDEX_FILE, SchemaError, open_store, stamp
+
+VALUES_FILE = "values.npy"
+CUBE_NAME = "metrics_cube"
+
+
+def write_cube(path, metrics, dtype=np.float64, dates=None):
+    """Write {variable: {model: (case x lead) array}} to a cube directory.
+
+    Variables or models with fewer cases than the largest entry are padded
+    with NaN, which the nan-statistics in fig1.py already ignore. dates, if
+    given, are the init dates of the cases and must cover every row.
+    """
+    variables = list(metrics)
+    models = []
+    for per_model in metrics.values():
+        models += [model for model in per_model if model not in models]
+    arrays = [np.asarray(arr) for per_model in metrics.values() for arr in per_model.values()]
+    if not arrays:
+        raise ValueError("No metric arrays to write.")
+    n_cases = max(arr.shape[0] for arr in arrays)
+    n_leads = max(arr.shape[1] for arr in arrays)
+    if dates is not None and len(dates) != n_cases:
+        raise ValueError(f"{len(dates)} dates for {n_cases} cases.")
+
+    os.makedirs(path, exist_ok=True)
+    values = np.lib.format.open_memmap(os.path.join(path, VALUES_FILE), mode="w+", dtype=dtype,
+                                       shape=(len(variables), len(models), n_cases, n_leads))
+    values[:] = np.nan
+    present = []
+    for v, var in enumerate(variables):
+        for model, arr in metrics[var].items():
+            arr = np.asarray(arr)
+            values[v, models.index(model), :arr.shape[0], :arr.shape[1]] = arr
+            present.append([var, model])
+    values.flush()
+    del values
+
+    index = {"variables": variables, "models": models, "present": present,
+             "n_cases": n_cases, "n_leads": n_leads}
+    if dates is not None:
+        index["dates"] = [str(date) for date in dates]
+    with open(os.path.join(path, INDEX_FILE), "w") as f:
+        json.dump(stamp(index, CUBE), f, indent=1)
+
+
+def is_current(path, data_dir):
+    """True if no fig_1 pickle (or dates.json) in data_dir was modified after the cube at path was written."""
+    sources = glob.glob(os.path.join(data_dir, "*.pickle")) + [os.path.join(data_dir, DATES_FILE)]
+    return max((newest_mtime(name) for name in sources), default=0) <= newest_mtime(path)
+
+
+def refresh_cube(data_dir, metrics, dates=None):
+    """Rewrite the metrics_cube in data_dir, if there is one, from freshly written metrics; returns its path or None."""
+    path = os.path.join(data_dir, CUBE_NAME)
+    if not os.path.isdir(path):
+        return None
+    values_path = os.path.join(path, VALUES_FILE)
+    dtype = np.load(values_path, mmap_mode="r").dtype if os.path.exists(values_path) else np.float64
+    write_cube(path, metrics, dtype, dates)
+    return path
+
+
+def open_cube(path):
+    return MetricCube(path)
+
+
+class MetricCube:
+    """Memory-mapped view of a cube directory written by ``write_cube``."""
+
+    def __init__(self, path):
+        index, arrays = open_store(path, CUBE)
+        self.path = path
+        self.variables = index["variables"]
+        self.models = index["models"]
+        self.present = {tuple(pair) for pair in index["present"]}
+        unknown = [pair for pair in self.present if pair[0] not in self.variables or pair[1] not in self.models]
+        if unknown:
+            raise SchemaError(f"{os.path.join(path, INDEX_FILE)}: 'present' names unknown (variable, model) pairs {unknown}")
+        self.dates = index.get("dates")
+        if self.dates is not None and len(self.dates) != index["n_cases"]:
+            raise SchemaError(f"{os.path.join(path, INDEX_FILE)}: {len(self.dates)} dates for {index['n_cases']} cases")
+        self.values = arrays["values"]
+
+    def select(self, variable, model, cases=slice(None), leads=slice(None)):
+        """View of one (variable, model) slab, optionally cut to a case/lead range."""
+        if (variable, model) not in self.present:
+            raise KeyError((variable, model))
+        v = self.variables.index(variable)
+        m = self.models.index(model)
+        return self.values[v, m][cases, leads]
+
+    def variable(self, variable):
+        if variable not in self.variables:
+            raise KeyError(variable)
+        return CubeVariable(self, variable)
+
+    def __contains__(self, variable):
+        return variable in self.variables
+
+
+class CubeVariable(Mapping):
+    """Pickle-dict stand-in: maps model name to a (case x lead) memmap view."""
+
+    def __init__(self, cube, variable):
+        self.cube = cube
+        self.variable = variable
+        self._models = [model for model in cube.models if (variable, model) in cube.present]
+
+    def __getitem__(self, model):
+        return self.cube.select(self.variable, model)
+
+    def __iter__(self):
+        return iter(self._models)
+
+    def __len__(self):
+        return len(self._models)
+
+
+def load_fig1_pickles(data_dir):
+    """Read every ``*.pickle`` in a fig_1 data directory into {stem: {model: array}}."""
+    metrics = {}
+    for filename in sorted(glob.glob(os.path.join(data_dir, "*.pickle"))):
+        with open(filename, "rb") as handle:
+            metrics[os.path.basename(filename)[:-len(".pickle")]] = pickle.load(handle)
+    return metrics
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Pack the fig_1 pickles into a memory-mapped metric cube.")
+    parser.add_argument("data_dir", help="directory holding the {VAR}_RMSE.pickle / TMQ_bias.pickle files")
+    parser.add_argument("out_path", help="cube directory to create")
+    args = parser.parse_args(argv)
+    write_cube(args.out_path, load_fig1_pickles(args.data_dir), dates=read_dates(args.data_dir))
+
+
+if __name__ == "__main__":
+    main()
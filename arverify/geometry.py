@@ -0,0 +1,148 @@
+"""Ready-to-draw coastline and AR-outline paths, cached in memory and on disk.
+
+``ax.add_feature(cfeature.COASTLINE.with_scale('110m'))`` re-reads the Natural
+Earth shapefile, selects the geometries in view and projects them every time a
+panel is drawn, and ``ax.contour(..., ar_mask, levels=[0.5])`` re-traces the
+outline of a mask that is often the same from figure to figure (ERA5 in every
+batch, or a re-rendered case). Here:
+
+* ``feature_paths`` keys the projected Natural Earth paths by (feature, scale,
+  projection, extent). A batch of maps that all share the fig4 extent computes
+  them once, and later runs read them from ``./data/geometry_cache``.
+* ``contour_paths`` keys the traced contour lines by a hash of the field, its
+  coordinates and the level.
+
+``draw_feature`` and ``draw_contour`` add the cached paths as a single
+collection with the same styling, z-order and clipping as the cartopy and
+matplotlib calls they replace. Gridlines are left to cartopy, because their
+label layout depends on the renderer.
+"""
+import hashlib
+import os
+
+import cartopy.crs as ccrs
+import cartopy.feature as cfeature
+import numpy as np
+from cartopy.mpl import path as cpath
+from matplotlib.collections import PathCollection
+from matplotlib.path import Path
+
+GEOMETRY_DIR = "./data/geometry_cache"
+FEATURE_ZORDER = 1.5  # cartopy's FeatureArtist default: above filled contours, below lines
+CONTOUR_ZORDER = 2  # matplotlib's ContourSet default for line contours
+
+_memory = {}
+
+
+def cache_key(*parts):
+    digest = hashlib.sha1()
+    for part in parts:
+        if isinstance(part, np.ndarray):
+            digest.update(str(part.dtype).encode())
+            digest.update(str(part.shape).encode())
+            digest.update(np.ascontiguousarray(part).tobytes())
+        else:
+            digest.update(repr(part).encode())
+        digest.update(b"|")
+    return digest.hexdigest()[:20]
+
+
+def save_paths(path, paths):
+    """Write matplotlib Paths to an .npz file as flat vertex/code arrays with offsets."""
+    def path_codes(p):
+        if p.codes is not None:
+            return p.codes
+        codes = np.full(len(p.vertices), Path.LINETO, dtype=np.uint8)
+        codes[:1] = Path.MOVETO
+        return codes
+
+    lengths = [len(p.vertices) for p in paths]
+    vertices = np.concatenate([p.vertices for p in paths]) if paths else np.zeros((0, 2))
+    codes = np.concatenate([path_codes(p) for p in paths]) if paths else np.zeros(0, np.uint8)
+    tmp_path = f"{path[:-4]}.tmp.npz"
+    np.savez(tmp_path, vertices=vertices, codes=codes.astype(np.uint8),
+             offsets=np.concatenate([[0], np.cumsum(lengths)]).astype(np.int64))
+    os.replace(tmp_path, path)
+
+
+def load_paths(path):
+    with np.load(path, allow_pickle=False) as f:
+        vertices, codes, offsets = f["vertices"], f["codes"], f["offsets"]
+    return [Path(vertices[a:b], codes[a:b]) for a, b in zip(offsets[:-1], offsets[1:])]
+
+
+def cached_paths(kind, key, compute, cache_dir=GEOMETRY_DIR):
+    """Paths from memory, then disk, then compute() (stored in both)."""
+    if key in _memory:
+        return _memory[key]
+    path = os.path.join(cache_dir, f"{kind}_{key}.npz") if cache_dir else None
+    if path and os.path.exists(path):
+        paths = load_paths(path)
+    else:
+        paths = compute()
+        if path:
+            os.makedirs(cache_dir, exist_ok=True)
+            save_paths(path, paths)
+    _memory[key] = paths
+    return paths
+
+
+def feature_paths(name="coastline", scale="110m", projection=None, extent=None, category="physical",
+                  cache_dir=GEOMETRY_DIR):
+    """Projected paths of a Natural Earth feature within extent (lon/lat, [x0, x1, y0, y1])."""
+    projection = projection or ccrs.PlateCarree()
+    extent = None if extent is None else [round(float(v), 6) for v in extent]
+    key = cache_key(category, name, scale, projection.proj4_init, extent)
+
+    def compute():
+        feature = cfeature.NaturalEarthFeature(category, name, scale)
+        paths = []
+        for geom in feature.intersecting_geometries(extent):
+            projected = geom if projection == feature.crs else projection.project_geometry(geom, feature.crs)
+            paths.append(cpath.shapely_to_path(projected))
+        return paths
+
+    return cached_paths("feature", key, compute, cache_dir)
+
+
+def draw_feature(ax, paths, edgecolor="k", linewidth=1, **kwargs):
+    """Add feature paths to a GeoAxes the way ``ax.add_feature`` draws an unfilled feature."""
+    collection = PathCollection(paths, facecolor="none", edgecolor=edgecolor, linewidth=linewidth,
+                                transform=ax.transData, zorder=kwargs.pop("zorder", FEATURE_ZORDER), **kwargs)
+    collection.set_clip_path(ax.patch)
+    ax.add_collection(collection, autolim=False)
+    return collection
+
+
+def contour_paths(field, lats, lons, level=0.5, cache_dir=GEOMETRY_DIR):
+    """Contour lines of a (lat, lon) field at one level, in lon/lat coordinates.
+
+    Traced with contourpy using matplotlib's default algorithm and corner
+    masking, so the lines are the ones ``ax.contour`` would draw.
+    """
+    import contourpy
+    import matplotlib as mpl
+
+    field = np.asarray(field)
+    lats = np.asarray(lats, dtype=np.float64)
+    lons = np.asarray(lons, dtype=np.float64)
+    key = cache_key(field, lats, lons, float(level))
+
+    def compute():
+        generator = contourpy.contour_generator(
+            lons, lats, np.ma.masked_invalid(field.astype(np.float64)), name=mpl.rcParams["contour.algorithm"],
+            corner_mask=mpl.rcParams["contour.corner_mask"], line_type=contourpy.LineType.SeparateCode)
+        vertices, codes = generator.lines(level)
+        # One compound path per level, as in a ContourSet
+        return [Path.make_compound_path(*[Path(v, c) for v, c in zip(vertices, codes)])] if vertices else []
+
+    return cached_paths("contour", key, compute, cache_dir)
+
+
+def draw_contour(ax, paths, transform=None, colors="k", linewidths=1, linestyles="solid", **kwargs):
+    """Add contour lines (lon/lat paths) the way ``ax.contour`` draws a single level."""
+    collection = PathCollection(paths, facecolor="none", edgecolor=colors, linewidths=linewidths,
+                                linestyles=linestyles, transform=transform or ccrs.PlateCarree(),
+                                zorder=kwargs.pop("zorder", CONTOUR_ZORDER), **kwargs)
+    ax.add_collection(collection, autolim=False)
+    return collection
@@ -0,0 +1,252 @@
+"""Meridional landfall-latitude errors from the AR class masks, in the fig_2 format.
+
+fig2.py reads ``{model}_lat_landfall_error_degrees.pkl``: a list with one entry
+per lead step, each holding the landfall-latitude errors (forecast minus ERA5,
+degrees) of every AR that made landfall at that step. This module rebuilds it
+from the ``masked/{date}/{model}_processed.nc`` files:
+
+    python -m arverify.landfall 20231101 20240331 --models tigge graphcast37 --out-dir ./data/fig_2
+
+Each named coast is reduced once per grid to a list of coastline cells ordered
+by latitude (the westernmost land cell with ocean to its west, per latitude row)
+and cached under ``./data/coast_index``. Only the coastline cells of each mask
+file are read. A landfall is a contiguous run of AR-covered coastline cells,
+located at the mean latitude of the run; runs are found for all lead steps at
+once with a cumulative sum over the (time, coast cell) hit matrix. Each forecast
+landfall is paired with the nearest ERA5 landfall at the same lead step; forecast
+landfalls with no ERA5 landfall at that step are not counted.
+
+With ``--objects-dir``, the errors come from the object stores of
+arverify/objects.py instead: each landfalling forecast AR object is paired with
+the nearest landfalling ERA5 object, and no mask file is opened.
+"""
+import argparse
+import hashlib
+import os
+import pickle
+
+import numpy as np
+import xarray as xr
+
+from arverify.scores import ARCHIVE_DIR, N_LEADS, TRUTH, date_range
+
+AR_CLASS = 2  # ClimateNet class_masks labels: 0 background, 1 tropical cyclone, 2 atmospheric river
+COAST_INDEX_DIR = "./data/coast_index"
+
+# min_lon, max_lon, min_lat, max_lat of the stretch of coast to search
+COASTS = {
+    "USWC": (230.0, 245.0, 32.5, 49.0),
+    "California": (230.0, 245.0, 32.5, 42.0),
+    "Pacific Northwest": (230.0, 245.0, 42.0, 49.0),
+    "British Columbia": (220.0, 240.0, 49.0, 55.0),
+}
+
+
+def mask_path(date, model, archive_dir=ARCHIVE_DIR):
+    return os.path.join(archive_dir, "masked", date, f"{model}_processed.nc")
+
+
+def ar_mask(class_masks):
+    return np.asarray(class_masks) == AR_CLASS
+
+
+def natural_earth_land(lats, lons, scale="50m"):
+    """Boolean (lat, lon) land mask rasterized from the Natural Earth land polygons."""
+    import shapely
+    from cartopy.io import shapereader
+
+    land = shapely.union_all(list(shapereader.Reader(
+        shapereader.natural_earth(resolution=scale, category="physical", name="land")).geometries()))
+    lon2d, lat2d = np.meshgrid((np.asarray(lons) + 180) % 360 - 180, lats)
+    return shapely.contains_xy(land, lon2d, lat2d)
+
+
+class CoastIndex:
+    """Coastline cells of one named coast on one grid, ordered by latitude."""
+
+    def __init__(self, lat_idx, lon_idx, lats):
+        self.lat_idx = np.asarray(lat_idx)
+        self.lon_idx = np.asarray(lon_idx)
+        self.lats = np.asarray(lats, dtype=np.float64)
+
+    def __len__(self):
+        return len(self.lat_idx)
+
+
+def west_coast_cells(land, lats, lons, bounds):
+    """Per latitude row in bounds, the westernmost land cell that has ocean to its west.
+
+    land is a boolean (lat, lon) mask on the (lats, lons) grid. Returns a CoastIndex.
+    """
+    min_lon, max_lon, min_lat, max_lat = bounds
+    lats = np.asarray(lats)
+    lon360 = np.asarray(lons) % 360
+    rows = np.flatnonzero((lats >= min_lat) & (lats <= max_lat))
+    cols = np.flatnonzero((lon360 >= min_lon) & (lon360 <= max_lon))
+    cols = cols[np.argsort(lon360[cols])]
+    window = np.asarray(land)[np.ix_(rows, cols)]
+    first = window.argmax(axis=1)
+    # Rows whose first land cell sits on the window edge have no ocean in view
+    keep = window.any(axis=1) & (first > 0)
+    lat_idx = rows[keep]
+    lon_idx = cols[first[keep]]
+    order = np.argsort(lats[lat_idx])
+    return CoastIndex(lat_idx[order], lon_idx[order], lats[lat_idx[order]])
+
+
+def grid_key(lats, lons):
+    digest = hashlib.sha1()
+    for coord in (lats, lons):
+        digest.update(np.ascontiguousarray(coord, dtype=np.float64).tobytes())
+    return digest.hexdigest()[:16]
+
+
+def coast_index(coast, lats, lons, land=natural_earth_land, cache_dir=COAST_INDEX_DIR):
+    """Cached CoastIndex for a named coast on the (lats, lons) grid.
+
+    land(lats, lons) returns a boolean (lat, lon) land mask and is only called on
+    a cache miss; the default rasterizes the Natural Earth land polygons.
+    """
+    bounds = COASTS[coast]
+    path = os.path.join(cache_dir, f"{coast.replace(' ', '_')}_{grid_key(lats, lons)}.npz")
+    if os.path.exists(path):
+        with np.load(path) as f:
+            return CoastIndex(f["lat_idx"], f["lon_idx"], f["lats"])
+    index = west_coast_cells(land(lats, lons), lats, lons, bounds)
+    os.makedirs(cache_dir, exist_ok=True)
+    np.savez(path, lat_idx=index.lat_idx, lon_idx=index.lon_idx, lats=index.lats)
+    return index
+
+
+def coast_hits(class_masks, index):
+    """(time, coast cell) boolean matrix of AR cover, reading only the coast's bounding block."""
+    lat_block = slice(index.lat_idx.min(), index.lat_idx.max() + 1)
+    lon_block = slice(index.lon_idx.min(), index.lon_idx.max() + 1)
+    block = class_masks.isel(lat=lat_block, lon=lon_block).values
+    return ar_mask(block[:, index.lat_idx - lat_block.start, index.lon_idx - lon_block.start])
+
+
+def landfall_segments(hits, coast_lats):
+    """Contiguous runs of AR-covered coastline cells.
+
+    hits is (time, coast cell) with cells ordered along the coast. Returns the time
+    index and mean latitude of every run, ordered by time.
+    """
+    previous = np.zeros_like(hits)
+    previous[:, 1:] = hits[:, :-1]
+    starts = hits & ~previous
+    labels = np.cumsum(starts.ravel()) * hits.ravel()  # 0 marks cells without AR cover
+    n_runs = int(labels.max()) if labels.size else 0
+    cells = np.bincount(labels, minlength=n_runs + 1)[1:]
+    lat_sum = np.bincount(labels, weights=np.broadcast_to(coast_lats, hits.shape).ravel(),
+                          minlength=n_runs + 1)[1:]
+    return np.nonzero(starts)[0], lat_sum / np.maximum(cells, 1)
+
+
+def match_landfalls(fc_time, fc_lat, obs_time, obs_lat):
+    """Error of each forecast landfall against the nearest observed one at the same time step.
+
+    Returns (time, forecast minus observed latitude) for the forecast landfalls
+    that have an observed landfall at their time step.
+    """
+    if len(obs_time) == 0 or len(fc_time) == 0:
+        return np.zeros(0, dtype=int), np.zeros(0)
+    # Latitudes span less than 1000 degrees, so the key sorts by time, then latitude
+    obs_key = obs_time * 1000.0 + obs_lat
+    order = np.argsort(obs_key)
+    obs_key, obs_time, obs_lat = obs_key[order], obs_time[order], obs_lat[order]
+    pos = np.searchsorted(obs_key, fc_time * 1000.0 + fc_lat)
+    best = np.full(len(fc_time), np.inf)
+    nearest = np.zeros(len(fc_time))
+    for cand in (np.clip(pos - 1, 0, len(obs_key) - 1), np.clip(pos, 0, len(obs_key) - 1)):
+        dist = np.where(obs_time[cand] == fc_time, np.abs(obs_lat[cand] - fc_lat), np.inf)
+        closer = dist < best
+        best[closer] = dist[closer]
+        nearest[closer] = obs_lat[cand][closer]
+    keep = np.isfinite(best)
+    return fc_time[keep], fc_lat[keep] - nearest[keep]
+
+
+def landfall_errors(dates, model, coast="USWC", archive_dir=ARCHIVE_DIR, n_leads=N_LEADS,
+                    land=natural_earth_land, cache_dir=COAST_INDEX_DIR):
+    """Landfall-latitude errors of one model for every lead step, in one pass over the dates.
+
+    Only one init date's coastline cells are in memory at a time. Returns
+    (errors, cases): two lists of n_leads arrays holding the errors and the
+    index into dates of the case each error came from.
+    """
+    errors = [[] for _ in range(n_leads)]
+    cases = [[] for _ in range(n_leads)]
+    indexes = {}
+
+    def hits_for(path):
+        with xr.open_dataset(path) as ds:
+            masks = ds["class_masks"]
+            key = grid_key(masks["lat"].values, masks["lon"].values)
+            if key not in indexes:
+                indexes[key] = coast_index(coast, masks["lat"].values, masks["lon"].values, land, cache_dir)
+            index = indexes[key]
+            return coast_hits(masks.isel(time=slice(0, n_leads)), index), index.lats
+
+    for case, date in enumerate(dates):
+        try:
+            fc_hits, fc_lats = hits_for(mask_path(date, model, archive_dir))
+            obs_hits, obs_lats = hits_for(mask_path(date, TRUTH, archive_dir))
+        except FileNotFoundError:
+            print(f"Warning: missing AR masks for {model} or {TRUTH} initialized {date}. Skipping the case.")
+            continue
+        n = min(len(fc_hits), len(obs_hits))
+        lead, err = match_landfalls(*landfall_segments(fc_hits[:n], fc_lats),
+                                    *landfall_segments(obs_hits[:n], obs_lats))
+        bounds = np.searchsorted(lead, np.arange(n + 1))
+        for t in range(n):
+            errors[t].append(err[bounds[t]:bounds[t + 1]])
+            cases[t].append(np.full(bounds[t + 1] - bounds[t], case))
+
+    def join(parts, dtype):
+        return np.concatenate(parts).astype(dtype) if parts else np.zeros(0, dtype=dtype)
+
+    return ([join(parts, np.float64) for parts in errors], [join(parts, np.int64) for parts in cases])
+
+
+def write_landfall_pickle(errors, path):
+    """Write per-lead errors as the list of lists fig2.py loads."""
+    with open(path, "wb") as f:
+        pickle.dump([list(err) for err in errors], f)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Compute fig_2 landfall-latitude errors from the AR masks.")
+    parser.add_argument("start", help="first init date, YYYYMMDD")
+    parser.add_argument("end", help="last init date, YYYYMMDD")
+    parser.add_argument("--models", nargs="+", required=True)
+    parser.add_argument("--coast", default="USWC", choices=sorted(COASTS))
+    parser.add_argument("--archive-dir", default=ARCHIVE_DIR)
+    parser.add_argument("--objects-dir", help="take the landfalls from the object stores of arverify/objects.py")
+    parser.add_argument("--out-dir", default="./data/fig_2")
+    parser.add_argument("--ragged", action="store_true",
+                        help="also write a ragged store with case ids next to each pickle (see arverify/ragged.py)")
+    args = parser.parse_args(argv)
+
+    os.makedirs(args.out_dir, exist_ok=True)
+    dates = date_range(args.start, args.end)
+    for model in args.models:
+        if args.objects_dir:
+            from arverify.objects import landfall_errors as object_landfall_errors, open_objects
+            fc_store, obs_store = open_objects(args.objects_dir, model), open_objects(args.objects_dir, TRUTH)
+            if fc_store is None or obs_store is None:
+                raise SystemExit(f"No object store for {model} or {TRUTH} under {args.objects_dir}.")
+            if fc_store.coast != args.coast or obs_store.coast != args.coast:
+                raise SystemExit(f"The object stores under {args.objects_dir} were built for another coast.")
+            errors, cases = object_landfall_errors(dates, fc_store, obs_store)
+        else:
+            errors, cases = landfall_errors(dates, model, args.coast, args.archive_dir)
+        write_landfall_pickle(errors, os.path.join(args.out_dir, f"{model}_lat_landfall_error_degrees.pkl"))
+        if args.ragged:
+            from arverify.ragged import RaggedLeads
+            RaggedLeads.from_lists(errors, cases, dates).write(
+                os.path.join(args.out_dir, f"{model}_lat_landfall_error_degrees"))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,65 @@
+"""Concurrent opening of per-model files and stacking along a ``model`` dimension.
+
+fig3.py and fig4_models.py open one file per model in turn. ``open_datasets``
+opens them on a thread pool (netCDF header reads are I/O bound, so threads
+overlap the waits), and ``open_models`` additionally concatenates them along a
+new ``model`` dimension, aligned on the shared coordinates (``time``, ``dates``),
+so a statistic can be computed for every model with one expression:
+
+    metrics = open_models({"HRES": "./data/fig_3/tigge_metrics_USWC.nc", ...})
+    sem = metrics["CSI_1000_std"] / np.sqrt(metrics["CSI_1000_count"])
+
+Per-variable ``std`` / ``count`` attributes and the ``dates`` dataset attribute
+of the fig_3 files would otherwise be lost in the concatenation, so they are
+turned into ``{var}_std`` / ``{var}_count`` variables and a ``dates`` coordinate
+first. With dask installed, files are opened with dask chunks and the result
+stays lazy until values are used.
+"""
+import importlib.util
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pandas as pd
+import xarray as xr
+
+from arverify.cases import parse_dates
+
+
+def _default_open_kwargs():
+    return {"chunks": {}} if importlib.util.find_spec("dask") else {}
+
+
+def open_datasets(paths, max_workers=8, **open_kwargs):
+    """Open {key: path} concurrently; returns {key: Dataset} in the same order."""
+    kwargs = {**_default_open_kwargs(), **open_kwargs}
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        futures = {key: pool.submit(xr.open_dataset, path, **kwargs) for key, path in paths.items()}
+        return {key: future.result() for key, future in futures.items()}
+
+
+def attrs_to_variables(ds):
+    """Move fig_3 style ``std`` / ``count`` attrs and the ``dates`` attr into the data."""
+    ds = ds.copy()
+    for name in list(ds.data_vars):
+        attrs = dict(ds[name].attrs)
+        for stat in ("std", "count"):
+            if stat in attrs and np.shape(attrs[stat]) == ds[name].shape:
+                ds[f"{name}_{stat}"] = (ds[name].dims, np.asarray(attrs.pop(stat)))
+        ds[name].attrs = attrs
+    if "dates" in ds.attrs:
+        dates = parse_dates(ds.attrs.pop("dates"))  # a list, or its string repr in older files
+        if ds.sizes.get("dates") == len(dates):
+            ds = ds.assign_coords(dates=dates)
+    return ds
+
+
+def combine_models(datasets, join="outer"):
+    """Concatenate {model: Dataset} along a new ``model`` dimension."""
+    prepared = [attrs_to_variables(ds) for ds in datasets.values()]
+    return xr.concat(prepared, dim=pd.Index(list(datasets), name="model", dtype=object), join=join,
+                     combine_attrs="drop_conflicts", coords="minimal", compat="override")
+
+
+def open_models(paths, max_workers=8, join="outer", **open_kwargs):
+    """Open {model: path} concurrently and combine them along ``model``."""
+    return combine_models(open_datasets(paths, max_workers, **open_kwargs), join=join)
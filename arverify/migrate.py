@@ -0,0 +1,157 @@
+"""One-shot conversion of the fig_1 and fig_2 pickles to the checked array stores.
+
+    python -m arverify.migrate ./data            # convert, then verify against the pickles
+    python -m arverify.migrate ./data --check    # only validate the stores already there
+    python -m arverify.migrate ./data --dates 20231101 20240331   # record the fig_1 init dates too
+
+Converted stores:
+
+* ``fig_1/*.pickle`` become ``fig_1/metrics_cube`` (arverify/cube.py), which
+  fig1.py reads instead of the pickles when it is present. The init dates
+  from ``fig_1/dates.json`` go into its index. The fig_1 pickles predate that
+  file, so ``--dates`` writes it from the first and last init date of the rows.
+* Each ``fig_2/{model}_lat_landfall_error_degrees.pkl`` becomes the ragged store
+  ``fig_2/{model}_lat_landfall_error_degrees/`` (arverify/ragged.py), which
+  fig2.py prefers in the same way.
+
+Each store is written to a temporary directory next to its final location.
+It is then re-opened through its schema (arverify/schema.py) and compared
+value for value with the pickle it came from. Only then is it moved into
+place, so a failed or interrupted run leaves the previous state. Existing
+stores are kept unless ``--force`` is given. The pickles are not deleted. Once
+the stores are verified, they can be removed by hand.
+
+The conversion unpickles the originals once, so run it only on files you trust.
+"""
+import argparse
+import glob
+import os
+import shutil
+
+import numpy as np
+
+from arverify.cases import DATES_FILE, read_dates, write_dates
+from arverify.cube import CUBE_NAME, load_fig1_pickles, open_cube, write_cube
+from arverify.ragged import RaggedLeads, load_landfall_errors
+from arverify.schema import SchemaError
+
+FIG2_SUFFIX = "_lat_landfall_error_degrees.pkl"
+
+
+def same_values(a, b):
+    a = np.asarray(a, dtype=np.float64)
+    b = np.asarray(b, dtype=np.float64)
+    return a.shape == b.shape and np.array_equal(a, b, equal_nan=True)
+
+
+def replace_dir(tmp_path, path):
+    if os.path.exists(path):
+        shutil.rmtree(path)
+    os.replace(tmp_path, path)
+
+
+def migrate_fig1(data_dir, force=False):
+    """Write fig_1/metrics_cube from the fig_1 pickles; returns the store path, or None if skipped."""
+    fig1_dir = os.path.join(data_dir, "fig_1")
+    path = os.path.join(fig1_dir, CUBE_NAME)
+    metrics = load_fig1_pickles(fig1_dir)
+    if not metrics or (os.path.exists(path) and not force):
+        return None
+    tmp_path = f"{path}.tmp"
+    shutil.rmtree(tmp_path, ignore_errors=True)
+    write_cube(tmp_path, metrics, dates=read_dates(fig1_dir))
+    cube = open_cube(tmp_path)
+    for var, per_model in metrics.items():
+        for model, values in per_model.items():
+            values = np.asarray(values)
+            stored = cube.select(var, model)[:values.shape[0], :values.shape[1]]
+            if not same_values(stored, values):
+                raise SchemaError(f"{tmp_path}: {var}/{model} does not match its pickle")
+    del cube
+    replace_dir(tmp_path, path)
+    return path
+
+
+def stamp_fig1_dates(data_dir, start, end, force=False):
+    """Write fig_1/dates.json for daily init dates start..end; returns its path, or None if it exists."""
+    from arverify.scores import date_range
+
+    fig1_dir = os.path.join(data_dir, "fig_1")
+    path = os.path.join(fig1_dir, DATES_FILE)
+    if os.path.exists(path) and not force:
+        return None
+    dates = date_range(start, end)
+    n_cases = {np.shape(values)[0] for per_model in load_fig1_pickles(fig1_dir).values()
+               for values in per_model.values()}
+    if n_cases and max(n_cases) != len(dates):
+        raise ValueError(f"{start}-{end} is {len(dates)} init dates, but the fig_1 pickles hold "
+                         f"{max(n_cases)} cases.")
+    write_dates(fig1_dir, dates)
+    return path
+
+
+def migrate_fig2(data_dir, force=False):
+    """Write a ragged store next to every fig_2 pickle; returns the store paths written."""
+    written = []
+    for filename in sorted(glob.glob(os.path.join(data_dir, "fig_2", f"*{FIG2_SUFFIX}"))):
+        path = filename[:-len(".pkl")]
+        if os.path.exists(path) and not force:
+            continue
+        leads = load_landfall_errors(filename)
+        tmp_path = f"{path}.tmp"
+        shutil.rmtree(tmp_path, ignore_errors=True)
+        leads.write(tmp_path)
+        stored = RaggedLeads.open(tmp_path)
+        if not (same_values(stored.offsets, leads.offsets) and same_values(stored.values, leads.values)):
+            raise SchemaError(f"{tmp_path}: does not match {filename}")
+        del stored
+        replace_dir(tmp_path, path)
+        written.append(path)
+    return written
+
+
+def check_stores(data_dir):
+    """Open every store under data_dir through its schema; returns [(path, error or None)]."""
+    results = []
+    stores = [(os.path.join(data_dir, "fig_1", CUBE_NAME), open_cube)]
+    stores += [(filename[:-len(".pkl")], RaggedLeads.open)
+               for filename in sorted(glob.glob(os.path.join(data_dir, "fig_2", f"*{FIG2_SUFFIX}")))]
+    for path, open_store in stores:
+        if not os.path.isdir(path):
+            continue
+        try:
+            open_store(path)
+            results.append((path, None))
+        except SchemaError as err:
+            results.append((path, str(err)))
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Convert the fig_1 / fig_2 pickles to schema-checked array stores.")
+    parser.add_argument("data_dir", nargs="?", default="./data")
+    parser.add_argument("--check", action="store_true", help="only validate existing stores")
+    parser.add_argument("--force", action="store_true", help="rewrite stores that already exist")
+    parser.add_argument("--dates", nargs=2, metavar=("START", "END"),
+                        help="first and last init date (YYYYMMDD) of the fig_1 cases, for fig_1/dates.json")
+    args = parser.parse_args(argv)
+
+    if not args.check:
+        if args.dates:
+            path = stamp_fig1_dates(args.data_dir, *args.dates, force=args.force)
+            print(f"fig_1 dates: {'wrote ' + path if path else 'skipped (dates.json exists)'}")
+        path = migrate_fig1(args.data_dir, args.force)
+        print(f"fig_1: {'wrote ' + path if path else 'skipped (store exists or no pickles)'}")
+        paths = migrate_fig2(args.data_dir, args.force)
+        print(f"fig_2: wrote {len(paths)} store(s)")
+
+    failed = 0
+    for path, error in check_stores(args.data_dir):
+        print(f"{'ok' if error is None else 'INVALID'}  {path}" + (f": {error}" if error else ""))
+        failed += error is not None
+    if failed:
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
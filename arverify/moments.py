@@ -0,0 +1,249 @@
+"""Running count / mean / M2 aggregates of the fig_1 metrics.
+
+fig1.py only needs, per (variable, model, lead), the mean over cases and the
+standard error. Both follow from the non-NaN count, the mean and M2 (the sum
+of squared deviations from the mean), and those three combine exactly across
+disjoint sets of cases (Chan et al. parallel update). A ``MomentStore`` keeps
+them on disk so a new day of cases, or a partial store built on another node,
+is folded in without touching the cases already counted:
+
+    python -m arverify.moments build ./data/fig_1/moments.npz ./data/fig_1
+    python -m arverify.moments update ./data/fig_1/moments.npz ./new_cases/fig_1
+    python -m arverify.moments merge ./data/fig_1/moments.npz node_a.npz node_b.npz
+
+Sources are fig_1 pickle directories or metric cube directories (see
+arverify/cube.py).
+
+The moments of a set of cases cannot be taken apart again, so the store
+records the init dates it has absorbed per (variable, model). ``update``
+skips dates already counted, and ``merge`` refuses stores that overlap. A
+source without dates (no ``dates.json`` or cube dates) can only start a
+(variable, model), not extend one.
+
+The store also records the newest modification time of its sources.
+fig1.py ignores it, with a warning, once the pickles or cube it would stand in
+for are newer.
+"""
+import argparse
+import glob
+import os
+
+import numpy as np
+
+
+def case_moments(data):
+    """(count, mean, M2) over the case axis (axis 0), ignoring NaN.
+
+    Where the count is zero the mean and M2 are stored as 0 so they merge cleanly.
+    """
+    data = np.asarray(data, dtype=np.float64)
+    valid = ~np.isnan(data)
+    count = valid.sum(axis=0)
+    safe = np.maximum(count, 1)
+    mean = np.where(valid, data, 0.0).sum(axis=0) / safe
+    m2 = (np.where(valid, data - mean, 0.0) ** 2).sum(axis=0)
+    return count, mean, m2
+
+
+def merge_moments(a, b):
+    """Combine two (count, mean, M2) triples computed on disjoint cases."""
+    count_a, mean_a, m2_a = a
+    count_b, mean_b, m2_b = b
+    count = count_a + count_b
+    safe = np.maximum(count, 1)
+    delta = mean_b - mean_a
+    mean = mean_a + delta * (count_b / safe)
+    m2 = m2_a + m2_b + delta ** 2 * (count_a * count_b / safe)
+    return count, mean, m2
+
+
+def newest_mtime(path):
+    """Latest st_mtime_ns of a file, or of any file under a directory; 0 if it does not exist."""
+    if os.path.isdir(path):
+        return max([newest_mtime(os.path.join(path, name)) for name in os.listdir(path)], default=0)
+    return os.stat(path).st_mtime_ns if os.path.exists(path) else 0
+
+
+class MomentStore:
+    """Per (variable, model) arrays of count, mean and M2 along the lead axis."""
+
+    def __init__(self, moments=None, dates=None, source_mtime=0):
+        self.moments = dict(moments or {})
+        self.dates = {key: set(value) for key, value in (dates or {}).items()}  # absent key: cases without dates
+        self.source_mtime = source_mtime
+
+    @classmethod
+    def from_metrics(cls, metrics, dates=None):
+        """Build from {variable: {model: (case x lead) array}} (pickle dicts or a cube) and their init dates."""
+        store = cls()
+        for variable, per_model in metrics.items():
+            for model in per_model:
+                store.update(variable, model, per_model[model], dates)
+        return store
+
+    @classmethod
+    def load(cls, path):
+        moments, dates = {}, {}
+        with np.load(path, allow_pickle=False) as f:
+            # Stores written before the source time was recorded count as built when they were saved
+            source_mtime = int(f["__source_mtime__"]) if "__source_mtime__" in f.files else os.stat(path).st_mtime_ns
+            for key in f.files:
+                if key.startswith("__"):
+                    continue
+                variable, model, field = key.split("|")
+                if field == "dates":
+                    dates[(variable, model)] = [str(date) for date in f[key]]
+                else:
+                    moments.setdefault((variable, model), {})[field] = f[key]
+        return cls({key: (v["count"], v["mean"], v["m2"]) for key, v in moments.items()}, dates, source_mtime)
+
+    def save(self, path):
+        arrays = {"__source_mtime__": np.int64(self.source_mtime)}
+        for (variable, model), (count, mean, m2) in self.moments.items():
+            arrays[f"{variable}|{model}|count"] = count
+            arrays[f"{variable}|{model}|mean"] = mean
+            arrays[f"{variable}|{model}|m2"] = m2
+            if (variable, model) in self.dates:
+                arrays[f"{variable}|{model}|dates"] = np.array(sorted(self.dates[(variable, model)]), dtype="U8")
+        tmp_path = f"{path}.tmp.npz"
+        np.savez(tmp_path, **arrays)
+        os.replace(tmp_path, path)
+
+    def update(self, variable, model, new_cases, dates=None):
+        """Fold a (case x lead) array of new cases into the running aggregates.
+
+        dates are the init dates of the rows. Rows whose date is already in the
+        store are skipped. Without dates, only a (variable, model) the store
+        does not hold yet can be added, since overlap cannot be ruled out.
+        """
+        key = (variable, model)
+        new_cases = np.asarray(new_cases)
+        if dates is None:
+            if key in self.moments:
+                raise ValueError(f"Cannot add undated cases to {variable}/{model}: they may already be counted.")
+            self.moments[key] = case_moments(new_cases)
+            return
+        if key in self.moments and key not in self.dates:
+            raise ValueError(f"{variable}/{model} holds undated cases; new cases cannot be checked against them.")
+        seen = self.dates.setdefault(key, set())
+        rows = [k for k, date in enumerate(dates[:len(new_cases)]) if date not in seen]
+        if len(rows) < min(len(dates), len(new_cases)):
+            print(f"Warning: skipping {min(len(dates), len(new_cases)) - len(rows)} init dates already counted "
+                  f"for {variable}/{model}.")
+        if not rows and key in self.moments:
+            return
+        new = case_moments(new_cases[rows])
+        self.moments[key] = merge_moments(self.moments[key], new) if key in self.moments else new
+        seen.update(dates[k] for k in rows)
+
+    def merge(self, other):
+        """Fold in another store covering different cases (e.g. from another node); overlapping dates raise ValueError."""
+        for key, moments in other.moments.items():
+            if key in self.moments:
+                if key not in self.dates or key not in other.dates:
+                    raise ValueError(f"Cannot merge {key[0]}/{key[1]}: one of the stores holds undated cases.")
+                overlap = self.dates[key] & other.dates[key]
+                if overlap:
+                    raise ValueError(f"Cannot merge {key[0]}/{key[1]}: {len(overlap)} init dates are in both stores "
+                                     f"(e.g. {min(overlap)}).")
+                self.moments[key] = merge_moments(self.moments[key], moments)
+                self.dates[key] |= other.dates[key]
+            else:
+                self.moments[key] = moments
+                if key in other.dates:
+                    self.dates[key] = set(other.dates[key])
+        self.source_mtime = max(self.source_mtime, other.source_mtime)
+        return self
+
+    def is_current(self, paths):
+        """True if none of paths (files or store directories) changed after the store's sources."""
+        return all(newest_mtime(path) <= self.source_mtime for path in paths)
+
+    def __contains__(self, key):
+        return key in self.moments
+
+    def has_variable(self, variable):
+        return any(v == variable for v, _ in self.moments)
+
+    def count(self, variable, model):
+        return self.moments[(variable, model)][0]
+
+    def mean(self, variable, model):
+        count, mean, _ = self.moments[(variable, model)]
+        return np.where(count > 0, mean, np.nan)
+
+    def std(self, variable, model):
+        """Population standard deviation (ddof=0), as np.nanstd."""
+        count, _, m2 = self.moments[(variable, model)]
+        with np.errstate(invalid="ignore", divide="ignore"):
+            return np.where(count > 0, np.sqrt(m2 / count), np.nan)
+
+    def sem(self, variable, model):
+        """std / sqrt(count), with 0 where there are no samples (fig1.py's convention)."""
+        count, _, m2 = self.moments[(variable, model)]
+        safe = np.maximum(count, 1)
+        return np.where(count > 0, np.sqrt(m2 / safe) / np.sqrt(safe), 0.0)
+
+
+def load_metrics(path):
+    """({variable: {model: array}}, init dates or None) from a fig_1 pickle directory or a cube directory."""
+    from arverify.cases import read_dates
+    from arverify.cube import INDEX_FILE, load_fig1_pickles, open_cube
+
+    if os.path.exists(os.path.join(path, INDEX_FILE)):
+        cube = open_cube(path)
+        return {variable: cube.variable(variable) for variable in cube.variables}, cube.dates
+    return load_fig1_pickles(path), read_dates(path)
+
+
+def source_mtime(path):
+    """Newest modification time of the files load_metrics reads from path."""
+    from arverify.cases import DATES_FILE
+    from arverify.cube import INDEX_FILE
+
+    if os.path.exists(os.path.join(path, INDEX_FILE)):
+        return newest_mtime(path)
+    files = glob.glob(os.path.join(path, "*.pickle")) + [os.path.join(path, DATES_FILE)]
+    return max(newest_mtime(name) for name in files)
+
+
+def source_store(path):
+    """MomentStore of one source directory, stamped with the source's newest modification time."""
+    metrics, dates = load_metrics(path)
+    store = MomentStore.from_metrics(metrics, dates)
+    store.source_mtime = source_mtime(path)
+    return store
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Build, extend or merge fig_1 moment stores.")
+    sub = parser.add_subparsers(dest="command", required=True)
+    build = sub.add_parser("build", help="create a store from fig_1 pickles or a cube")
+    build.add_argument("store")
+    build.add_argument("source")
+    update = sub.add_parser("update", help="fold new cases into an existing store")
+    update.add_argument("store")
+    update.add_argument("source")
+    merge = sub.add_parser("merge", help="merge partial stores into one")
+    merge.add_argument("store")
+    merge.add_argument("parts", nargs="+")
+    args = parser.parse_args(argv)
+
+    if args.command == "build":
+        store = source_store(args.source)
+    elif args.command == "update":
+        store = MomentStore.load(args.store)
+        metrics, dates = load_metrics(args.source)
+        for variable, per_model in metrics.items():
+            for model in per_model:
+                store.update(variable, model, per_model[model], dates)
+        store.source_mtime = max(store.source_mtime, source_mtime(args.source))
+    else:
+        store = MomentStore()
+        for part in args.parts:
+            store.merge(MomentStore.load(part))
+    store.save(args.store)
+
+
+if __name__ == "__main__":
+    main()
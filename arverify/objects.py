@@ -0,0 +1,407 @@
+"""AR objects of the class masks, labelled once and kept as one table per model.
+
+    python -m arverify.objects 20231101 20240331 --models ERA5 tigge graphcast37 --out-dir ./data/objects
+    python -m arverify.contingency 20231101 20240331 --models tigge graphcast37 --objects-dir ./data/objects
+    python -m arverify.landfall 20231101 20240331 --models tigge graphcast37 --objects-dir ./data/objects
+
+Each init date's ``class_masks`` are labelled in one ``ndimage.label`` call over
+(time, lat, lon), with a structure that links cells within a time step only.
+On a grid that closes around the globe, labels that meet across the
+first/last longitude column are merged, so an AR crossing the seam is one
+object. Objects at consecutive lead steps that overlap are linked into tracks,
+one to one, largest overlap first.
+
+Every object is one row of a columnar store, ``{out-dir}/{model}/``:
+
+    index.json         {"dates": [...], "missing": [...], "model": ..., "coast": ..., "n_leads": 41}
+    case_offsets.npy   int64, rows of dates[k] are case_offsets[k]:case_offsets[k + 1]
+    case.npy, time.npy, track.npy              int32
+    lat.npy, lon.npy, x.npy, y.npy, z.npy      centroid, degrees and unit vector
+    cells.npy, area_km2.npy                    size
+    lat_min.npy, lat_max.npy, lon_min.npy, lon_max.npy
+                                               bounding box; lon_min > lon_max when it crosses 0/360
+    peak_iwv.npy                               largest TMQ under the object (NaN without a processed file)
+    landfall_lat.npy                           mean latitude of the coast cells it covers, NaN if none
+
+The row number is the object id. ``ObjectStore.open`` checks the files
+against arverify/schema.py and memory-maps them. ``ObjectStore.case`` returns
+a date's rows in the ``contingency.object_table`` layout. The CSI / POD / FAR
+matching and the fig_2 landfall errors can then read these rows instead of
+the full-resolution masks.
+"""
+import argparse
+import json
+import os
+import shutil
+
+import numpy as np
+import scipy.sparse as sp
+import xarray as xr
+from scipy import ndimage
+from scipy.sparse.csgraph import connected_components
+
+from arverify.landfall import ar_mask, coast_index, mask_path, match_landfalls
+from arverify.regrid import is_periodic
+from arverify.schema import INDEX_FILE, OBJECT_COLUMNS, OBJECTS, SchemaError, open_store, stamp
+from arverify.scores import ARCHIVE_DIR, MODELS, N_LEADS, TRUTH, date_range, processed_path
+
+OBJECTS_DIR = "./data/objects"
+EARTH_RADIUS_KM = 6371.0
+LANDFALL_COAST = "USWC"
+
+_store_cache = {}
+
+
+def wraps(lons):
+    """True when the first and last longitude columns are neighbours across the 0/360 seam."""
+    lons = np.asarray(lons, dtype=np.float64)
+    return is_periodic(lons) and bool(np.all(np.diff(lons) > 0))
+
+
+def label_objects(mask, periodic=False):
+    """Label connected objects of a (time, lat, lon) mask, each time step on its own.
+
+    With periodic, objects touching across the last and first longitude column
+    (diagonals included) get one label. Labels stay ordered by time step.
+    """
+    structure = np.zeros((3, 3, 3), dtype=bool)
+    structure[1] = ndimage.generate_binary_structure(2, 2)
+    labels, n = ndimage.label(mask, structure=structure)
+    if not periodic or n == 0:
+        return labels, n
+    right = labels[:, :, -1]
+    left = labels[:, :, 0]
+    pairs = [(right, left)]
+    pairs += [(right[:, :-1], left[:, 1:]), (right[:, 1:], left[:, :-1])]
+    a = np.concatenate([r.ravel() for r, _ in pairs])
+    b = np.concatenate([l.ravel() for _, l in pairs])
+    keep = (a > 0) & (b > 0)
+    if not keep.any():
+        return labels, n
+    graph = sp.coo_matrix((np.ones(keep.sum()), (a[keep], b[keep])), shape=(n + 1, n + 1))
+    # components are numbered in order of their smallest label, with 0 (background) alone
+    n, component = connected_components(graph, directed=False)
+    return component[labels].astype(labels.dtype), n - 1
+
+
+def cell_areas(lats, lons):
+    """(lat, lon) area of every grid cell in km^2, from the coordinate spacing."""
+    dlat = np.abs(np.gradient(np.radians(np.asarray(lats, dtype=np.float64)))) if len(lats) > 1 else np.ones(1)
+    dlon = np.abs(np.gradient(np.radians(np.unwrap(np.asarray(lons, dtype=np.float64), period=360)))) \
+        if len(lons) > 1 else np.ones(1)
+    return EARTH_RADIUS_KM ** 2 * np.outer(np.cos(np.radians(lats)) * dlat, dlon)
+
+
+def track_objects(labels, n):
+    """Track id of every label: overlapping objects at consecutive steps share one, matched one to one."""
+    track = np.arange(n + 1)
+    earlier = labels[:-1].ravel()
+    later = labels[1:].ravel()
+    overlap = (earlier > 0) & (later > 0)
+    pairs, counts = np.unique(earlier[overlap].astype(np.int64) * (n + 1) + later[overlap], return_counts=True)
+    links = []
+    used_a, used_b = set(), set()
+    for pair in pairs[np.argsort(-counts, kind="stable")]:
+        a, b = divmod(int(pair), n + 1)
+        if a not in used_a and b not in used_b:
+            used_a.add(a)
+            used_b.add(b)
+            links.append((a, b))
+    for a, b in sorted(links):  # a < b, so track[a] is final before it is passed on
+        track[b] = track[a]
+    return np.unique(track[1:], return_inverse=True)[1]
+
+
+def centroid_columns(index, n, t, cell_lats, cell_lons):
+    """Time step, cell count and centroid of n objects, from the 0-based object index, time step and lat/lon of each cell.
+
+    The centroid is the normalized mean of the cells' unit vectors, so objects
+    across the 0/360 seam or near a pole get a sensible position.
+    """
+    def total(weights=None):
+        return np.bincount(index, weights=weights, minlength=n)
+
+    lat, lon = np.radians(cell_lats), np.radians(cell_lons)
+    cells = total()
+    xyz = np.column_stack([total(w) for w in (np.cos(lat) * np.cos(lon), np.cos(lat) * np.sin(lon), np.sin(lat))])
+    xyz /= np.maximum(np.linalg.norm(xyz, axis=1, keepdims=True), np.finfo(float).tiny)
+    return {
+        "time": (total(t) / np.maximum(cells, 1)).astype(np.int64),
+        "lat": np.degrees(np.arcsin(np.clip(xyz[:, 2], -1, 1))),
+        "lon": np.degrees(np.arctan2(xyz[:, 1], xyz[:, 0])) % 360,
+        "xyz": xyz,
+        "cells": cells,
+    }
+
+
+def object_properties(mask, lats, lons, coast=None, iwv=None):
+    """Columns of OBJECT_COLUMNS (without "case") for every object of a (time, lat, lon) mask.
+
+    coast is a CoastIndex for landfall_lat and iwv a (time, lat, lon) TMQ array
+    on the same grid for peak_iwv; either may be None.
+    """
+    lats = np.asarray(lats, dtype=np.float64)
+    lons = np.asarray(lons, dtype=np.float64)
+    labels, n = label_objects(mask, wraps(lons))
+    t, i, j = np.nonzero(labels)
+    index = labels[t, i, j] - 1
+
+    def total(weights=None):
+        return np.bincount(index, weights=weights, minlength=n)
+
+    def extreme(ufunc, values, start):
+        out = np.full(n, start)
+        ufunc.at(out, index, values)
+        return out
+
+    centroids = centroid_columns(index, n, t, lats[i], lons[j])
+    xyz, centroid_lon = centroids["xyz"], centroids["lon"]
+    # Longitudes relative to the centroid, so a box across the seam stays narrow
+    offset = (lons[j] - centroid_lon[index] + 180) % 360 - 180
+    columns = {
+        "time": centroids["time"],
+        "track": track_objects(labels, n),
+        "lat": centroids["lat"],
+        "lon": centroid_lon,
+        "x": xyz[:, 0], "y": xyz[:, 1], "z": xyz[:, 2],
+        "cells": centroids["cells"],
+        "area_km2": total(cell_areas(lats, lons)[i, j]),
+        "lat_min": extreme(np.minimum, lats[i], np.inf),
+        "lat_max": extreme(np.maximum, lats[i], -np.inf),
+        "lon_min": (centroid_lon + extreme(np.minimum, offset, np.inf)) % 360,
+        "lon_max": (centroid_lon + extreme(np.maximum, offset, -np.inf)) % 360,
+        "peak_iwv": np.full(n, np.nan),
+        "landfall_lat": np.full(n, np.nan),
+    }
+    if iwv is not None:
+        peak = extreme(np.fmax, np.asarray(iwv, dtype=np.float64)[t, i, j], -np.inf)
+        columns["peak_iwv"] = np.where(np.isfinite(peak), peak, np.nan)
+    if coast is not None and len(coast):
+        touched = labels[:, coast.lat_idx, coast.lon_idx]
+        hit = touched.ravel()
+        coast_lats = np.broadcast_to(coast.lats, touched.shape).ravel()
+        count = np.bincount(hit, minlength=n + 1)[1:]
+        lat_sum = np.bincount(hit, weights=coast_lats, minlength=n + 1)[1:]
+        with np.errstate(invalid="ignore", divide="ignore"):
+            columns["landfall_lat"] = np.where(count > 0, lat_sum / count, np.nan)
+    return columns
+
+
+def read_iwv(date, model, lats, lons, archive_dir=ARCHIVE_DIR, n_leads=N_LEADS):
+    """TMQ of the processed file on the mask grid, or None if it is missing or on another grid."""
+    try:
+        ds = xr.open_dataset(processed_path(date, model, archive_dir))
+    except FileNotFoundError:
+        return None
+    with ds:
+        if ds["lat"].shape != lats.shape or ds["lon"].shape != lons.shape or \
+                not (np.allclose(ds["lat"].values, lats) and np.allclose(ds["lon"].values, lons)):
+            return None
+        return ds["TMQ"].isel(time=slice(0, n_leads)).values
+
+
+def date_properties(date, model, archive_dir=ARCHIVE_DIR, n_leads=N_LEADS, coast=LANDFALL_COAST):
+    """object_properties of one init date and model; None if the mask file is missing."""
+    try:
+        ds = xr.open_dataset(mask_path(date, model, archive_dir))
+    except FileNotFoundError:
+        return None
+    with ds:
+        masks = ds["class_masks"].isel(time=slice(0, n_leads))
+        lats, lons = masks["lat"].values, masks["lon"].values
+        mask = ar_mask(masks.values)
+    index = coast_index(coast, lats, lons) if coast else None
+    return object_properties(mask, lats, lons, index, read_iwv(date, model, lats, lons, archive_dir, n_leads))
+
+
+class ObjectStore:
+    """The object table of one model: a dict of equal-length columns, grouped by init date."""
+
+    def __init__(self, columns, case_offsets, dates, missing=(), model="", coast="", n_leads=N_LEADS):
+        self.columns = columns
+        self.case_offsets = case_offsets
+        self.dates = list(dates)
+        self.missing = set(missing)
+        self.model = model
+        self.coast = coast
+        self.n_leads = n_leads
+        self._case = {date: k for k, date in enumerate(self.dates)}
+
+    @classmethod
+    def build(cls, dates, model, archive_dir=ARCHIVE_DIR, n_leads=N_LEADS, coast=LANDFALL_COAST):
+        """Label every date's masks; dates without a mask file are recorded as missing."""
+        parts, sizes, missing = [], [], []
+        for case, date in enumerate(dates):
+            columns = date_properties(date, model, archive_dir, n_leads, coast)
+            if columns is None:
+                print(f"Warning: no AR masks for {model} initialized {date}. Recording the case as missing.")
+                missing.append(date)
+                sizes.append(0)
+                continue
+            columns["case"] = np.full(len(columns["time"]), case)
+            parts.append(columns)
+            sizes.append(len(columns["time"]))
+        columns = {name: np.concatenate([part[name] for part in parts]).astype(dtype) if parts
+                   else np.zeros(0, dtype=dtype) for name, dtype in OBJECT_COLUMNS.items()}
+        offsets = np.concatenate([[0], np.cumsum(sizes)]).astype(np.int64)
+        return cls(columns, offsets, dates, missing, model, coast or "", n_leads)
+
+    @classmethod
+    def open(cls, path):
+        """Memory-map a store written by ``write``."""
+        index, arrays = open_store(path, OBJECTS)
+        offsets = np.asarray(arrays.pop("case_offsets"))
+        if offsets[0] != 0 or offsets[-1] != len(arrays["time"]) or np.any(np.diff(offsets) < 0):
+            raise SchemaError(f"{os.path.join(path, 'case_offsets.npy')}: offsets must rise from 0 to "
+                              f"{len(arrays['time'])}")
+        return cls(arrays, offsets, index["dates"], index["missing"], index["model"], index["coast"],
+                   index["n_leads"])
+
+    def write(self, path):
+        """Write to a temporary directory and move it into place."""
+        tmp_path = f"{path}.tmp"
+        shutil.rmtree(tmp_path, ignore_errors=True)
+        os.makedirs(tmp_path)
+        np.save(os.path.join(tmp_path, "case_offsets.npy"), np.asarray(self.case_offsets, dtype=np.int64))
+        for name, dtype in OBJECT_COLUMNS.items():
+            np.save(os.path.join(tmp_path, f"{name}.npy"), np.asarray(self.columns[name], dtype=dtype))
+        index = {"dates": self.dates, "missing": sorted(self.missing), "model": self.model, "coast": self.coast,
+                 "n_leads": self.n_leads}
+        with open(os.path.join(tmp_path, INDEX_FILE), "w") as f:
+            json.dump(stamp(index, OBJECTS), f, indent=1)
+        if os.path.exists(path):
+            shutil.rmtree(path)
+        os.replace(tmp_path, path)
+
+    def __len__(self):
+        return len(self.columns["time"])
+
+    def rows(self, date):
+        """Slice of the rows of one init date; KeyError if the store does not cover it."""
+        k = self._case[date]
+        return slice(int(self.case_offsets[k]), int(self.case_offsets[k + 1]))
+
+    def select(self, date, n_leads=None):
+        """{column: array} of one date's objects at lead steps below n_leads; None if its masks were missing."""
+        if date in self.missing:
+            return None
+        rows = self.rows(date)
+        keep = np.asarray(self.columns["time"][rows]) < (n_leads or self.n_leads)
+        return {name: np.asarray(values[rows])[keep] for name, values in self.columns.items()}
+
+    def case(self, date, n_leads=None, coast=None):
+        """One date's objects in the ``contingency.object_table`` layout; None if its masks were missing.
+
+        coast must be the store's coast to get the "landfalling" column.
+        """
+        if coast and coast != self.coast:
+            raise ValueError(f"{self.model} objects were stored with coast {self.coast!r}, not {coast!r}.")
+        rows = self.select(date, n_leads)
+        if rows is None:
+            return None
+        table = {
+            "time": rows["time"].astype(np.int64),
+            "lat": rows["lat"],
+            "lon": rows["lon"],
+            "xyz": np.column_stack([rows["x"], rows["y"], rows["z"]]),
+            "cells": rows["cells"].astype(np.int64),
+        }
+        if coast:
+            table["landfalling"] = ~np.isnan(rows["landfall_lat"])
+        return table
+
+
+def store_path(objects_dir, model):
+    return os.path.join(objects_dir, model)
+
+
+def open_objects(objects_dir, model):
+    """ObjectStore of one model, memoized per directory; None if it has not been built."""
+    key = (os.path.abspath(objects_dir), model)
+    if key not in _store_cache:
+        path = store_path(objects_dir, model)
+        _store_cache[key] = ObjectStore.open(path) if os.path.isdir(path) else None
+    return _store_cache[key]
+
+
+def landfall_errors(dates, fc_store, obs_store, n_leads=N_LEADS):
+    """Landfall-latitude errors from two object tables, in the ``landfall.landfall_errors`` layout.
+
+    Each landfalling forecast object is paired with the nearest landfalling
+    ERA5 object at the same lead step.
+    """
+    errors = [[] for _ in range(n_leads)]
+    cases = [[] for _ in range(n_leads)]
+    for case, date in enumerate(dates):
+        fc = fc_store.select(date, n_leads) if date in fc_store.dates else None
+        obs = obs_store.select(date, n_leads) if date in obs_store.dates else None
+        if fc is None or obs is None:
+            print(f"Warning: missing AR masks for {fc_store.model} or {obs_store.model} initialized {date}. "
+                  f"Skipping the case.")
+            continue
+        fc_land = ~np.isnan(fc["landfall_lat"])
+        obs_land = ~np.isnan(obs["landfall_lat"])
+        lead, err = match_landfalls(fc["time"][fc_land].astype(np.int64), fc["landfall_lat"][fc_land],
+                                    obs["time"][obs_land].astype(np.int64), obs["landfall_lat"][obs_land])
+        order = np.argsort(lead, kind="stable")
+        lead, err = lead[order], err[order]
+        bounds = np.searchsorted(lead, np.arange(n_leads + 1))
+        for t in range(n_leads):
+            errors[t].append(err[bounds[t]:bounds[t + 1]])
+            cases[t].append(np.full(bounds[t + 1] - bounds[t], case))
+
+    def join(parts, dtype):
+        return np.concatenate(parts).astype(dtype) if parts else np.zeros(0, dtype=dtype)
+
+    return [join(parts, np.float64) for parts in errors], [join(parts, np.int64) for parts in cases]
+
+
+def diagnostics(store, n_leads=None):
+    """Per lead step: mean object count per case, mean area, mean peak IWV and landfalling fraction."""
+    n_leads = n_leads or store.n_leads
+    time = np.asarray(store.columns["time"]).astype(np.int64)
+    keep = time < n_leads
+    time = time[keep]
+    n_cases = max(len(store.dates) - len(store.missing), 1)
+    count = np.bincount(time, minlength=n_leads).astype(np.float64)
+
+    def mean(column):
+        values = np.asarray(store.columns[column], dtype=np.float64)[keep]
+        valid = ~np.isnan(values)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            return np.bincount(time[valid], weights=values[valid], minlength=n_leads) / \
+                np.bincount(time[valid], minlength=n_leads)
+
+    with np.errstate(invalid="ignore", divide="ignore"):
+        landfalling = np.bincount(time, weights=~np.isnan(store.columns["landfall_lat"][keep]),
+                                  minlength=n_leads) / count
+    return {"objects": count / n_cases, "area_km2": mean("area_km2"), "peak_iwv": mean("peak_iwv"),
+            "landfalling": landfalling}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Label the AR masks once and store an object table per model.")
+    parser.add_argument("start", help="first init date, YYYYMMDD")
+    parser.add_argument("end", help="last init date, YYYYMMDD")
+    parser.add_argument("--models", nargs="+", default=[TRUTH] + MODELS)
+    parser.add_argument("--coast", default=LANDFALL_COAST, help="landfall coast of arverify/landfall.py")
+    parser.add_argument("--archive-dir", default=ARCHIVE_DIR)
+    parser.add_argument("--out-dir", default=OBJECTS_DIR)
+    parser.add_argument("--summary", action="store_true", help="print per-lead object diagnostics")
+    args = parser.parse_args(argv)
+
+    dates = date_range(args.start, args.end)
+    os.makedirs(args.out_dir, exist_ok=True)
+    for model in args.models:
+        store = ObjectStore.build(dates, model, args.archive_dir, coast=args.coast)
+        store.write(store_path(args.out_dir, model))
+        print(f"{model}: {len(store)} objects in {len(dates) - len(store.missing)} cases")
+        if args.summary:
+            stats = diagnostics(store)
+            for t in range(0, store.n_leads, 4):
+                print(f"  lead {t:>2}: {stats['objects'][t]:6.2f} objects  {stats['area_km2'][t]:12.0f} km2  "
+                      f"peak IWV {stats['peak_iwv'][t]:6.1f}  landfalling {stats['landfalling'][t]:.2f}")
+
+
+if __name__ == "__main__":
+    main()
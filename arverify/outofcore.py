@@ -0,0 +1,213 @@
+"""The fig_1 and fig_3 inputs from the whole archive as one chunked dask computation.
+
+    python -m arverify.outofcore 20231101 20240331 --models tigge graphcast37 aurora \\
+        --workers 8 --memory-budget 4GB --cube ./data/fig_1/metrics_cube
+
+``arverify.scores`` and ``arverify.contingency`` walk the archive in batches of
+init dates. This module instead opens each model's processed files as one lazy
+dataset with ``xr.open_mfdataset``, shaped (case, lead, lat, lon) and chunked
+one init date by ``lead_chunk`` lead steps. The pieces are:
+
+* Every fig_1 score comes from a single blockwise task per chunk. It applies
+  ``scores.score_cases`` to the forecast and ERA5 blocks. The ERA5 chunks are
+  the same graph nodes for every model, so each is read once.
+* The fig_3 CSI / POD / FAR come from one delayed task per (model, date). Each
+  task matches that date's AR objects, and the ERA5 object tables are shared
+  in the same way.
+
+Everything is evaluated by one ``dask.compute`` on the local multi-process
+scheduler. Only the (case, lead) results are gathered, so peak memory is about
+``workers`` chunks at a time however many dates the archive holds.
+``lead_chunk`` is derived from ``--memory-budget`` so that those chunks and
+their float64 temporaries fit. The results are the same numbers the batch
+modules write, in the same files.
+"""
+import argparse
+import os
+from functools import partial
+
+import numpy as np
+import xarray as xr
+
+from arverify.contingency import METRICS, THRESHOLDS, case_scores, date_objects, metrics_dataset
+from arverify.scores import (ARCHIVE_DIR, FIELDS, N_LEADS, TRUTH, USWC_BOUNDS, date_range, metric_names,
+                             open_processed, processed_path, score_cases, subset_region, write_fig1_pickles)
+
+DEFAULT_BUDGET = "2GB"
+WORKING_COPIES = 6  # float64 temporaries per field in score_cases (error, weights, products)
+
+
+def lead_chunk_size(n_lat, n_lon, memory_budget, workers, n_leads=N_LEADS, fields=FIELDS):
+    """Lead steps per chunk so that ``workers`` blocks of forecast + ERA5 and their temporaries fit the budget."""
+    per_lead = n_lat * n_lon * (2 * len(fields) * 4 + WORKING_COPIES * 8)
+    return int(np.clip(memory_budget // (max(workers, 1) * per_lead), 1, n_leads))
+
+
+def grid_shape(dates, model=TRUTH, archive_dir=ARCHIVE_DIR, bounds=USWC_BOUNDS):
+    """(n_lat, n_lon) of the first file of model in dates, or None if there is none."""
+    for date in dates:
+        if os.path.exists(processed_path(date, model, archive_dir)):
+            with open_processed(date, model, archive_dir, bounds) as ds:
+                return ds.sizes["lat"], ds.sizes["lon"]
+    return None
+
+
+def _prepare(ds, model, fields, bounds, n_leads):
+    """Per-file preprocessing: the same cuts as open_processed / load_cases, with a ``lead`` dimension."""
+    ds = ds[list(fields)].isel(time=slice(0, n_leads)).astype(np.float32)
+    if model == "fourcastnet":
+        ds = ds.isel(lat=slice(0, -1))  # FourCastNet carries one extra latitude row
+    if bounds is not None:
+        ds = subset_region(ds, bounds)
+    ds = ds.rename(time="lead").assign_coords(lead=np.arange(ds.sizes["time"]))
+    return ds.reindex(lead=np.arange(n_leads))  # shorter trajectories are padded with NaN
+
+
+def open_archive(dates, model, fields=FIELDS, archive_dir=ARCHIVE_DIR, bounds=USWC_BOUNDS, n_leads=N_LEADS,
+                 lead_chunk=N_LEADS):
+    """Lazy (case, lead, lat, lon) Dataset of one model over dates; None if no file exists.
+
+    Missing init dates are NaN cases, as in ``scores.load_cases``.
+    """
+    present = [date for date in dates if os.path.exists(processed_path(date, model, archive_dir))]
+    for date in sorted(set(dates) - set(present)):
+        print(f"Warning: no processed file for {model} initialized {date}. Leaving the case as NaN.")
+    if not present:
+        return None
+    ds = xr.open_mfdataset([processed_path(date, model, archive_dir) for date in present],
+                           preprocess=partial(_prepare, model=model, fields=fields, bounds=bounds, n_leads=n_leads),
+                           combine="nested", concat_dim="case", chunks={"time": lead_chunk},
+                           data_vars="all", coords="minimal", compat="override", join="override")
+    ds = ds.assign_coords(case=present)
+    return ds.reindex(case=list(dates)) if len(present) < len(dates) else ds
+
+
+def fig1_scores(forecast, truth, weights=None, fields=FIELDS):
+    """Lazy (case, lead, metric) array of every fig_1 metric, one task per chunk; metrics in metric_names() order."""
+    import dask.array as da
+
+    names = metric_names()
+
+    def block(*blocks):
+        scores = score_cases(dict(zip(fields, blocks[:len(fields)])), dict(zip(fields, blocks[len(fields):])), weights)
+        return np.stack([scores[name] for name in names], axis=-1)
+
+    args = []
+    for ds in (forecast, truth):
+        for field in fields:
+            args += [ds[field].data, "clyx"]
+    return da.blockwise(block, "clm", *args, new_axes={"m": len(names)}, dtype=np.float64, concatenate=True)
+
+
+def _score_objects(fc, obs, n_leads, thresholds):
+    if fc is None or obs is None:
+        return None
+    return case_scores(fc, obs, n_leads, thresholds)
+
+
+def contingency_tasks(dates, models, bounds=USWC_BOUNDS, thresholds=THRESHOLDS, archive_dir=ARCHIVE_DIR,
+                      n_leads=N_LEADS):
+    """{model: [delayed case scores or None, per date]}, with the ERA5 object tables shared between models."""
+    from dask import delayed
+
+    obs = {date: delayed(date_objects)(date, TRUTH, bounds, archive_dir, n_leads) for date in dates}
+    return {model: [delayed(_score_objects)(delayed(date_objects)(date, model, bounds, archive_dir, n_leads),
+                                            obs[date], n_leads, thresholds)
+                    for date in dates]
+            for model in models}
+
+
+def compute_archive(dates, models, archive_dir=ARCHIVE_DIR, fig1_bounds=USWC_BOUNDS, fig3_bounds=USWC_BOUNDS,
+                    thresholds=THRESHOLDS, weights=None, fig1=True, fig3=True, workers=None,
+                    memory_budget=DEFAULT_BUDGET, scheduler="processes", n_leads=N_LEADS):
+    """Both figures' inputs in one dask computation.
+
+    Returns (fig1 metrics in the ``scores.compute_fig1_metrics`` layout, {model:
+    per-date scores in the ``contingency.contingency_scores`` layout}); a
+    figure that was not requested is an empty dict.
+    """
+    import dask
+    from dask.utils import parse_bytes
+
+    workers = workers or os.cpu_count() or 1
+    budget = parse_bytes(memory_budget) if isinstance(memory_budget, str) else memory_budget
+
+    lazy_fig1 = {}
+    shape = grid_shape(dates, TRUTH, archive_dir, fig1_bounds) if fig1 else None
+    if shape is not None:
+        lead_chunk = lead_chunk_size(*shape, budget, workers, n_leads)
+        truth = open_archive(dates, TRUTH, archive_dir=archive_dir, bounds=fig1_bounds, n_leads=n_leads,
+                             lead_chunk=lead_chunk)
+        for model in models:
+            forecast = open_archive(dates, model, archive_dir=archive_dir, bounds=fig1_bounds, n_leads=n_leads,
+                                    lead_chunk=lead_chunk)
+            if forecast is None:
+                continue
+            if (forecast.sizes["lat"], forecast.sizes["lon"]) != shape:
+                print(f"Warning: {model} grid {(forecast.sizes['lat'], forecast.sizes['lon'])} does not match "
+                      f"{TRUTH} {shape}. Skipping {model} for fig_1.")
+                continue
+            lazy_fig1[model] = fig1_scores(forecast, truth, weights)
+    elif fig1:
+        print(f"Warning: no {TRUTH} files for the requested dates. Skipping fig_1.")
+    lazy_fig3 = contingency_tasks(dates, models, fig3_bounds, thresholds, archive_dir, n_leads) if fig3 else {}
+
+    with dask.config.set(scheduler=scheduler, num_workers=workers):
+        fig1_values, fig3_cases = dask.compute(lazy_fig1, lazy_fig3)
+
+    fig1_metrics = {name: {model: values[..., k] for model, values in fig1_values.items()}
+                    for k, name in enumerate(metric_names())} if fig1_values else {}
+    fig3_scores = {}
+    for model, cases in fig3_cases.items():
+        scores = {metric: np.full((len(dates), n_leads, len(thresholds)), np.nan) for metric in METRICS}
+        for case, (date, values) in enumerate(zip(dates, cases)):
+            if values is None:
+                print(f"Warning: missing AR masks for {model} or {TRUTH} initialized {date}. Skipping the case.")
+                continue
+            for metric in METRICS:
+                scores[metric][case] = values[metric]
+        fig3_scores[model] = scores
+    return fig1_metrics, fig3_scores
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Compute the fig_1 and fig_3 inputs out of core with dask.")
+    parser.add_argument("start", help="first init date, YYYYMMDD")
+    parser.add_argument("end", help="last init date, YYYYMMDD")
+    parser.add_argument("--models", nargs="+", required=True)
+    parser.add_argument("--archive-dir", default=ARCHIVE_DIR)
+    parser.add_argument("--workers", type=int, help="worker processes (default: all cores)")
+    parser.add_argument("--memory-budget", default=DEFAULT_BUDGET, help="e.g. 4GB; sets the chunk size")
+    parser.add_argument("--scheduler", choices=["processes", "threads", "synchronous"], default="processes")
+    parser.add_argument("--skip-fig1", action="store_true")
+    parser.add_argument("--skip-fig3", action="store_true")
+    parser.add_argument("--fig1-dir", default="./data/fig_1")
+    parser.add_argument("--cube", help="also write a memory-mapped metric cube to this directory")
+    parser.add_argument("--fig3-dir", default="./data/fig_3")
+    parser.add_argument("--thresholds", nargs="+", type=int, default=list(THRESHOLDS))
+    parser.add_argument("--all-regions", action="store_true", help="fig_3: keep every object instead of the USWC box")
+    parser.add_argument("--per-case", action="store_true", help="fig_3: also store the per-date scores")
+    args = parser.parse_args(argv)
+
+    dates = date_range(args.start, args.end)
+    fig3_bounds = None if args.all_regions else USWC_BOUNDS
+    fig1_metrics, fig3_scores = compute_archive(
+        dates, args.models, args.archive_dir, fig3_bounds=fig3_bounds, thresholds=args.thresholds,
+        fig1=not args.skip_fig1, fig3=not args.skip_fig3, workers=args.workers,
+        memory_budget=args.memory_budget, scheduler=args.scheduler)
+
+    if fig1_metrics:
+        refreshed = write_fig1_pickles(fig1_metrics, args.fig1_dir, dates)
+        if args.cube and os.path.abspath(args.cube) != os.path.abspath(refreshed or ""):
+            from arverify.cube import write_cube
+            write_cube(args.cube, fig1_metrics, dates=dates)
+    suffix = "" if args.all_regions else "_USWC"
+    if fig3_scores:
+        os.makedirs(args.fig3_dir, exist_ok=True)
+    for model, scores in fig3_scores.items():
+        ds = metrics_dataset(scores, dates, model, fig3_bounds, args.thresholds, args.per_case)
+        ds.to_netcdf(os.path.join(args.fig3_dir, f"{model}_metrics{suffix}.nc"))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,119 @@
+"""Compressed-row storage for per-lead landfall errors.
+
+The fig_2 pickles are a list of 41 Python lists, one per lead step, and fig2.py
+``np.hstack``s a slice of them for every window it plots. Here the lists are
+flattened lead by lead into one values array with an offsets array marking
+where each lead starts, so the errors of leads [start, stop) are the single
+contiguous slice ``values[offsets[start]:offsets[stop]]``, a view rather than a copy:
+
+    {model}_lat_landfall_error_degrees/
+        index.json     {"dates": [...], "n_leads": 41}
+        values.npy     float64, every error, lead-major
+        offsets.npy    int64, n_leads + 1 entries
+        case_ids.npy   int32, index into dates of the case each error came from (-1 if unknown)
+
+``RaggedLeads.open`` checks the files against the declared layout
+(arverify/schema.py) and that the offsets partition the values, then
+memory-maps them.
+
+Convert an existing pickle with
+
+    python -m arverify.ragged ./data/fig_2/tigge_lat_landfall_error_degrees.pkl ./data/fig_2/tigge_lat_landfall_error_degrees
+"""
+import argparse
+import json
+import os
+import pickle
+
+import numpy as np
+
+from arverify.schema import INDEX_FILE, RAGGED, SchemaError, open_store, stamp
+
+
+class RaggedLeads:
+    """Errors of every lead step in one flat array, addressed by lead offsets."""
+
+    def __init__(self, values, offsets, case_ids=None, dates=None):
+        self.values = values
+        self.offsets = offsets
+        self.case_ids = np.full(len(values), -1, dtype=np.int32) if case_ids is None else case_ids
+        self.dates = list(dates or [])
+
+    @classmethod
+    def from_lists(cls, per_lead_values, per_lead_cases=None, dates=None):
+        """Build from a list of per-lead sequences (the fig_2 pickle layout)."""
+        lengths = [len(values) for values in per_lead_values]
+        offsets = np.concatenate([[0], np.cumsum(lengths)]).astype(np.int64)
+        values = np.concatenate([np.asarray(v, dtype=np.float64).ravel() for v in per_lead_values]) \
+            if per_lead_values else np.zeros(0)
+        case_ids = None
+        if per_lead_cases is not None:
+            case_ids = np.concatenate([np.asarray(c, dtype=np.int32).ravel() for c in per_lead_cases])
+        return cls(values, offsets, case_ids, dates)
+
+    @classmethod
+    def open(cls, path):
+        """Memory-map a store written by ``write``."""
+        index, arrays = open_store(path, RAGGED)
+        offsets = np.asarray(arrays["offsets"])
+        if offsets[0] != 0 or offsets[-1] != len(arrays["values"]) or np.any(np.diff(offsets) < 0):
+            raise SchemaError(f"{os.path.join(path, 'offsets.npy')}: offsets must rise from 0 to "
+                              f"{len(arrays['values'])}")
+        return cls(arrays["values"], arrays["offsets"], arrays["case_ids"], index["dates"])
+
+    def write(self, path):
+        os.makedirs(path, exist_ok=True)
+        np.save(os.path.join(path, "values.npy"), np.asarray(self.values, dtype=np.float64))
+        np.save(os.path.join(path, "offsets.npy"), np.asarray(self.offsets, dtype=np.int64))
+        np.save(os.path.join(path, "case_ids.npy"), np.asarray(self.case_ids, dtype=np.int32))
+        with open(os.path.join(path, INDEX_FILE), "w") as f:
+            json.dump(stamp({"dates": self.dates, "n_leads": len(self)}, RAGGED), f, indent=1)
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def _span(self, start, stop):
+        start = min(max(start, 0), len(self))
+        stop = min(max(stop, start), len(self))
+        return slice(self.offsets[start], self.offsets[stop])
+
+    def lead(self, t):
+        return self.values[self._span(t, t + 1)]
+
+    def window(self, start, stop):
+        """All errors of leads start .. stop-1 as one view (clipped to the stored leads)."""
+        return self.values[self._span(start, stop)]
+
+    def window_cases(self, start, stop):
+        """Case index of every value returned by window(start, stop)."""
+        return self.case_ids[self._span(start, stop)]
+
+    def subset_cases(self, keep):
+        """In-memory RaggedLeads of only the errors whose case is True in keep (one bool per date).
+
+        Case ids and dates are kept as they are, so the result still points into
+        the full list of init dates.
+        """
+        kept = np.asarray(keep, dtype=bool)[np.asarray(self.case_ids)]
+        offsets = np.concatenate([[0], np.cumsum(kept)])[np.asarray(self.offsets)].astype(np.int64)
+        return RaggedLeads(np.asarray(self.values)[kept], offsets, np.asarray(self.case_ids)[kept], self.dates)
+
+
+def load_landfall_errors(path):
+    """RaggedLeads from either a store directory or a fig_2 pickle."""
+    if os.path.isdir(path):
+        return RaggedLeads.open(path)
+    with open(path, "rb") as f:
+        return RaggedLeads.from_lists(pickle.load(f))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Convert a fig_2 landfall-error pickle to a ragged store.")
+    parser.add_argument("pickle_path")
+    parser.add_argument("out_path")
+    args = parser.parse_args(argv)
+    load_landfall_errors(args.pickle_path).write(args.out_path)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,78 @@
+"""The table of named verification regions and point-in-region tests.
+
+Kept apart from the scoring in arverify/regions.py so that looking up a region
+(fig1.py reads its title) does not import scipy, xarray or pandas.
+"""
+import json
+
+import numpy as np
+
+USWC_BOUNDS = (170, 250, 15, 65)  # min_lon, max_lon, min_lat, max_lat (same as the fig_3 files)
+REGIONS = {
+    "USWC": {"title": "U.S. West Coast", "bounds": USWC_BOUNDS},
+    "PNW": {"title": "Pacific Northwest", "bounds": (225, 245, 40, 50)},
+    # The California coast and the ocean within about five degrees of it
+    "CA": {"title": "California", "polygon": [(231, 42), (240, 42), (240, 39), (246, 35), (246, 32.5),
+                                              (242.5, 32.5), (236, 33), (231, 38)]},
+    "AK": {"title": "Alaska", "bounds": (185, 235, 50, 72)},
+}
+
+
+def register_region(name, title=None, bounds=None, polygon=None):
+    """Add a box (min_lon, max_lon, min_lat, max_lat) or polygon [(lon, lat), ...] region to REGIONS."""
+    if (bounds is None) == (polygon is None):
+        raise ValueError(f"Region {name!r} needs exactly one of bounds or polygon.")
+    region = {"title": title or name}
+    if bounds is not None:
+        region["bounds"] = tuple(float(v) for v in bounds)
+    else:
+        region["polygon"] = [(float(lon) % 360, float(lat)) for lon, lat in polygon]
+    REGIONS[name] = region
+    return region
+
+
+def load_region_file(path):
+    """Register every region of a JSON file {name: {"title": ..., "bounds" or "polygon": ...}}; returns the names."""
+    with open(path) as f:
+        regions = json.load(f)
+    for name, region in regions.items():
+        register_region(name, region.get("title"), region.get("bounds"), region.get("polygon"))
+    return list(regions)
+
+
+def region_bbox(name):
+    """(min_lon, max_lon, min_lat, max_lat) enclosing a region."""
+    region = REGIONS[name]
+    if "bounds" in region:
+        return tuple(region["bounds"])
+    lons, lats = np.asarray(region["polygon"]).T
+    return lons.min(), lons.max(), lats.min(), lats.max()
+
+
+def union_bounds(names):
+    """One box covering every region, for reading the archive once."""
+    boxes = np.array([region_bbox(name) for name in names], dtype=np.float64)
+    return boxes[:, 0].min(), boxes[:, 1].max(), boxes[:, 2].min(), boxes[:, 3].max()
+
+
+def contains(name, lats, lons):
+    """Whether each (lat, lon) point (broadcast together) lies in the region; boxes are inclusive."""
+    region = REGIONS[name]
+    lats, lons = np.broadcast_arrays(np.asarray(lats, dtype=np.float64), np.asarray(lons, dtype=np.float64) % 360)
+    if "bounds" in region:
+        min_lon, max_lon, min_lat, max_lat = region["bounds"]
+        return (lons >= min_lon) & (lons <= max_lon) & (lats >= min_lat) & (lats <= max_lat)
+    from matplotlib.path import Path
+
+    inside = Path(region["polygon"]).contains_points(np.column_stack([lons.ravel(), lats.ravel()]))
+    return inside.reshape(lats.shape)
+
+
+def region_mask(name, lats, lons):
+    """(lat, lon) boolean mask of the grid cells whose centres lie in the region."""
+    return contains(name, np.asarray(lats)[:, None], np.asarray(lons)[None, :])
+
+
+def objects_in_region(table, name):
+    """Boolean selection of the objects of a contingency object table whose centroid lies in the region."""
+    return contains(name, table["lat"], table["lon"])
@@ -0,0 +1,204 @@
+"""Named verification regions and scoring of all of them at once.
+
+A region is a lon/lat box or a polygon, with longitudes on 0-360:
+
+    REGIONS["PNW"] = {"title": "Pacific Northwest", "bounds": (225, 245, 40, 50)}
+    register_region("SoCal", "Southern California", polygon=[(238, 35), (243, 35), (243, 32), (238, 32)])
+
+More regions can be read from a JSON file of the same form with
+``load_region_file``. The table and the point-in-region tests live in
+arverify/regiondefs.py, which needs only numpy, and are re-exported here.
+
+For a grid, ``region_operator`` rasterizes the requested regions once. It
+returns a sparse (region x grid cell) matrix whose row r holds the cell indices
+of region r and their weights. The matrix is cached in memory and under
+``./data/region_masks``, keyed by the grid, the weighting and the region
+definitions.
+Scoring then flattens each (case, lead) map and sums error^2, error and the
+valid-point weights over every region in one sparse product per field. A
+region added to the list costs one more matrix row, not another pass over the
+forecast data. Grid points that are NaN in either the forecast or ERA5 drop out
+of the weights, as in ``scores.rmse_and_bias``.
+
+Every grid cell counts the same by default, as in ``scores.compute_fig1_metrics``,
+so ``regions/USWC`` matches ``./data/fig_1``. ``--area-weighted`` weights the
+cells by cos(lat); ``python -m arverify.scores --area-weighted`` does the same
+for ``./data/fig_1``.
+
+    python -m arverify.regions 20231101 20240331 --regions USWC PNW CA AK --out-dir ./data/fig_1/regions
+
+writes ``{out-dir}/{region}/{metric}.pickle`` in the fig_1 format for every
+region, from a single read of each init date. ``python -m arverify.contingency
+--regions ...`` writes the matching ``{model}_metrics_{region}.nc`` fig_3 files.
+"""
+import argparse
+import hashlib
+import json
+import os
+import warnings
+
+import numpy as np
+import scipy.sparse as sp
+
+from arverify.regiondefs import (REGIONS, contains, load_region_file, objects_in_region, region_bbox, region_mask,
+                                 register_region, union_bounds)
+from arverify.scores import (ARCHIVE_DIR, BIAS_VARIABLES, FIELDS, MODELS, N_LEADS, RMSE_VARIABLES, TRUTH,
+                             date_range, load_cases, metric_names, open_processed, processed_path,
+                             write_fig1_pickles)
+
+REGIONS_DIR = "./data/region_masks"
+_operator_cache = {}
+
+
+def operator_key(names, lats, lons, area_weighted=False):
+    digest = hashlib.sha1(json.dumps([[name, REGIONS[name]] for name in names] + [area_weighted]).encode())
+    for coord in (lats, lons):
+        coord = np.ascontiguousarray(coord, dtype=np.float64)
+        digest.update(np.int64(len(coord)).tobytes())
+        digest.update(coord.tobytes())
+    return digest.hexdigest()[:16]
+
+
+def build_operator(names, lats, lons, area_weighted=False):
+    """CSR (region x lat*lon) matrix of each region's cells, weighted 1 or (area_weighted) cos(lat)."""
+    lat_weights = np.cos(np.radians(np.asarray(lats, dtype=np.float64))) if area_weighted else np.ones(len(lats))
+    weights = np.broadcast_to(lat_weights[:, None], (len(lats), len(lons))).ravel()
+    rows = [np.flatnonzero(region_mask(name, lats, lons)) for name in names]
+    indptr = np.concatenate([[0], np.cumsum([len(cells) for cells in rows])])
+    indices = np.concatenate(rows) if rows else np.zeros(0, dtype=np.int64)
+    return sp.csr_matrix((weights[indices], indices, indptr), shape=(len(names), weights.size))
+
+
+class RegionOperator:
+    """Weighted sums of (..., lat, lon) fields over several regions with one sparse product."""
+
+    def __init__(self, names, matrix):
+        self.names = list(names)
+        self.matrix = matrix
+
+    def reduce(self, values):
+        """(..., lat, lon) -> (..., region) sums of weight x value."""
+        values = np.asarray(values, dtype=np.float64)
+        lead_shape = values.shape[:-2]
+        flat = values.reshape(-1, values.shape[-2] * values.shape[-1])
+        return (self.matrix @ flat.T).T.reshape(lead_shape + (len(self.names),))
+
+    def rmse_and_bias(self, forecast, truth):
+        """Weighted RMSE and mean error of every region, (..., region) each; NaN points are left out."""
+        err = forecast.astype(np.float64) - truth
+        valid = ~np.isnan(err)
+        err = np.where(valid, err, 0.0)
+        # error^2, error and the valid weights of every map go through the same product
+        sums = self.reduce(np.stack([err ** 2, err, valid.astype(np.float64)]))
+        with np.errstate(invalid="ignore", divide="ignore"):
+            return np.sqrt(sums[0] / sums[2]), sums[1] / sums[2]
+
+    def __len__(self):
+        return len(self.names)
+
+
+def region_operator(names, lats, lons, cache_dir=REGIONS_DIR, area_weighted=False):
+    """RegionOperator for a grid, from memory, then disk, then built and stored."""
+    key = operator_key(names, lats, lons, area_weighted)
+    if key not in _operator_cache:
+        path = os.path.join(cache_dir, f"regions_{key}.npz") if cache_dir else None
+        if path and os.path.exists(path):
+            matrix = sp.load_npz(path).tocsr()
+        else:
+            matrix = build_operator(names, lats, lons, area_weighted)
+            if path:
+                os.makedirs(cache_dir, exist_ok=True)
+                tmp_path = f"{path[:-4]}.tmp.npz"
+                sp.save_npz(tmp_path, matrix)
+                os.replace(tmp_path, path)
+        _operator_cache[key] = RegionOperator(names, matrix)
+    return _operator_cache[key]
+
+
+def score_regions(forecast, truth, operator):
+    """All fig_1 metrics of one batch for every region: {name: (case, lead, region) array}."""
+    scores = {}
+    for var in FIELDS:
+        rmse, bias = operator.rmse_and_bias(forecast[var], truth[var])
+        if var in RMSE_VARIABLES:
+            scores[f"{var}_RMSE"] = rmse
+        if var in BIAS_VARIABLES:
+            scores[f"{var}_bias"] = bias
+    if "WIND850" in RMSE_VARIABLES:
+        speed_fc = np.hypot(forecast["U850"], forecast["V850"])
+        speed_truth = np.hypot(truth["U850"], truth["V850"])
+        scores["WIND850_RMSE"] = operator.rmse_and_bias(speed_fc, speed_truth)[0]
+    return scores
+
+
+def archive_grid(dates, bounds, archive_dir=ARCHIVE_DIR, model=TRUTH):
+    """(lats, lons) of the first file of model in dates, cut to bounds; None if there is none."""
+    for date in dates:
+        if os.path.exists(processed_path(date, model, archive_dir)):
+            with open_processed(date, model, archive_dir, bounds) as ds:
+                return ds["lat"].values, ds["lon"].values
+    return None
+
+
+def compute_region_metrics(dates, regions, models=MODELS, archive_dir=ARCHIVE_DIR, batch_size=16,
+                           cache_dir=REGIONS_DIR, area_weighted=False):
+    """Score every model against ERA5 in every region.
+
+    Returns {region: {metric: {model: (len(dates), N_LEADS) array}}}, each
+    region's entry in the ``scores.compute_fig1_metrics`` layout. The archive
+    is read once, cut to the box covering all regions.
+    """
+    bounds = union_bounds(regions)
+    grid = archive_grid(dates, bounds, archive_dir)
+    if grid is None:
+        raise FileNotFoundError(f"No {TRUTH} files for {dates[0]}-{dates[-1]} under {archive_dir}.")
+    operator = region_operator(regions, *grid, cache_dir=cache_dir, area_weighted=area_weighted)
+    metrics = {name: {model: np.full((len(dates), N_LEADS, len(regions)), np.nan) for model in models}
+               for name in metric_names()}
+    found = set()
+    for start in range(0, len(dates), batch_size):
+        batch = dates[start:start + batch_size]
+        cases = slice(start, start + len(batch))
+        truth = load_cases(batch, TRUTH, archive_dir=archive_dir, bounds=bounds)
+        if truth is None:
+            continue
+        for model in models:
+            forecast = load_cases(batch, model, archive_dir=archive_dir, bounds=bounds)
+            if forecast is None:
+                continue
+            if forecast["TMQ"].shape[-2:] != truth["TMQ"].shape[-2:]:
+                warnings.warn(f"{model} grid {forecast['TMQ'].shape[-2:]} does not match {TRUTH} "
+                              f"{truth['TMQ'].shape[-2:]}; skipping dates {batch[0]}-{batch[-1]}.")
+                continue
+            found.add(model)
+            for name, values in score_regions(forecast, truth, operator).items():
+                metrics[name][model][cases] = values
+    return {region: {name: {model: arr[..., r] for model, arr in per_model.items() if model in found}
+                     for name, per_model in metrics.items()}
+            for r, region in enumerate(regions)}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Write fig_1 metrics for several regions at once.")
+    parser.add_argument("start", help="first init date, YYYYMMDD")
+    parser.add_argument("end", help="last init date, YYYYMMDD")
+    parser.add_argument("--regions", nargs="+", default=list(REGIONS))
+    parser.add_argument("--region-file", help="JSON file of extra regions")
+    parser.add_argument("--models", nargs="+", default=MODELS)
+    parser.add_argument("--archive-dir", default=ARCHIVE_DIR)
+    parser.add_argument("--out-dir", default="./data/fig_1/regions")
+    parser.add_argument("--batch-size", type=int, default=16)
+    parser.add_argument("--area-weighted", action="store_true", help="weight grid cells by cos(lat)")
+    args = parser.parse_args(argv)
+
+    if args.region_file:
+        load_region_file(args.region_file)
+    dates = date_range(args.start, args.end)
+    per_region = compute_region_metrics(dates, args.regions, args.models, args.archive_dir, args.batch_size,
+                                        area_weighted=args.area_weighted)
+    for region, metrics in per_region.items():
+        write_fig1_pickles(metrics, os.path.join(args.out_dir, region), dates)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,308 @@
+"""Cached sparse regridding between regular lat-lon grids, and forecast-minus-ERA5 fields.
+
+The fig_4 ``{model}_combined.nc`` files hold forecast minus ERA5 on the ERA5 grid,
+so every model has to be brought onto that grid first. On a regular lat-lon
+grid both bilinear interpolation and first-order conservative remapping are
+separable: the 2-D weight matrix is the Kronecker product of a latitude matrix
+and a longitude matrix, each built from 1-D coordinates in a few array
+operations. Conservative weights use overlaps in sin(latitude), which makes them
+area weights. Longitude wraps around when the source grid is global.
+
+Weights are built once per (source grid, target grid, method) and stored under
+``./data/regrid_weights`` with ``scipy.sparse.save_npz``. Regridding a Dataset
+stacks every (field, time) map as a row of one array and applies the weights in
+a single sparse matrix product. Target points the source grid does not cover
+are NaN, and a NaN source point spreads to every target point that uses it.
+
+Write the fig_4 files for the maps valid 2024-03-15 00 UTC at a 7-day lead:
+
+    python -m arverify.regrid 20240315_00 7 --models graphcast37 tigge aurora_ft --out-dir ./data/fig_4
+
+``--absolute`` writes the regridded forecast fields instead of their differences.
+
+With ``--catalog ./data/catalog.json`` (arverify/catalog.py), the init date and
+time index come from the archive's recorded time axes instead of being derived
+from a 6-hourly axis starting at 00 UTC.
+"""
+import argparse
+import hashlib
+import os
+from datetime import datetime, timedelta
+
+import numpy as np
+import scipy.sparse as sp
+import xarray as xr
+
+from arverify.landfall import ar_mask, mask_path
+from arverify.scores import ARCHIVE_DIR, FIELDS, TRUTH, open_processed, subset_region
+
+WEIGHTS_DIR = "./data/regrid_weights"
+METHODS = ("bilinear", "conservative")
+MARGIN = 2.0  # degrees of forecast grid kept around the target box, so edge points can be interpolated
+FIG4_BOUNDS = (180, 255, 10, 65)  # the fig4 map extent with some room, starting at the dateline; min_lon, max_lon, min_lat, max_lat
+
+_weights_cache = {}
+
+
+def is_periodic(lons):
+    """True for an evenly spaced longitude axis that closes around the globe."""
+    lons = np.sort(np.asarray(lons, dtype=np.float64) % 360)
+    if len(lons) < 2:
+        return False
+    step = np.diff(lons)
+    return bool(np.allclose(step, step[0]) and np.isclose(step[0] * len(lons), 360))
+
+
+def linear_weights_1d(src, dst, period=None):
+    """(len(dst), len(src)) linear interpolation matrix; rows outside src are empty."""
+    src = np.asarray(src, dtype=np.float64)
+    dst = np.asarray(dst, dtype=np.float64)
+    order = np.argsort(src)
+    coords, index = src[order], order
+    if period:
+        coords = np.concatenate([[coords[-1] - period], coords, [coords[0] + period]])
+        index = np.concatenate([[order[-1]], order, [order[0]]])
+        dst = coords[1] + (dst - coords[1]) % period
+    j = np.clip(np.searchsorted(coords, dst, side="right") - 1, 0, len(coords) - 2)
+    frac = (dst - coords[j]) / (coords[j + 1] - coords[j])
+    inside = (frac >= -1e-9) & (frac <= 1 + 1e-9)
+    frac = np.clip(frac, 0, 1)
+    rows = np.flatnonzero(inside)
+    return sp.csr_matrix((np.concatenate([1 - frac[rows], frac[rows]]),
+                          (np.concatenate([rows, rows]), np.concatenate([index[j[rows]], index[j[rows] + 1]]))),
+                         shape=(len(dst), len(src)))
+
+
+def cell_edges(centers, lower=-np.inf, upper=np.inf):
+    """Edges halfway between sorted cell centers, extended by half a cell at the ends."""
+    centers = np.asarray(centers, dtype=np.float64)
+    mid = (centers[1:] + centers[:-1]) / 2
+    edges = np.concatenate([[centers[0] - (mid[0] - centers[0])], mid, [centers[-1] + (centers[-1] - mid[-1])]])
+    return np.clip(edges, lower, upper)
+
+
+def overlap_weights_1d(src, dst, transform=None, period=None, lower=-np.inf, upper=np.inf):
+    """(len(dst), len(src)) matrix of the fraction of each target cell covered by each source cell.
+
+    transform maps edge coordinates before measuring lengths (sin of latitude
+    gives area fractions). Rows are normalized over the covered part of the
+    target cell; rows with no overlap are empty.
+    """
+    src = np.asarray(src, dtype=np.float64)
+    dst = np.asarray(dst, dtype=np.float64)
+    s_order, d_order = np.argsort(src), np.argsort(dst)
+    s_edges = cell_edges(src[s_order], lower, upper)
+    d_edges = cell_edges(dst[d_order], lower, upper)
+    shifts = [0.0] if not period else [-period, 0.0, period]
+    f = transform or (lambda x: x)
+    overlap = np.zeros((len(dst), len(src)))
+    for shift in shifts:
+        lo = np.maximum(d_edges[:-1, None], s_edges[None, :-1] + shift)
+        hi = np.minimum(d_edges[1:, None], s_edges[None, 1:] + shift)
+        overlap += np.where(hi > lo, f(hi) - f(lo), 0.0)
+    total = overlap.sum(axis=1, keepdims=True)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        overlap = np.where(total > 0, overlap / total, 0.0)
+    weights = np.zeros_like(overlap)
+    weights[np.ix_(d_order, s_order)] = overlap
+    return sp.csr_matrix(weights)
+
+
+def build_weights(src_lats, src_lons, dst_lats, dst_lons, method="bilinear"):
+    """Sparse (target cells, source cells) matrix for maps flattened in (lat, lon) order."""
+    period = 360.0 if is_periodic(src_lons) else None
+    src_lons = np.asarray(src_lons, dtype=np.float64) % 360
+    dst_lons = np.asarray(dst_lons, dtype=np.float64) % 360
+    if not period:
+        # Keep a regional grid contiguous across the 0/360 seam
+        ref = src_lons[0]
+        src_lons = ref + (src_lons - ref + 180) % 360 - 180
+        dst_lons = ref + (dst_lons - ref + 180) % 360 - 180
+    if method == "bilinear":
+        w_lat = linear_weights_1d(src_lats, dst_lats)
+        w_lon = linear_weights_1d(src_lons, dst_lons, period)
+    elif method == "conservative":
+        w_lat = overlap_weights_1d(src_lats, dst_lats, transform=lambda x: np.sin(np.radians(x)),
+                                   lower=-90, upper=90)
+        w_lon = overlap_weights_1d(src_lons, dst_lons, period=period)
+    else:
+        raise ValueError(f"Unknown regridding method {method!r}, expected one of {METHODS}")
+    return sp.kron(w_lat, w_lon, format="csr")
+
+
+def weights_key(src_lats, src_lons, dst_lats, dst_lons, method):
+    digest = hashlib.sha1(method.encode())
+    for coord in (src_lats, src_lons, dst_lats, dst_lons):
+        coord = np.ascontiguousarray(coord, dtype=np.float64)
+        digest.update(np.int64(len(coord)).tobytes())
+        digest.update(coord.tobytes())
+    return digest.hexdigest()[:16]
+
+
+def regrid_weights(src_lats, src_lons, dst_lats, dst_lons, method="bilinear", cache_dir=WEIGHTS_DIR):
+    """Weights for a grid pair, from memory, then disk, then built and stored."""
+    key = weights_key(src_lats, src_lons, dst_lats, dst_lons, method)
+    if key in _weights_cache:
+        return _weights_cache[key]
+    path = os.path.join(cache_dir, f"{method}_{key}.npz") if cache_dir else None
+    if path and os.path.exists(path):
+        weights = sp.load_npz(path).tocsr()
+    else:
+        weights = build_weights(src_lats, src_lons, dst_lats, dst_lons, method)
+        if path:
+            os.makedirs(cache_dir, exist_ok=True)
+            tmp_path = f"{path[:-4]}.tmp.npz"
+            sp.save_npz(tmp_path, weights)
+            os.replace(tmp_path, path)
+    _weights_cache[key] = weights
+    return weights
+
+
+def apply_weights(values, weights, dst_shape):
+    """Regrid (..., lat, lon) values with one sparse product; uncovered target points are NaN."""
+    values = np.asarray(values, dtype=np.float64)
+    lead_shape = values.shape[:-2]
+    flat = values.reshape(-1, values.shape[-2] * values.shape[-1])
+    out = (weights @ flat.T).T
+    out[:, np.diff(weights.indptr) == 0] = np.nan
+    return out.reshape(lead_shape + tuple(dst_shape))
+
+
+def same_grid(lats_a, lons_a, lats_b, lons_b):
+    return (np.shape(lats_a) == np.shape(lats_b) and np.shape(lons_a) == np.shape(lons_b)
+            and np.allclose(lats_a, lats_b) and np.allclose(np.asarray(lons_a) % 360, np.asarray(lons_b) % 360))
+
+
+def regrid_dataset(ds, dst_lats, dst_lons, fields=FIELDS, method="bilinear", cache_dir=WEIGHTS_DIR):
+    """Regrid the (..., lat, lon) fields of ds onto (dst_lats, dst_lons) in one sparse product."""
+    src_lats, src_lons = ds["lat"].values, ds["lon"].values
+    coords = {"lat": np.asarray(dst_lats), "lon": np.asarray(dst_lons)}
+    dims = ds[fields[0]].dims
+    lead_coords = {dim: ds[dim].values for dim in dims[:-2] if dim in ds.coords}
+    if same_grid(src_lats, src_lons, dst_lats, dst_lons):
+        stacked = np.stack([ds[field].values for field in fields]).astype(np.float64)
+    else:
+        weights = regrid_weights(src_lats, src_lons, dst_lats, dst_lons, method, cache_dir)
+        stacked = apply_weights(np.stack([ds[field].values for field in fields]), weights,
+                                (len(dst_lats), len(dst_lons)))
+    return xr.Dataset({field: (dims, stacked[k]) for k, field in enumerate(fields)},
+                      coords={**lead_coords, **coords})
+
+
+def padded(bounds, margin=MARGIN):
+    min_lon, max_lon, min_lat, max_lat = bounds
+    return (min_lon - margin, max_lon + margin, min_lat - margin, max_lat + margin)
+
+
+def forecast_differences(date, models, lead_steps, fields=FIELDS, archive_dir=ARCHIVE_DIR, bounds=None,
+                         method="bilinear", cache_dir=WEIGHTS_DIR, diff=True):
+    """Forecast minus ERA5 on the ERA5 grid for every model and lead step of one init date.
+
+    Returns (differences, truth): a Dataset of the fields with dims (model, lead,
+    lat, lon) and the ERA5 Dataset (lead, lat, lon) they were taken against.
+    With diff=False the regridded forecasts themselves are returned instead of
+    the differences. Models without a processed file are left out with a warning.
+    """
+    lead_steps = list(lead_steps)
+    with open_processed(date, TRUTH, archive_dir, bounds) as ds:
+        truth = ds[fields].isel(time=lead_steps).rename(time="lead").assign_coords(lead=lead_steps).load()
+    lats, lons = truth["lat"].values, truth["lon"].values
+    diffs = {}
+    for model in models:
+        try:
+            ds = open_processed(date, model, archive_dir, None if bounds is None else padded(bounds))
+        except FileNotFoundError:
+            print(f"Warning: no processed file for {model} initialized {date}. Skipping the model.")
+            continue
+        with ds:
+            fc = ds[fields].isel(time=lead_steps).rename(time="lead").assign_coords(lead=lead_steps)
+            regridded = regrid_dataset(fc.load(), lats, lons, fields, method, cache_dir)
+            diffs[model] = regridded - truth if diff else regridded
+    if not diffs:
+        return None, truth
+    return xr.concat(list(diffs.values()), dim="model").assign_coords(model=list(diffs)), truth
+
+
+def forecast_ar_mask(date, model, lead_step, lats, lons, archive_dir=ARCHIVE_DIR, method="bilinear",
+                     cache_dir=WEIGHTS_DIR):
+    """Fraction of AR cover of the forecast at one lead step, on the (lats, lons) grid."""
+    with xr.open_dataset(mask_path(date, model, archive_dir)) as ds:
+        masks = ds["class_masks"].isel(time=lead_step)
+        mask = xr.Dataset({"ar_mask": (("lat", "lon"), ar_mask(masks.values).astype(np.float64))},
+                          coords={"lat": masks["lat"].values, "lon": masks["lon"].values})
+    if model == "fourcastnet":
+        mask = mask.isel(lat=slice(0, -1))
+    if len(mask["lat"]) and not same_grid(mask["lat"].values, mask["lon"].values, lats, lons):
+        mask = subset_region(mask, padded((lons.min() % 360, lons.max() % 360, lats.min(), lats.max())))
+    return regrid_dataset(mask, lats, lons, ["ar_mask"], method, cache_dir)["ar_mask"]
+
+
+def psl_scale(psl):
+    """Factor that puts sea-level pressure in hPa (the fig4 contour levels)."""
+    units = str(psl.attrs.get("units", "")).lower()
+    return 0.01 if units == "pa" or float(np.nanmedian(psl.values)) > 2000 else 1.0
+
+
+def combined_dataset(fields, mask, scale):
+    """The fig_4 file layout: 2-D fields and ar_mask on -180..180 longitudes."""
+    ds = fields.copy()
+    ds["PSL"] = ds["PSL"] * scale
+    ds["ar_mask"] = mask
+    ds = ds.assign_coords(lon=(ds["lon"].values + 180) % 360 - 180)
+    return ds.sortby("lon")
+
+
+def init_and_step(valid_time, lead_days, steps_per_day=4, catalog=None):
+    """Init date (YYYYMMDD) and lead step of a forecast valid at valid_time (YYYYMMDD_HH).
+
+    With a Catalog the step is looked up in ERA5's time axis (KeyError if the
+    archive holds no such forecast).
+    """
+    if catalog is not None:
+        return catalog.init_and_step(valid_time, lead_days, TRUTH)
+    valid_dt = datetime.strptime(valid_time, "%Y%m%d_%H")
+    init_dt = valid_dt - timedelta(days=lead_days)
+    return init_dt.strftime("%Y%m%d"), lead_days * steps_per_day + valid_dt.hour // (24 // steps_per_day)
+
+
+def write_combined(valid_time, lead_days, models, out_dir="./data/fig_4", archive_dir=ARCHIVE_DIR, bounds=FIG4_BOUNDS,
+                   method="bilinear", cache_dir=WEIGHTS_DIR, catalog=None, diff=True):
+    """Write ``{model}_combined.nc`` (forecast minus ERA5, or the forecast on the ERA5 grid with
+    diff=False) for each model and ``ERA5_combined.nc``."""
+    date, step = init_and_step(valid_time, lead_days, catalog=catalog)
+    diffs, truth = forecast_differences(date, models, [step], archive_dir=archive_dir, bounds=bounds,
+                                        method=method, cache_dir=cache_dir, diff=diff)
+    lats, lons = truth["lat"].values, truth["lon"].values
+    scale = psl_scale(truth["PSL"])
+    os.makedirs(out_dir, exist_ok=True)
+    era5_mask = forecast_ar_mask(date, TRUTH, step, lats, lons, archive_dir, method, cache_dir)
+    combined_dataset(truth.sel(lead=step, drop=True), era5_mask, scale).to_netcdf(
+        os.path.join(out_dir, f"{TRUTH}_combined.nc"))
+    for model in ([] if diffs is None else diffs["model"].values):
+        mask = forecast_ar_mask(date, model, step, lats, lons, archive_dir, method, cache_dir)
+        combined_dataset(diffs.sel(model=model, lead=step, drop=True), mask, scale).to_netcdf(
+            os.path.join(out_dir, f"{model}_combined.nc"))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Write the fig_4 forecast-minus-ERA5 files on the ERA5 grid.")
+    parser.add_argument("valid_time", help="YYYYMMDD_HH")
+    parser.add_argument("lead_days", type=int)
+    parser.add_argument("--models", nargs="+", required=True)
+    parser.add_argument("--method", choices=METHODS, default="bilinear")
+    parser.add_argument("--archive-dir", default=ARCHIVE_DIR)
+    parser.add_argument("--weights-dir", default=WEIGHTS_DIR)
+    parser.add_argument("--out-dir", default="./data/fig_4")
+    parser.add_argument("--catalog", help="archive catalog from python -m arverify.catalog")
+    parser.add_argument("--absolute", action="store_true", help="write the regridded forecasts, not their differences")
+    args = parser.parse_args(argv)
+    catalog = None
+    if args.catalog:
+        from arverify.catalog import Catalog
+        catalog = Catalog.load(args.catalog)
+    write_combined(args.valid_time, args.lead_days, args.models, args.out_dir, args.archive_dir,
+                   method=args.method, cache_dir=args.weights_dir, catalog=catalog, diff=not args.absolute)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,139 @@
+"""Declared layouts of the array stores, checked when a store is opened.
+
+A store is a directory holding an ``index.json`` and one ``.npy`` file per
+array (arverify/cube.py, arverify/ragged.py, arverify/objects.py). Each layout
+below names:
+
+* the index keys and their JSON types
+* every array's allowed dtypes and its shape
+
+A shape is given in terms of index entries, where an int is a size and a list
+gives its length, plus free names that must agree between arrays, e.g. the
+ragged store's ``values`` and ``case_ids``. ``open_store`` checks all of this
+before any data is read. The arrays are memory-mapped with
+``allow_pickle=False``, so opening a store never runs code from the file. A
+file that does not match raises SchemaError naming the file and the problem.
+
+Stores written before the layouts had a version have no "format" / "version"
+entries and are read as version 1.
+"""
+import json
+import os
+
+import numpy as np
+
+INDEX_FILE = "index.json"
+FORMAT_VERSION = 1
+
+CUBE = {
+    "format": "metric_cube",
+    "index": {"variables": list, "models": list, "present": list, "n_cases": int, "n_leads": int},
+    "optional": {"dates": list},
+    "arrays": {
+        "values": (("float32", "float64"), ("variables", "models", "n_cases", "n_leads")),
+    },
+}
+
+RAGGED = {
+    "format": "ragged_leads",
+    "index": {"dates": list, "n_leads": int},
+    "arrays": {
+        "values": (("float32", "float64"), ("n_values",)),
+        "offsets": (("int64",), ("n_leads+1",)),
+        "case_ids": (("int32",), ("n_values",)),
+    },
+}
+
+OBJECT_COLUMNS = {
+    "case": "int32", "time": "int32", "track": "int32",
+    "lat": "float64", "lon": "float64", "x": "float64", "y": "float64", "z": "float64",
+    "cells": "int32", "area_km2": "float64",
+    "lat_min": "float32", "lat_max": "float32", "lon_min": "float32", "lon_max": "float32",
+    "peak_iwv": "float32", "landfall_lat": "float64",
+}
+
+OBJECTS = {
+    "format": "ar_objects",
+    "index": {"dates": list, "missing": list, "model": str, "coast": str, "n_leads": int},
+    "arrays": {
+        "case_offsets": (("int64",), ("dates+1",)),
+        **{name: ((dtype,), ("n_objects",)) for name, dtype in OBJECT_COLUMNS.items()},
+    },
+}
+
+
+class SchemaError(ValueError):
+    """A store on disk does not match its declared layout."""
+
+
+def stamp(index, schema):
+    """index with the layout's format name and version added, for writing."""
+    return {"format": schema["format"], "version": FORMAT_VERSION, **index}
+
+
+def read_index(path, schema):
+    index_path = os.path.join(path, INDEX_FILE)
+    try:
+        with open(index_path) as f:
+            index = json.load(f)
+    except json.JSONDecodeError as err:
+        raise SchemaError(f"{index_path}: not valid JSON ({err})") from None
+    if not isinstance(index, dict):
+        raise SchemaError(f"{index_path}: expected a JSON object")
+    if index.get("format", schema["format"]) != schema["format"]:
+        raise SchemaError(f"{index_path}: a {index['format']} store, expected {schema['format']}")
+    if index.get("version", 1) > FORMAT_VERSION:
+        raise SchemaError(f"{index_path}: format version {index['version']} is newer than this code "
+                          f"reads ({FORMAT_VERSION})")
+    for key, kind in schema["index"].items():
+        if key not in index:
+            raise SchemaError(f"{index_path}: missing {key!r}")
+        if not isinstance(index[key], kind) or isinstance(index[key], bool):
+            raise SchemaError(f"{index_path}: {key!r} should be a {kind.__name__}")
+    for key, kind in schema.get("optional", {}).items():
+        if key in index and not isinstance(index[key], kind):
+            raise SchemaError(f"{index_path}: {key!r} should be a {kind.__name__}")
+    return index
+
+
+def dimension_size(dim, index, bound):
+    """Size of a shape entry: an index entry (int, or list length), 'name+1', or a free name bound so far."""
+    if dim.endswith("+1"):
+        size = dimension_size(dim[:-2], index, bound)
+        return None if size is None else size + 1
+    if dim in index:
+        return len(index[dim]) if isinstance(index[dim], list) else index[dim]
+    return bound.get(dim)
+
+
+def open_array(path, name, dtypes, shape, index, bound, mmap=True):
+    """Memory-map one array of a store and check its dtype and shape."""
+    array_path = os.path.join(path, f"{name}.npy")
+    if not os.path.exists(array_path):
+        raise SchemaError(f"{array_path}: missing")
+    try:
+        array = np.load(array_path, mmap_mode="r" if mmap else None, allow_pickle=False)
+    except ValueError as err:
+        raise SchemaError(f"{array_path}: {err}") from None
+    if array.dtype.name not in dtypes:
+        raise SchemaError(f"{array_path}: dtype {array.dtype}, expected {' or '.join(dtypes)}")
+    if array.ndim != len(shape):
+        raise SchemaError(f"{array_path}: {array.ndim} dimensions, expected {len(shape)} {shape}")
+    for dim, size in zip(shape, array.shape):
+        expected = dimension_size(dim, index, bound)
+        if expected is None:
+            bound[dim] = size
+        elif size != expected:
+            raise SchemaError(f"{array_path}: {dim} is {size}, expected {expected} (shape {array.shape})")
+    return array
+
+
+def open_store(path, schema, mmap=True):
+    """(index, {name: array}) of a store, checked against schema; arrays are read-only memmaps."""
+    if not os.path.isdir(path):
+        raise FileNotFoundError(path)
+    index = read_index(path, schema)
+    bound = {}
+    arrays = {name: open_array(path, name, dtypes, shape, index, bound, mmap)
+              for name, (dtypes, shape) in schema["arrays"].items()}
+    return index, arrays
@@ -0,0 +1,205 @@
+"""RMSE and bias of the processed forecasts against ERA5, written in the fig_1 format.
+
+fig1.py reads one pickle per metric (``{VAR}_RMSE.pickle`` and ``TMQ_bias.pickle``),
+each a dict mapping model name to a (case x 41) array. This module rebuilds those
+files from the per-init processed archive:
+
+    python -m arverify.scores 20231101 20240331 --out-dir ./data/fig_1 [--cube ./data/fig_1/metrics_cube]
+
+Every grid cell counts the same; ``--area-weighted`` weights them by cos(lat),
+as ``python -m arverify.regions --area-weighted`` does for its regions.
+
+Cases are read in batches of init dates; within a batch every score is a single
+NumPy reduction over the (case, lead, lat, lon) block, and the ERA5 block is
+loaded once and shared by all models.
+"""
+import argparse
+import os
+import pickle
+import warnings
+from datetime import datetime, timedelta
+
+import numpy as np
+import xarray as xr
+
+from arverify.regiondefs import USWC_BOUNDS
+
+ARCHIVE_DIR = "/glade/campaign/univ/ucub0156/runs"
+N_LEADS = 41  # 0 - 10 days at 6-hourly steps
+TRUTH = "ERA5"
+MODELS = ["fourcastnet", "fourcastnetv2", "graphcast", "panguweather", "tigge", "graphcast37", "aurora"]
+FIELDS = ["TMQ", "PSL", "U850", "V850"]
+RMSE_VARIABLES = ["TMQ", "PSL", "U850", "V850", "WIND850"]
+BIAS_VARIABLES = ["TMQ"]
+
+
+def metric_names():
+    """File stems fig1.py reads, e.g. ``TMQ_RMSE`` and ``TMQ_bias``."""
+    return [f"{var}_RMSE" for var in RMSE_VARIABLES] + [f"{var}_bias" for var in BIAS_VARIABLES]
+
+
+def date_range(start, end):
+    """Daily init dates from start to end inclusive, as YYYYMMDD strings."""
+    start_dt = datetime.strptime(start, "%Y%m%d")
+    end_dt = datetime.strptime(end, "%Y%m%d")
+    return [(start_dt + timedelta(days=i)).strftime("%Y%m%d") for i in range((end_dt - start_dt).days + 1)]
+
+
+def processed_path(date, model, archive_dir=ARCHIVE_DIR):
+    return os.path.join(archive_dir, "processed", date, model, f"{model}.nc")
+
+
+def subset_region(ds, bounds=USWC_BOUNDS):
+    """Cut ds down to a lon/lat box; longitudes are compared on 0-360."""
+    min_lon, max_lon, min_lat, max_lat = bounds
+    lon = ds["lon"].values % 360
+    lat = ds["lat"].values
+    return ds.isel(lon=(lon >= min_lon) & (lon <= max_lon), lat=(lat >= min_lat) & (lat <= max_lat))
+
+
+def open_processed(date, model, archive_dir=ARCHIVE_DIR, bounds=USWC_BOUNDS):
+    ds = xr.open_dataset(processed_path(date, model, archive_dir))
+    if model == "fourcastnet":
+        ds = ds.isel(lat=slice(0, -1))  # FourCastNet carries one extra latitude row
+    if bounds is not None:
+        ds = subset_region(ds, bounds)
+    return ds
+
+
+def load_cases(dates, model, fields=FIELDS, archive_dir=ARCHIVE_DIR, bounds=USWC_BOUNDS, n_leads=N_LEADS):
+    """Stack the processed fields of several init dates into (case, lead, lat, lon) arrays.
+
+    Missing files and trajectories shorter than n_leads are left as NaN.
+    Returns a dict of field name -> float32 array, or None if no file was found.
+    """
+    out = None
+    for case, date in enumerate(dates):
+        try:
+            ds = open_processed(date, model, archive_dir, bounds)
+        except FileNotFoundError:
+            print(f"Warning: no processed file for {model} initialized {date}. Leaving the case as NaN.")
+            continue
+        with ds:
+            n = min(ds.sizes["time"], n_leads)
+            if out is None:
+                shape = (len(dates), n_leads, ds.sizes["lat"], ds.sizes["lon"])
+                out = {field: np.full(shape, np.nan, dtype=np.float32) for field in fields}
+            for field in fields:
+                out[field][case, :n] = ds[field].values[:n]
+    return out
+
+
+def rmse_and_bias(forecast, truth, weights=None):
+    """RMSE and mean error over the trailing (lat, lon) axes.
+
+    forecast and truth are (..., lat, lon); weights, if given, broadcasts against
+    (lat, lon). Grid points that are NaN in either input are ignored, and an
+    all-NaN map gives NaN rather than a warning.
+    """
+    err = forecast.astype(np.float64) - truth
+    valid = ~np.isnan(err)
+    err = np.where(valid, err, 0.0)
+    w = valid if weights is None else valid * np.asarray(weights, dtype=np.float64)
+    axes = (-2, -1)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        total = w.sum(axis=axes)
+        rmse = np.sqrt((w * err ** 2).sum(axis=axes) / total)
+        bias = (w * err).sum(axis=axes) / total
+    return rmse, bias
+
+
+def score_cases(forecast, truth, weights=None):
+    """All fig_1 metrics for one batch, as a dict of name -> (case, lead) array."""
+    scores = {}
+    for var in FIELDS:
+        rmse, bias = rmse_and_bias(forecast[var], truth[var], weights)
+        if var in RMSE_VARIABLES:
+            scores[f"{var}_RMSE"] = rmse
+        if var in BIAS_VARIABLES:
+            scores[f"{var}_bias"] = bias
+    if "WIND850" in RMSE_VARIABLES:
+        # Error in wind speed, not vector wind error
+        speed_fc = np.hypot(forecast["U850"], forecast["V850"])
+        speed_truth = np.hypot(truth["U850"], truth["V850"])
+        scores["WIND850_RMSE"] = rmse_and_bias(speed_fc, speed_truth, weights)[0]
+    return scores
+
+
+def compute_fig1_metrics(dates, models=MODELS, archive_dir=ARCHIVE_DIR, bounds=USWC_BOUNDS,
+                         batch_size=16, weights=None):
+    """Score every model against ERA5 for every init date.
+
+    Returns {metric name: {model: (len(dates), N_LEADS) array}}, the layout of the
+    fig_1 pickles. Models with no data at all are left out of the result, like
+    fig1.py expects.
+    """
+    metrics = {name: {model: np.full((len(dates), N_LEADS), np.nan) for model in models}
+               for name in metric_names()}
+    found = set()
+    for start in range(0, len(dates), batch_size):
+        batch = dates[start:start + batch_size]
+        cases = slice(start, start + len(batch))
+        truth = load_cases(batch, TRUTH, archive_dir=archive_dir, bounds=bounds)
+        if truth is None:
+            continue
+        for model in models:
+            forecast = load_cases(batch, model, archive_dir=archive_dir, bounds=bounds)
+            if forecast is None:
+                continue
+            if forecast["TMQ"].shape[-2:] != truth["TMQ"].shape[-2:]:
+                warnings.warn(f"{model} grid {forecast['TMQ'].shape[-2:]} does not match {TRUTH} "
+                              f"{truth['TMQ'].shape[-2:]}; skipping dates {batch[0]}-{batch[-1]}.")
+                continue
+            found.add(model)
+            for name, values in score_cases(forecast, truth, weights).items():
+                metrics[name][model][cases] = values
+    return {name: {model: arr for model, arr in per_model.items() if model in found}
+            for name, per_model in metrics.items()}
+
+
+def write_fig1_pickles(metrics, out_dir="./data/fig_1", dates=None):
+    """Write one pickle per metric, plus the init dates of the cases (arverify/cases.py) when given.
+
+    A metrics_cube already in out_dir is rewritten from the same metrics, so it
+    never outlives the pickles; its path is returned (None if there is none).
+    """
+    os.makedirs(out_dir, exist_ok=True)
+    for name, per_model in metrics.items():
+        with open(os.path.join(out_dir, f"{name}.pickle"), "wb") as handle:
+            pickle.dump(per_model, handle)
+    if dates is not None:
+        from arverify.cases import write_dates
+        write_dates(out_dir, dates)
+    from arverify.cube import refresh_cube
+    return refresh_cube(out_dir, metrics, dates)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Rebuild the fig_1 RMSE/bias pickles from the processed archive.")
+    parser.add_argument("start", help="first init date, YYYYMMDD")
+    parser.add_argument("end", help="last init date, YYYYMMDD")
+    parser.add_argument("--models", nargs="+", default=MODELS)
+    parser.add_argument("--archive-dir", default=ARCHIVE_DIR)
+    parser.add_argument("--out-dir", default="./data/fig_1")
+    parser.add_argument("--batch-size", type=int, default=16)
+    parser.add_argument("--cube", help="also write a memory-mapped metric cube to this directory")
+    parser.add_argument("--area-weighted", action="store_true", help="weight grid cells by cos(lat)")
+    args = parser.parse_args(argv)
+
+    dates = date_range(args.start, args.end)
+    weights = None
+    if args.area_weighted:
+        from arverify.regions import archive_grid
+
+        grid = archive_grid(dates, USWC_BOUNDS, args.archive_dir)
+        weights = None if grid is None else np.cos(np.radians(grid[0]))[:, None]
+    metrics = compute_fig1_metrics(dates, args.models, archive_dir=args.archive_dir, batch_size=args.batch_size,
+                                   weights=weights)
+    refreshed = write_fig1_pickles(metrics, args.out_dir, dates)
+    if args.cube and os.path.abspath(args.cube) != os.path.abspath(refreshed or ""):
+        from arverify.cube import write_cube
+        write_cube(args.cube, metrics, dates=dates)
+
+
+if __name__ == "__main__":
+    main()
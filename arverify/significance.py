@@ -0,0 +1,209 @@
+"""Paired significance tests of the score differences between models, for every lead at once.
+
+The error bands in fig1.py and fig3.py are drawn per model, so two overlapping
+bands say little about whether one model beats another on the same cases. Here
+each pair of models is compared on the init dates both have. For every
+(variable, pair, lead) the tests are:
+
+* a sign-flip permutation test of the mean difference, and
+* a Diebold-Mariano test with a Bartlett (Newey-West) long-run variance and
+  the Harvey-Leybourne-Newbold small-sample correction.
+
+The differences of every variable, pair and lead are stacked as the columns of
+one (case x test) matrix. All permutations are then a single product of that
+matrix with an (n_perm x case) matrix of random signs. The signs are drawn
+per block of consecutive cases, as in arverify/bootstrap.py, so the
+autocorrelation between neighbouring init dates is kept. The DM variance
+loops over the few autocovariance lags only. For 6 variables, 15 pairs and
+41 leads this is 3690 tests from one product.
+
+    python -m arverify.significance ./data/fig_1 --reference tigge --out ./data/fig_1/significance.npz
+
+fig1.py marks the leads where a model differs significantly from a reference
+model with ``python -m arverify fig1 --significance tigge``. fig3.py does the
+same from the per-case CSI / POD / FAR of ``python -m arverify.contingency
+--per-case`` with ``python -m arverify fig3 --significance tigge``.
+"""
+import argparse
+import itertools
+import os
+
+import numpy as np
+
+from arverify.bootstrap import default_block_length
+
+TESTS = ("permutation", "dm")
+
+
+def align_cases(per_model, dates=None):
+    """Stack {model: (case, lead)} arrays on the cases every model has.
+
+    dates maps model -> init dates of its rows. Without it, rows are matched by
+    position and cut to the shortest model. Returns (models, (model, case, lead)
+    array, the shared dates or None).
+    """
+    models = list(per_model)
+    if dates is None:
+        n_cases = min(np.shape(per_model[model])[0] for model in models)
+        stack = np.stack([np.asarray(per_model[model], dtype=np.float64)[:n_cases] for model in models])
+        return models, stack, None
+    shared = sorted(set.intersection(*(set(dates[model]) for model in models)))
+    rows = {model: {date: k for k, date in enumerate(dates[model])} for model in models}
+    stack = np.stack([np.asarray(per_model[model], dtype=np.float64)[[rows[model][d] for d in shared]]
+                      for model in models])
+    return models, stack, shared
+
+
+def model_pairs(models, reference=None):
+    """Every unordered pair of models, or each model against reference."""
+    if reference is not None:
+        return [(model, reference) for model in models if model != reference]
+    return list(itertools.combinations(models, 2))
+
+
+def sign_matrix(n_perm, n_cases, block_length, rng):
+    """(n_perm, n_cases) matrix of +/-1, constant over blocks of block_length consecutive cases."""
+    n_blocks = -(-n_cases // block_length)
+    signs = rng.choice(np.array([-1.0, 1.0]), size=(n_perm, n_blocks))
+    return np.repeat(signs, block_length, axis=1)[:, :n_cases]
+
+
+def permutation_pvalues(diffs, n_perm=10000, block_length=None, seed=0):
+    """Two-sided sign-flip p-values of the mean of every column of a (case x test) matrix; NaNs are left out."""
+    diffs = np.asarray(diffs, dtype=np.float64)
+    valid = ~np.isnan(diffs)
+    filled = np.where(valid, diffs, 0.0)
+    n_cases = diffs.shape[0]
+    if block_length is None:
+        block_length = default_block_length(n_cases)
+    rng = np.random.default_rng(seed)
+    # The count of valid cases per column is fixed under sign flips, so sums rank like means
+    observed = np.abs(filled.sum(axis=0))
+    permuted = np.abs(sign_matrix(n_perm, n_cases, block_length, rng) @ filled)
+    exceed = np.sum(permuted >= observed * (1 - 1e-12), axis=0)
+    p = (exceed + 1) / (n_perm + 1)
+    return np.where(valid.sum(axis=0) > 1, p, np.nan)
+
+
+def diebold_mariano(diffs, lags=None):
+    """DM statistic and two-sided p-value of every column of a (case x test) matrix.
+
+    The long-run variance uses a Bartlett kernel over lags (default n ** (1/3))
+    and the statistic gets the Harvey-Leybourne-Newbold correction with a
+    Student t reference distribution. NaNs are left out.
+    """
+    from scipy import stats
+
+    diffs = np.asarray(diffs, dtype=np.float64)
+    valid = ~np.isnan(diffs)
+    n = valid.sum(axis=0).astype(np.float64)
+    if lags is None:
+        lags = default_block_length(diffs.shape[0])
+    with np.errstate(invalid="ignore", divide="ignore"):
+        mean = np.where(valid, diffs, 0.0).sum(axis=0) / n
+        centred = np.where(valid, diffs - mean, 0.0)
+        variance = (centred ** 2).sum(axis=0) / n
+        for k in range(1, lags + 1):
+            gamma = (centred[k:] * centred[:-k]).sum(axis=0) / n
+            variance += 2 * (1 - k / (lags + 1)) * gamma
+        h = lags + 1
+        correction = np.sqrt(np.maximum(n + 1 - 2 * h + h * (h - 1) / n, 0) / n)
+        stat = correction * mean / np.sqrt(variance / n)
+        p = 2 * stats.t.sf(np.abs(stat), df=np.maximum(n - 1, 1))
+    usable = (n > h) & (variance > 0)
+    return np.where(usable, stat, np.nan), np.where(usable, p, np.nan)
+
+
+def paired_tests(matrices, pairs=None, reference=None, dates=None, n_perm=10000, block_length=None, lags=None,
+                 seed=0):
+    """Both tests for every variable, model pair and lead.
+
+    matrices is {variable: {model: (case, lead) array}}; dates, if given, is
+    {model: init dates of its rows}. pairs defaults to ``model_pairs`` of the
+    models present in every variable. Returns a dict of arrays shaped
+    (variable, pair, lead): "mean_diff" (first minus second model),
+    "permutation" and "dm" p-values, "dm_stat" and "n_cases", plus the
+    "variables" and "pairs" labels.
+    """
+    variables = list(matrices)
+    if pairs is None:
+        common = [model for model in matrices[variables[0]] if all(model in matrices[v] for v in variables)]
+        pairs = model_pairs(common, reference)
+    if not pairs:
+        raise ValueError("No model pairs to test: every variable needs at least two of the models.")
+    columns = []
+    for var in variables:
+        models, stack, _ = align_cases(matrices[var], dates)
+        where = {model: k for k, model in enumerate(models)}
+        columns.append(np.stack([stack[where[a]] - stack[where[b]] for a, b in pairs], axis=-1))  # case, lead, pair
+    n_cases = max(c.shape[0] for c in columns)
+    n_leads = max(c.shape[1] for c in columns)
+    # (case, variable, pair, lead) with shorter variables padded by NaN cases, then one column per test
+    diffs = np.full((n_cases, len(variables), len(pairs), n_leads), np.nan)
+    for v, c in enumerate(columns):
+        diffs[:c.shape[0], v, :, :c.shape[1]] = c.transpose(0, 2, 1)
+    flat = diffs.reshape(n_cases, -1)
+    shape = diffs.shape[1:]
+    dm_stat, dm_p = diebold_mariano(flat, lags)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        mean_diff = np.nansum(flat, axis=0) / np.sum(~np.isnan(flat), axis=0)
+    return {
+        "variables": variables,
+        "pairs": list(pairs),
+        "mean_diff": mean_diff.reshape(shape),
+        "n_cases": np.sum(~np.isnan(flat), axis=0).reshape(shape),
+        "permutation": permutation_pvalues(flat, n_perm, block_length, seed).reshape(shape),
+        "dm": dm_p.reshape(shape),
+        "dm_stat": dm_stat.reshape(shape),
+    }
+
+
+def significance_mask(results, test="permutation", alpha=0.05):
+    """(variable, pair, lead) boolean mask of the differences significant at alpha; NaN p-values are False."""
+    p = results[test]
+    return np.where(np.isnan(p), False, p < alpha)
+
+
+def save_results(results, path, test="permutation", alpha=0.05):
+    """Write the results and their mask as an .npz (labels as string arrays)."""
+    arrays = {key: value for key, value in results.items() if key not in ("variables", "pairs")}
+    np.savez(path, variables=np.array(results["variables"]), pairs=np.array(results["pairs"]),
+             mask=significance_mask(results, test, alpha), alpha=alpha, test=test, **arrays)
+
+
+def main(argv=None):
+    from arverify.cube import load_fig1_pickles, open_cube
+
+    parser = argparse.ArgumentParser(description="Paired permutation and Diebold-Mariano tests of the fig_1 scores.")
+    parser.add_argument("data_dir", nargs="?", default="./data/fig_1")
+    parser.add_argument("--models", nargs="+", help="default: every model in the files")
+    parser.add_argument("--reference", help="test each model against this one instead of every pair")
+    parser.add_argument("--test", choices=TESTS, default="permutation")
+    parser.add_argument("--alpha", type=float, default=0.05)
+    parser.add_argument("--n-perm", type=int, default=10000)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--out", help="write the results and mask to this .npz")
+    args = parser.parse_args(argv)
+
+    cube_path = os.path.join(args.data_dir, "metrics_cube")
+    if os.path.isdir(cube_path):
+        cube = open_cube(cube_path)
+        metrics = {name: dict(cube.variable(name)) for name in cube.variables}
+    else:
+        metrics = load_fig1_pickles(args.data_dir)
+    if args.models:
+        metrics = {name: {model: per_model[model] for model in args.models if model in per_model}
+                   for name, per_model in metrics.items()}
+    results = paired_tests(metrics, reference=args.reference, n_perm=args.n_perm, seed=args.seed)
+    mask = significance_mask(results, args.test, args.alpha)
+    for v, variable in enumerate(results["variables"]):
+        for k, (a, b) in enumerate(results["pairs"]):
+            leads = np.flatnonzero(mask[v, k])
+            better = np.sum(results["mean_diff"][v, k][leads] < 0)
+            print(f"{variable:<14} {a} - {b}: {len(leads):2d} significant leads, {better} with {a} lower")
+    if args.out:
+        save_results(results, args.out, args.test, args.alpha)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,255 @@
+"""Mergeable t-digest quantile sketches for the fig2 box plots.
+
+``ax.boxplot`` sorts the pooled errors of every window it draws. A t-digest
+keeps a few hundred weighted centroids per (model, lead) instead; merging the
+digests of the leads in a window gives that window's quantiles, and new cases
+are folded into a lead's digest without revisiting old ones.
+
+The quantiles are approximate: on the shipped data the box edges and whiskers
+of a window can be a few tenths of a degree off. fig2.py therefore uses the
+sketches only from a persisted ``landfall_sketches.npz``, when the errors
+themselves are not read. Whenever it loads the errors, it computes the exact
+statistics with ``matplotlib.cbook.boxplot_stats``.
+
+Compression is done in bulk: centroids are sorted once, placed on the arcsine
+scale k(q) = delta / (2 pi) * asin(2q - 1), and every centroid that falls in the
+same unit of k is merged with one ``bincount``. Buckets are narrow near the
+tails and wide near the median, which is the usual t-digest accuracy profile.
+
+A ``SketchStore`` records the init dates each model's digests hold, so
+``--update`` skips cases already folded in (pickles without case dates can
+only start a model), and the modification time of the errors they were built
+from, so fig2.py can ignore sketches that are older than the errors.
+
+Build or extend the per-lead sketches fig2.py picks up:
+
+    python -m arverify.sketch ./data/fig_2/landfall_sketches.npz ./data/fig_2 --models tigge graphcast37
+    python -m arverify.sketch ./data/fig_2/landfall_sketches.npz ./new_cases/fig_2 --models tigge --update
+"""
+import argparse
+import os
+
+import numpy as np
+
+
+class TDigest:
+    def __init__(self, delta=300, means=None, weights=None, vmin=np.inf, vmax=-np.inf):
+        self.delta = delta
+        self.means = np.zeros(0) if means is None else np.asarray(means, dtype=np.float64)
+        self.weights = np.zeros(0) if weights is None else np.asarray(weights, dtype=np.float64)
+        self.vmin = float(vmin)
+        self.vmax = float(vmax)
+
+    @classmethod
+    def from_values(cls, values, delta=300):
+        digest = cls(delta)
+        digest.update(values)
+        return digest
+
+    @property
+    def count(self):
+        return float(self.weights.sum())
+
+    def update(self, values):
+        """Fold raw values into the digest (NaNs are ignored)."""
+        values = np.asarray(values, dtype=np.float64).ravel()
+        values = values[~np.isnan(values)]
+        if values.size == 0:
+            return self
+        self.vmin = min(self.vmin, float(values.min()))
+        self.vmax = max(self.vmax, float(values.max()))
+        self._compress(np.concatenate([self.means, values]),
+                       np.concatenate([self.weights, np.ones(values.size)]))
+        return self
+
+    def merge(self, *others):
+        """A new digest holding this one and others."""
+        digests = (self,) + others
+        merged = TDigest(self.delta, vmin=min(d.vmin for d in digests), vmax=max(d.vmax for d in digests))
+        merged._compress(np.concatenate([d.means for d in digests]), np.concatenate([d.weights for d in digests]))
+        return merged
+
+    def _compress(self, means, weights):
+        if means.size == 0:
+            self.means, self.weights = means, weights
+            return
+        order = np.argsort(means, kind="stable")
+        means, weights = means[order], weights[order]
+        total = weights.sum()
+        q_mid = (np.cumsum(weights) - weights / 2) / total
+        k = self.delta / (2 * np.pi) * np.arcsin(2 * q_mid - 1)
+        bucket = np.floor(k - k[0]).astype(np.int64)
+        bucket = np.unique(bucket, return_inverse=True)[1]
+        merged_weights = np.bincount(bucket, weights=weights)
+        self.means = np.bincount(bucket, weights=weights * means) / merged_weights
+        self.weights = merged_weights
+
+    def _positions(self):
+        """Centroid means and cumulative-weight positions, padded with the exact min and max."""
+        centers = np.cumsum(self.weights) - self.weights / 2
+        return (np.concatenate([[self.vmin], self.means, [self.vmax]]),
+                np.concatenate([[0.0], centers, [self.count]]))
+
+    def quantile(self, q):
+        if self.count == 0:
+            return np.full(np.shape(q), np.nan)
+        values, positions = self._positions()
+        return np.interp(np.asarray(q) * self.count, positions, values)
+
+    def cdf(self, x):
+        if self.count == 0:
+            return np.full(np.shape(x), np.nan)
+        values, positions = self._positions()
+        return np.interp(x, values, positions) / self.count
+
+    def box_stats(self, whis=1.5):
+        """Box-plot statistics in the dict form ``Axes.bxp`` takes.
+
+        Whiskers follow ``Axes.boxplot``: the most extreme value within whis * IQR
+        of the box, approximated by the quantile at the fence's CDF position.
+        """
+        q1, med, q3 = self.quantile([0.25, 0.5, 0.75])
+        if self.count == 0:
+            return dict(med=med, q1=q1, q3=q3, whislo=np.nan, whishi=np.nan, fliers=[])
+        iqr = q3 - q1
+        lo_fence, hi_fence = q1 - whis * iqr, q3 + whis * iqr
+        whislo = self.vmin if self.vmin >= lo_fence else max(float(self.quantile(self.cdf(lo_fence))), lo_fence)
+        whishi = self.vmax if self.vmax <= hi_fence else min(float(self.quantile(self.cdf(hi_fence))), hi_fence)
+        return dict(med=med, q1=q1, q3=q3, whislo=min(whislo, q1), whishi=max(whishi, q3), fliers=[])
+
+
+def lead_sketches(errors, delta=300):
+    """One digest per lead step from a RaggedLeads store (or anything with lead(t) and len())."""
+    return [TDigest.from_values(errors.lead(t), delta) for t in range(len(errors))]
+
+
+def window_sketch(sketches, start, stop):
+    """Merge the digests of leads start .. stop-1 (clipped to the stored leads)."""
+    start = max(start, 0)
+    window = sketches[start:max(stop, start)]
+    if not window:
+        return TDigest()
+    return window[0].merge(*window[1:])
+
+
+def sliding_window_stats(sketches, window):
+    """Box statistics of the window ending at every lead step t = 1 .. len(sketches)."""
+    return [window_sketch(sketches, t - window, t).box_stats() for t in range(1, len(sketches) + 1)]
+
+
+class SketchStore:
+    """Per-model lists of lead digests, with the init dates each model has absorbed.
+
+    Digests cannot be taken apart again, so like arverify/moments.py the store
+    records which cases it holds (dates are absent for a model built from
+    undated pickles) and the newest modification time of each model's source.
+    """
+
+    def __init__(self, sketches=None, dates=None, source_mtimes=None):
+        self.sketches = dict(sketches or {})
+        self.dates = {model: set(value) for model, value in (dates or {}).items()}
+        self.source_mtimes = dict(source_mtimes or {})
+
+    @classmethod
+    def load(cls, path):
+        parts, dates, source_mtimes = {}, {}, {}
+        with np.load(path, allow_pickle=False) as f:
+            for key in f.files:
+                model, t, field = key.split("|")
+                if t == "dates":
+                    dates[model] = [str(date) for date in f[key]]
+                elif t == "source_mtime":
+                    source_mtimes[model] = int(f[key])
+                else:
+                    parts.setdefault(model, {}).setdefault(int(t), {})[field] = f[key]
+        # Stores written before source times were recorded count as built when they were saved
+        mtime = os.stat(path).st_mtime_ns
+        sketches = {model: [TDigest(p["meta"][0], p["means"], p["weights"], p["meta"][1], p["meta"][2])
+                            for _, p in sorted(leads.items())]
+                    for model, leads in parts.items()}
+        return cls(sketches, dates, {model: source_mtimes.get(model, mtime) for model in sketches})
+
+    def save(self, path):
+        arrays = {}
+        for model, sketches in self.sketches.items():
+            for t, digest in enumerate(sketches):
+                arrays[f"{model}|{t}|means"] = digest.means
+                arrays[f"{model}|{t}|weights"] = digest.weights
+                arrays[f"{model}|{t}|meta"] = np.array([digest.delta, digest.vmin, digest.vmax])
+            arrays[f"{model}|source_mtime|"] = np.int64(self.source_mtimes.get(model, 0))
+            if model in self.dates:
+                arrays[f"{model}|dates|"] = np.array(sorted(self.dates[model]), dtype="U8")
+        tmp_path = f"{path}.tmp.npz"
+        np.savez(tmp_path, **arrays)
+        os.replace(tmp_path, path)
+
+    def update(self, model, errors, delta=300, source_mtime=0):
+        """Fold the errors of a RaggedLeads into model's digests.
+
+        Cases whose init date is already in the store are skipped. Errors without
+        case dates can only start a model, and the lead count must match the
+        stored digests.
+        """
+        case_ids = np.asarray(errors.case_ids)
+        dated = bool(errors.dates) and not np.any(case_ids < 0)
+        # A case with no errors adds nothing to the digests, so only cases with values count as absorbed
+        has_values = np.zeros(len(errors.dates), dtype=bool)
+        if dated:
+            has_values[case_ids] = True
+        if model not in self.sketches:
+            self.sketches[model] = lead_sketches(errors, delta)
+            if dated:
+                self.dates[model] = {date for date, has in zip(errors.dates, has_values) if has}
+        else:
+            if not dated or model not in self.dates:
+                raise ValueError(f"Cannot add the errors of {model}: undated cases may already be in the sketches.")
+            if len(errors) != len(self.sketches[model]):
+                raise ValueError(f"{model}: the errors have {len(errors)} leads, the sketches "
+                                 f"{len(self.sketches[model])}.")
+            seen = self.dates[model]
+            keep = np.array([date not in seen for date in errors.dates], dtype=bool)
+            if np.any(has_values & ~keep):
+                print(f"Warning: skipping {int((has_values & ~keep).sum())} init dates already in the {model} "
+                      f"sketches.")
+            new = errors.subset_cases(keep)
+            for t, digest in enumerate(self.sketches[model]):
+                digest.update(new.lead(t))
+            seen.update(date for date, k in zip(errors.dates, keep & has_values) if k)
+        self.source_mtimes[model] = max(self.source_mtimes.get(model, 0), source_mtime)
+
+    def is_current(self, model, paths):
+        """True if none of paths (files or store directories) changed after model's sketches were built."""
+        from arverify.moments import newest_mtime
+
+        return all(newest_mtime(path) <= self.source_mtimes.get(model, 0) for path in paths)
+
+    def __contains__(self, model):
+        return model in self.sketches
+
+    def __getitem__(self, model):
+        return self.sketches[model]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Build or extend per-lead landfall-error sketches.")
+    parser.add_argument("sketch_path")
+    parser.add_argument("data_dir", help="directory with {model}_lat_landfall_error_degrees pickles or stores")
+    parser.add_argument("--models", nargs="+", required=True)
+    parser.add_argument("--update", action="store_true",
+                        help="fold the errors into the existing sketches, skipping init dates they already hold")
+    parser.add_argument("--delta", type=int, default=300)
+    args = parser.parse_args(argv)
+
+    from arverify.moments import newest_mtime
+    from arverify.ragged import load_landfall_errors
+
+    store = SketchStore.load(args.sketch_path) if args.update and os.path.exists(args.sketch_path) else SketchStore()
+    for model in args.models:
+        path = os.path.join(args.data_dir, f"{model}_lat_landfall_error_degrees")
+        path = path if os.path.isdir(path) else f"{path}.pkl"
+        store.update(model, load_landfall_errors(path), args.delta, newest_mtime(path))
+    store.save(args.sketch_path)
+
+
+if __name__ == "__main__":
+    main()
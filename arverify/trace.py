@@ -0,0 +1,203 @@
+"""Per-stage timings of the figure scripts, written as a Chrome trace.
+
+    ARVERIFY_TRACE=./fig1_trace.json python -m arverify fig1 --save ./fig_1.pdf
+    python -m arverify.trace ./fig1_trace.json
+
+When ARVERIFY_TRACE is set, every stage recorded by a figure script is kept
+as a trace event. The stages are load, compute, render and save, and they are
+split by figure, variable and model. Each event records:
+
+* wall time
+* CPU time, for this process and for reaped child processes (the bootstrap pool)
+* the process's peak resident set size at the end of the stage, and how much
+  the stage raised it
+* the bytes read during the stage (``rchar`` and ``read_bytes`` from
+  /proc/self/io, where available)
+
+The events are written to the named file when the interpreter exits.
+``ARVERIFY_TRACE=1`` (or ``true`` / ``yes``) writes
+``./arverify_trace_{pid}.json`` instead, and ``0``, ``false`` or ``no`` leave
+tracing off. The file
+opens in chrome://tracing or https://ui.perfetto.dev, and the measurements are
+in each event's "args".
+
+The "render" stages only build the artists. Matplotlib draws them in savefig,
+so at dpi=300 the rasterising time shows up under "save".
+
+When tracing is off, ``stage`` returns a shared no-op context manager
+and ``begin`` / ``end`` return immediately.
+"""
+import atexit
+import json
+import os
+import threading
+import time
+
+try:
+    import resource
+except ImportError:  # not on Windows
+    resource = None
+
+ENV_VAR = "ARVERIFY_TRACE"
+DEFAULT_PATH = "./arverify_trace_{pid}.json"
+OFF_VALUES = ("", "0", "false", "no")
+ON_VALUES = ("1", "true", "yes")  # trace to DEFAULT_PATH; any other value is the trace file's path
+ENABLED = os.environ.get(ENV_VAR, "").strip().lower() not in OFF_VALUES
+
+_events = []
+_open = []
+_origin = time.perf_counter()
+_registered = False
+
+
+class _NullStage:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+_NULL_STAGE = _NullStage()
+
+
+def peak_rss_bytes():
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if os.uname().sysname == "Darwin" else peak * 1024  # kilobytes on Linux
+
+
+def io_counters():
+    """{"rchar": ..., "read_bytes": ...} for this process, or {} where /proc/self/io is missing."""
+    try:
+        with open("/proc/self/io") as f:
+            fields = dict(line.split(":", 1) for line in f if ":" in line)
+    except OSError:
+        return {}
+    return {key: int(fields[key]) for key in ("rchar", "read_bytes") if key in fields}
+
+
+def snapshot():
+    times = os.times()
+    return {
+        "wall": time.perf_counter(),
+        "cpu": time.process_time(),
+        "children_cpu": times.children_user + times.children_system,
+        "peak_rss": peak_rss_bytes(),
+        "io": io_counters(),
+    }
+
+
+class Stage:
+    """One timed stage; use via ``stage`` or ``begin`` / ``end``."""
+
+    def __init__(self, name, args):
+        self.name = name
+        self.args = args
+        self.start = None
+
+    def __enter__(self):
+        self.start = snapshot()
+        return self
+
+    def __exit__(self, *exc):
+        record(self.name, self.args, self.start, snapshot())
+        return False
+
+
+def record(name, args, start, stop):
+    global _registered
+    measured = {
+        "wall_ms": round((stop["wall"] - start["wall"]) * 1000, 3),
+        "cpu_ms": round((stop["cpu"] - start["cpu"]) * 1000, 3),
+        "children_cpu_ms": round((stop["children_cpu"] - start["children_cpu"]) * 1000, 3),
+    }
+    if stop["peak_rss"] is not None:
+        measured["peak_rss_mb"] = round(stop["peak_rss"] / 2**20, 2)
+        measured["peak_rss_growth_mb"] = round((stop["peak_rss"] - start["peak_rss"]) / 2**20, 2)
+    for key in stop["io"]:
+        if key in start["io"]:
+            measured[f"{key}_delta" if key == "rchar" else key] = stop["io"][key] - start["io"][key]
+    _events.append({
+        "name": name,
+        "cat": args.get("figure", "arverify"),
+        "ph": "X",
+        "ts": round((start["wall"] - _origin) * 1e6, 1),
+        "dur": round((stop["wall"] - start["wall"]) * 1e6, 1),
+        "pid": os.getpid(),
+        "tid": threading.get_ident(),
+        "args": {**{key: str(value) for key, value in args.items()}, **measured},
+    })
+    if not _registered:
+        atexit.register(write_trace)
+        _registered = True
+
+
+def stage(name, **args):
+    """Context manager timing one stage, e.g. ``with stage("load", figure="fig3", model=name):``."""
+    if not ENABLED:
+        return _NULL_STAGE
+    return Stage(name, args)
+
+
+def begin(name, **args):
+    """Start a stage that ends at the next ``end()``. Use it when a ``with`` block would re-indent half a script."""
+    if not ENABLED:
+        return
+    _open.append(Stage(name, args).__enter__())
+
+
+def end():
+    """End the most recent stage started by ``begin``."""
+    if not ENABLED or not _open:
+        return
+    _open.pop().__exit__(None, None, None)
+
+
+def trace_path():
+    value = os.environ.get(ENV_VAR, "")
+    if value.strip().lower() in OFF_VALUES + ON_VALUES:
+        return DEFAULT_PATH.format(pid=os.getpid())
+    return value
+
+
+def write_trace(path=None):
+    """Write the recorded events as Chrome trace JSON; returns the path, or None if nothing was recorded."""
+    if not _events:
+        return None
+    path = path or trace_path()
+    directory = os.path.dirname(os.path.abspath(path))
+    os.makedirs(directory, exist_ok=True)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump({"traceEvents": _events, "displayTimeUnit": "ms"}, f, indent=1)
+    os.replace(tmp_path, path)
+    return path
+
+
+def summary(events=None):
+    """Total wall/CPU milliseconds per stage name, largest first, for a quick look without a viewer."""
+    totals = {}
+    for event in _events if events is None else events:
+        entry = totals.setdefault(event["name"], {"wall_ms": 0.0, "cpu_ms": 0.0, "count": 0})
+        entry["wall_ms"] += event["args"]["wall_ms"]
+        entry["cpu_ms"] += event["args"]["cpu_ms"]
+        entry["count"] += 1
+    return dict(sorted(totals.items(), key=lambda item: -item[1]["wall_ms"]))
+
+
+def main(argv=None):
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Print per-stage totals of a trace written with ARVERIFY_TRACE.")
+    parser.add_argument("path")
+    args = parser.parse_args(argv)
+    with open(args.path) as f:
+        events = json.load(f)["traceEvents"]
+    for name, entry in summary(events).items():
+        print(f"{name:<10} {entry['count']:>4} x  wall {entry['wall_ms']:>10.1f} ms  cpu {entry['cpu_ms']:>10.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
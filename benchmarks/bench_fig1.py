@@ -0,0 +1,63 @@
+"""fig1: the lead-time metric pickles, their statistics and the figure."""
+import os
+import pickle
+import shutil
+import tempfile
+
+import numpy as np
+
+from benchmarks.synthetic import FIG1_METRICS, FIG1_MODELS, run_figure, write_fig1
+
+SCALES = [1, 10, 100]
+
+
+class Fig1:
+    params = SCALES
+    param_names = ["scale"]
+    timeout = 600
+
+    def setup(self, scale):
+        self.root = tempfile.mkdtemp(prefix="bench_fig1_")
+        self.metrics = write_fig1(self.root, scale)
+        self.data_dir = os.path.join(self.root, "data", "fig_1")
+        self.cube_path = os.path.join(self.data_dir, "cube")
+        from arverify.cube import write_cube
+        write_cube(self.cube_path, self.metrics)
+
+    def teardown(self, scale):
+        shutil.rmtree(self.root, ignore_errors=True)
+
+    def time_load_pickles(self, scale):
+        for metric in FIG1_METRICS:
+            with open(os.path.join(self.data_dir, f"{metric}.pickle"), "rb") as f:
+                pickle.load(f)
+
+    def time_load_cube(self, scale):
+        from arverify.cube import open_cube
+        cube = open_cube(self.cube_path)
+        for metric in FIG1_METRICS:
+            variable = cube.variable(metric)
+            for model in FIG1_MODELS:
+                np.asarray(variable[model]).sum()
+
+    def time_nan_statistics(self, scale):
+        for per_model in self.metrics.values():
+            for values in per_model.values():
+                np.nanmean(values, axis=0)
+                np.nanstd(values, axis=0) / np.sqrt(np.sum(~np.isnan(values), axis=0))
+
+    def time_moment_store(self, scale):
+        from arverify.moments import MomentStore
+        store = MomentStore.from_metrics(self.metrics)
+        for metric in FIG1_METRICS:
+            for model in FIG1_MODELS:
+                store.sem(metric, model)
+
+    def time_bootstrap(self, scale):
+        from arverify.bootstrap import bootstrap_cis
+        matrices = {(metric, model): self.metrics[metric][model]
+                    for metric in FIG1_METRICS[:4] for model in FIG1_MODELS}
+        bootstrap_cis(matrices, n_boot=1000, seed=0, max_workers=1)
+
+    def time_render(self, scale):
+        run_figure(self.root, "fig1.py", os.path.join(self.root, "fig1.png"))
@@ -0,0 +1,55 @@
+"""fig2: the per-lead landfall-error lists, the window statistics and the box plots."""
+import os
+import shutil
+import tempfile
+
+import numpy as np
+
+from benchmarks.synthetic import FIG2_MODELS, landfall_lists, run_figure, write_fig2
+
+SCALES = [1, 10, 100]
+TIMESTEPS = [17, 29, 41]
+WINDOW = 12
+
+
+class Fig2:
+    params = SCALES
+    param_names = ["scale"]
+    timeout = 600
+
+    def setup(self, scale):
+        self.root = tempfile.mkdtemp(prefix="bench_fig2_")
+        write_fig2(self.root, scale)
+        self.data_dir = os.path.join(self.root, "data", "fig_2")
+        from arverify.ragged import RaggedLeads
+        self.lists = landfall_lists(scale)
+        self.errors = RaggedLeads.from_lists(self.lists)
+        self.errors.write(os.path.join(self.root, "ragged"))
+
+    def teardown(self, scale):
+        shutil.rmtree(self.root, ignore_errors=True)
+
+    def time_load_pickles(self, scale):
+        from arverify.ragged import load_landfall_errors
+        for model in FIG2_MODELS:
+            load_landfall_errors(os.path.join(self.data_dir, f"{model}_lat_landfall_error_degrees.pkl"))
+
+    def time_load_ragged(self, scale):
+        from arverify.ragged import RaggedLeads
+        errors = RaggedLeads.open(os.path.join(self.root, "ragged"))
+        for t in TIMESTEPS:
+            errors.window(t - WINDOW, t).sum()
+
+    def time_exact_windows(self, scale):
+        # What fig2 did before the sketches: hstack each window and take its percentiles
+        for t in TIMESTEPS:
+            np.percentile(np.hstack(self.lists[t - WINDOW:t]), [25, 50, 75])
+
+    def time_sketch_windows(self, scale):
+        from arverify.sketch import lead_sketches, window_sketch
+        sketches = lead_sketches(self.errors)
+        for t in TIMESTEPS:
+            window_sketch(sketches, t - WINDOW, t).box_stats()
+
+    def time_render(self, scale):
+        run_figure(self.root, "fig2.py", os.path.join(self.root, "fig2.png"))
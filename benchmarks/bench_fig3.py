@@ -0,0 +1,46 @@
+"""fig3: the CSI/POD/FAR netCDF files, their error bands and the figure."""
+import os
+import shutil
+import tempfile
+
+from benchmarks.synthetic import FIG3_MODELS, run_figure, write_fig3
+
+SCALES = [1, 10, 100]
+
+
+class Fig3:
+    params = SCALES
+    param_names = ["scale"]
+    timeout = 600
+
+    def setup(self, scale):
+        self.root = tempfile.mkdtemp(prefix="bench_fig3_")
+        write_fig3(self.root, scale)
+        self.paths = {model: os.path.join(self.root, "data", "fig_3", f"{model}_metrics_USWC.nc")
+                      for model in FIG3_MODELS}
+
+    def teardown(self, scale):
+        shutil.rmtree(self.root, ignore_errors=True)
+
+    def time_open_models(self, scale):
+        from arverify.loading import open_models
+        open_models(self.paths).load()
+
+    def time_sem(self, scale):
+        import numpy as np
+
+        from arverify.loading import open_models
+        metrics = open_models(self.paths)
+        for metric in ("CSI", "POD", "FAR"):
+            (metrics[f"{metric}_1000_std"] / np.sqrt(metrics[f"{metric}_1000_count"])).values
+
+    def time_bootstrap(self, scale):
+        from arverify.bootstrap import bootstrap_cis
+        from arverify.loading import open_models
+        metrics = open_models(self.paths)
+        matrices = {(metric, model): metrics[f"{metric}_1000_cases"].sel(model=model).transpose("dates", "time").values
+                    for metric in ("CSI", "POD", "FAR") for model in FIG3_MODELS}
+        bootstrap_cis(matrices, n_boot=1000, seed=0, max_workers=1)
+
+    def time_render(self, scale):
+        run_figure(self.root, "fig3.py", os.path.join(self.root, "fig3.png"))
@@ -0,0 +1,52 @@
+"""fig4: regridding forecast fields onto the ERA5 grid, and the case-study panels.
+
+Here scale is the number of (valid time, lead) maps in a batch. Rendering is
+only timed for a single figure; a batch renders figures independently, so it
+scales linearly from there.
+"""
+import os
+import shutil
+import tempfile
+
+import numpy as np
+
+from benchmarks.synthetic import FIG4_LATS, FIG4_LONS, FIG4_MODELS, run_figure, write_fig4
+
+SCALES = [1, 10, 100]
+N_FIELDS = 4
+
+
+class Fig4Regrid:
+    params = SCALES
+    param_names = ["scale"]
+
+    def setup(self, scale):
+        from arverify.regrid import build_weights
+        # A 0.25 degree ERA5 map and a forecast on a 0.5 degree grid covering it
+        self.src_lats = np.arange(66, 8.99, -0.5)
+        self.src_lons = np.arange(178, 257.01, 0.5)
+        self.weights = build_weights(self.src_lats, self.src_lons, FIG4_LATS, FIG4_LONS % 360)
+        rng = np.random.default_rng(0)
+        self.fields = rng.normal(size=(len(FIG4_MODELS) * N_FIELDS * scale, len(self.src_lats), len(self.src_lons)))
+
+    def time_build_weights(self, scale):
+        from arverify.regrid import build_weights
+        build_weights(self.src_lats, self.src_lons, FIG4_LATS, FIG4_LONS % 360)
+
+    def time_apply_weights(self, scale):
+        from arverify.regrid import apply_weights
+        apply_weights(self.fields, self.weights, (len(FIG4_LATS), len(FIG4_LONS)))
+
+
+class Fig4Render:
+    timeout = 600
+
+    def setup(self):
+        self.root = tempfile.mkdtemp(prefix="bench_fig4_")
+        write_fig4(self.root)
+
+    def teardown(self):
+        shutil.rmtree(self.root, ignore_errors=True)
+
+    def time_render(self):
+        run_figure(self.root, "fig4_models.py", os.path.join(self.root, "fig4.png"))
@@ -0,0 +1,24 @@
+"""Startup: ``import arverify.cli`` and the fig1/fig2 ``arverify`` imports, each in a fresh interpreter.
+
+Every benchmark also asserts arverify.cli's check-startup budgets, so a run
+fails when an import regresses (e.g. fig1 pulling in xarray through a helper).
+"""
+from arverify.cli import (HEAVY_MODULES, LIGHT_SCRIPTS, SCRIPT_BUDGET, SCRIPT_HEAVY_MODULES, SCRIPTS,
+                          STARTUP_BUDGET, script_imports, startup_failures, time_imports)
+
+
+def check(label, modules, budget, heavy_modules):
+    seconds, heavy = time_imports(modules, heavy_modules)
+    failures = startup_failures([(label, seconds, budget, heavy)])
+    assert not failures, "; ".join(failures)
+
+
+class Startup:
+    timeout = 120
+
+    def time_import_cli(self):
+        check("import arverify.cli", ["arverify.cli"], STARTUP_BUDGET, HEAVY_MODULES)
+
+    def time_import_scripts(self):
+        for name in LIGHT_SCRIPTS:
+            check(f"{SCRIPTS[name]} arverify imports", script_imports(name), SCRIPT_BUDGET, SCRIPT_HEAVY_MODULES)
@@ -0,0 +1,79 @@
+"""Run the benchmarks without asv installed.
+
+    python -m benchmarks.run                 # everything, at every scale
+    python -m benchmarks.run fig2 --scales 1 10
+    python -m benchmarks.run Fig1.time_load --repeat 5
+
+The classes follow asv's conventions (``params``, ``setup``/``teardown``,
+``time_*`` methods), so ``asv run`` with the asv.conf.json at the repository
+root runs the same suite and keeps a history across commits.
+"""
+import argparse
+import importlib
+import inspect
+import pkgutil
+import re
+import time
+
+import benchmarks
+
+
+def discover(pattern=None):
+    """(name, class) of every benchmark class whose dotted name matches pattern."""
+    found = []
+    for module_info in pkgutil.iter_modules(benchmarks.__path__):
+        if not module_info.name.startswith("bench_"):
+            continue
+        module = importlib.import_module(f"benchmarks.{module_info.name}")
+        for name, cls in inspect.getmembers(module, inspect.isclass):
+            if cls.__module__ != module.__name__:
+                continue
+            methods = [m for m in dir(cls) if m.startswith("time_")]
+            full_name = f"{module_info.name}.{name}"
+            methods = [m for m in methods if not pattern or re.search(pattern, f"{full_name}.{m}")]
+            if methods:
+                found.append((full_name, cls, methods))
+    return found
+
+
+def run(pattern=None, scales=None, repeat=3):
+    results = []
+    for full_name, cls, methods in discover(pattern):
+        params = getattr(cls, "params", None)
+        for param in (params if params is not None else [None]):
+            if scales and param is not None and param not in scales:
+                continue
+            args = () if param is None else (param,)
+            bench = cls()
+            try:
+                if hasattr(bench, "setup"):
+                    bench.setup(*args)
+            except NotImplementedError:
+                continue
+            try:
+                for method in methods:
+                    times = []
+                    for _ in range(repeat):
+                        start = time.perf_counter()
+                        getattr(bench, method)(*args)
+                        times.append(time.perf_counter() - start)
+                    label = f"{full_name}.{method}" + ("" if param is None else f"[{param}]")
+                    print(f"{label:<50s} {min(times):10.4f} s")
+                    results.append((label, min(times)))
+            finally:
+                if hasattr(bench, "teardown"):
+                    bench.teardown(*args)
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run the arverify benchmarks.")
+    parser.add_argument("pattern", nargs="?", help="regular expression on module.Class.method")
+    parser.add_argument("--scales", nargs="+", type=float, help="only these case-count multipliers")
+    parser.add_argument("--repeat", type=int, default=3, help="runs per benchmark; the fastest is reported")
+    args = parser.parse_args(argv)
+    run(args.pattern, args.scales, args.repeat)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,160 @@
+"""Synthetic stand-ins for the figure inputs, shaped like the files under ./data.
+
+Sizes are today's: 152 init dates (November 2023 - March 2024), 41 lead steps,
+about 160 landfalls per lead step and model, six fig_3 models and a 0.25 degree
+fig_4 map. ``scale`` multiplies the number of cases (init dates and landfalls),
+so 10 and 100 stand for ten and a hundred seasons. Values are random but have
+the structure of the real ones (errors grow with lead time, a few percent
+missing), which is what the loading and statistics code is sensitive to.
+
+``make_tree(root, scale)`` writes a ``root/data`` directory the figure scripts
+can run against unchanged.
+"""
+import os
+import pickle
+
+import numpy as np
+
+N_CASES = 152
+N_LEADS = 41
+LANDFALLS_PER_LEAD = 160
+FIG1_MODELS = ["fourcastnet", "fourcastnetv2", "graphcast", "panguweather", "tigge", "graphcast37", "aurora"]
+FIG1_METRICS = ["TMQ_RMSE", "PSL_RMSE", "U850_RMSE", "V850_RMSE", "WIND850_RMSE", "TMQ_bias"]
+FIG2_MODELS = ["tigge", "graphcast37", "panguweather", "fourcastnet", "fourcastnetv2", "aurora_ft"]
+FIG3_MODELS = ["tigge", "panguweather", "graphcast37", "fourcastnetv2", "fourcastnet", "aurora_ft"]
+FIG4_MODELS = ["graphcast37", "tigge", "aurora_ft", "fourcastnet", "fourcastnetv2", "panguweather"]
+FIG4_LATS = np.arange(65, 9.99, -0.25)
+FIG4_LONS = np.arange(-180, -104.99, 0.25)
+MISSING = 0.03
+
+
+def n_cases(scale):
+    return int(N_CASES * scale)
+
+
+def metric_arrays(scale=1, seed=0):
+    """{metric: {model: (cases, 41) array}}, the fig_1 pickle layout."""
+    rng = np.random.default_rng(seed)
+    growth = np.linspace(0.2, 1.0, N_LEADS)
+    metrics = {}
+    for metric in FIG1_METRICS:
+        metrics[metric] = {}
+        for model in FIG1_MODELS:
+            values = growth * rng.gamma(4.0, 0.5, size=(n_cases(scale), N_LEADS))
+            if metric.endswith("_bias"):
+                values -= values.mean()
+            values[rng.random(values.shape) < MISSING] = np.nan
+            metrics[metric][model] = values
+    return metrics
+
+
+def write_fig1(root, scale=1, seed=0):
+    out_dir = os.path.join(root, "data", "fig_1")
+    os.makedirs(out_dir, exist_ok=True)
+    metrics = metric_arrays(scale, seed)
+    for metric, per_model in metrics.items():
+        with open(os.path.join(out_dir, f"{metric}.pickle"), "wb") as f:
+            pickle.dump(per_model, f)
+    return metrics
+
+
+def landfall_lists(scale=1, seed=0):
+    """41 lists of landfall-latitude errors, the fig_2 pickle layout."""
+    rng = np.random.default_rng(seed)
+    spread = np.linspace(0.5, 6.0, N_LEADS)
+    counts = rng.poisson(LANDFALLS_PER_LEAD * scale, size=N_LEADS)
+    return [list(rng.normal(0, spread[t], size=counts[t])) for t in range(N_LEADS)]
+
+
+def write_fig2(root, scale=1, seed=0):
+    out_dir = os.path.join(root, "data", "fig_2")
+    os.makedirs(out_dir, exist_ok=True)
+    for k, model in enumerate(FIG2_MODELS):
+        with open(os.path.join(out_dir, f"{model}_lat_landfall_error_degrees.pkl"), "wb") as f:
+            pickle.dump(landfall_lists(scale, seed + k), f)
+
+
+def contingency_scores(scale=1, seed=0):
+    """Per-case {metric: (case, lead, threshold)} scores, as arverify.contingency returns them."""
+    from arverify.contingency import METRICS, THRESHOLDS
+
+    rng = np.random.default_rng(seed)
+    decay = np.linspace(0.9, 0.3, N_LEADS)[None, :, None]
+    shape = (n_cases(scale), N_LEADS, len(THRESHOLDS))
+    scores = {metric: np.clip(decay + rng.normal(0, 0.15, size=shape), 0, 1) for metric in METRICS}
+    scores["FAR"] = 1 - scores["FAR"]
+    missing = rng.random(shape) < MISSING
+    for values in scores.values():
+        values[missing] = np.nan
+    return scores
+
+
+def write_fig3(root, scale=1, seed=0, per_case=True):
+    from arverify.contingency import metrics_dataset
+    from arverify.scores import USWC_BOUNDS
+
+    out_dir = os.path.join(root, "data", "fig_3")
+    os.makedirs(out_dir, exist_ok=True)
+    dates = [f"case{i:06d}" for i in range(n_cases(scale))]
+    for k, model in enumerate(FIG3_MODELS):
+        ds = metrics_dataset(contingency_scores(scale, seed + k), dates, model, USWC_BOUNDS, per_case=per_case)
+        ds.to_netcdf(os.path.join(out_dir, f"{model}_metrics_USWC.nc"))
+
+
+def combined_fields(seed=0):
+    """One fig_4 ``{model}_combined.nc`` Dataset on the 0.25 degree map grid."""
+    import xarray as xr
+
+    rng = np.random.default_rng(seed)
+    lon2d, lat2d = np.meshgrid(np.radians(FIG4_LONS), np.radians(FIG4_LATS))
+    phase = rng.uniform(0, 2 * np.pi, size=4)
+
+    def wave(k, amplitude):
+        smooth = np.sin(6 * lon2d + phase[k]) * np.cos(4 * lat2d + phase[(k + 1) % 4])
+        return amplitude * smooth + rng.normal(0, amplitude / 20, size=smooth.shape)
+
+    dims = ("lat", "lon")
+    return xr.Dataset({
+        "TMQ": (dims, wave(0, 20)),
+        "PSL": (dims, wave(1, 25)),
+        "U850": (dims, wave(2, 20)),
+        "V850": (dims, wave(3, 20)),
+        "ar_mask": (dims, (wave(0, 1) > 0.6).astype(np.float64)),
+    }, coords={"lat": FIG4_LATS, "lon": FIG4_LONS})
+
+
+def write_fig4(root, models=FIG4_MODELS, seed=0):
+    out_dir = os.path.join(root, "data", "fig_4")
+    os.makedirs(out_dir, exist_ok=True)
+    for k, model in enumerate(models):
+        combined_fields(seed + k).to_netcdf(os.path.join(out_dir, f"{model}_combined.nc"))
+
+
+def make_tree(root, scale=1, seed=0):
+    """Write every figure's inputs under root/data."""
+    write_fig1(root, scale, seed)
+    write_fig2(root, scale, seed)
+    write_fig3(root, scale, seed)
+    write_fig4(root, seed=seed)
+
+
+def run_figure(root, script, save_path):
+    """Run a figure script against root/data and save it, as ``python -m arverify`` would."""
+    import runpy
+
+    import matplotlib
+    matplotlib.use("Agg")
+    import matplotlib.pyplot as plt
+
+    from arverify.cli import REPO_DIR
+    from arverify.config import set_overrides
+
+    set_overrides(save=True, save_path=save_path, cache=False)  # time the computation, not a plot-cache hit
+    cwd = os.getcwd()
+    os.chdir(root)
+    try:
+        runpy.run_path(os.path.join(REPO_DIR, script), run_name="__main__")
+    finally:
+        os.chdir(cwd)
+        set_overrides()
+        plt.close("all")
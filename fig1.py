@@ -1,15 +1,33 @@
 #%%
 import numpy as np
 import os
-import xarray as xr
 import matplotlib.pyplot as plt
 import pickle
+from arverify.cube import is_current, open_cube
+from arverify.cache import memoize
+from arverify.cases import DATES_FILE, filter_metrics, read_dates
+from arverify.moments import MomentStore
+from arverify.bootstrap import bootstrap_cis
+from arverify.significance import paired_tests, significance_mask
+from arverify.config import param
+from arverify.regiondefs import REGIONS
+from arverify.trace import begin, end, stage
 
-darkmode= False
+darkmode = param("darkmode", False)
 variables = ["TMQ", "PSL", "WIND850", "TMQ_bias"]  # Changed U850 to WIND850 # This line is now commented out
 # variables = ["TMQ", "PSL", "U850", "V850"]  # To recreate the original plot with U850 and V850
-save = False
-save_path = "/glade/work/idavis/AR_CR_project/paper_figs/fig_1.pdf"
+save = param("save", False)
+save_path = param("save_path", "/glade/work/idavis/AR_CR_project/paper_figs/fig_1.pdf")
+region = param("region", "USWC")  # any name in arverify/regiondefs.py; other regions come from python -m arverify.regions
+data_dir = "./data/fig_1" if region == "USWC" else f"./data/fig_1/regions/{region}"
+cube_path = f"{data_dir}/metrics_cube"  # used instead of the pickles when present (python -m arverify.migrate ./data)
+moments_path = f"{data_dir}/moments.npz"  # running aggregates, used instead of both when present (python -m arverify.moments build ...)
+error_band = param("error_band", "sem")  # "sem" for +/-1 standard error, "bootstrap" for a 95% block-bootstrap interval (arverify/bootstrap.py)
+significance = param("significance", None)  # reference model, e.g. "tigge": dots mark leads where a model differs from it at p < 0.05 (arverify/significance.py)
+significance_test = param("significance_test", "permutation")  # or "dm" for Diebold-Mariano
+case_filter = param("case_filter", None)  # e.g. "DJF & all_present" or "20240101-20240229": score only these init dates (arverify/cases.py)
+case_labels = param("case_labels", None)  # JSON of AR categories / named events for "category>=3" or "event=NAME" filters
+use_cache = param("cache", True)  # reuse the computed curves while the inputs and the settings above are unchanged (arverify/cache.py)
 # Define colors for each line'
 if darkmode:
     colors = {
@@ -55,26 +73,123 @@ plt.rcParams['figure.titlesize'] = 15 * font_multiplier
 
 # Create figure with 2x2 subplots
 fig, axs = plt.subplots(2, 2, figsize=(15, 12))
+models_to_plot = ["fourcastnet", "fourcastnetv2", "panguweather", "tigge", "graphcast37", "aurora"]
 x2 = (np.arange(0, 41)) * 0.25  # Convert 6-hour intervals to days (6/24 = 0.25)
 cap_size = 5
-for i, var in enumerate(variables):
-    row = i // 2
-    col = i % 2
-    ax = axs[row, col]
-    
+
+def metric_filename(var):
     if var == "TMQ_bias":
-        filename = f"./data/fig_1/{var[:3]}_bias.pickle"
         # os.system(f"cp {filename} /glade/work/idavis/AR_CR_project/minimally_reproducable_figs/data/fig_1/{var[:3]}_bias.pickle")
+        return f"{data_dir}/{var[:3]}_bias.pickle"
+    # os.system(f"cp {filename} /glade/work/idavis/AR_CR_project/minimally_reproducable_figs/data/fig_1/{var}_RMSE.pickle")
+    return f"{data_dir}/{var}_RMSE.pickle"
 
-    else:
-        filename = f"./data/fig_1/{var}_RMSE.pickle"
-        # os.system(f"cp {filename} /glade/work/idavis/AR_CR_project/minimally_reproducable_figs/data/fig_1/{var}_RMSE.pickle")
+use_cube = os.path.isdir(cube_path)
+if use_cube and not is_current(cube_path, data_dir):
+    print(f"Warning: {cube_path} is older than the fig_1 pickles. Reading the pickles instead "
+          f"(python -m arverify.cube {data_dir} {cube_path} rebuilds it).")
+    use_cube = False
 
-    try:
+def load_metric(filename):
+    stem = os.path.basename(filename).split('.')[0]
+    if use_cube:
+        # Memory-mapped cube (see arverify/cube.py); only the models plotted below are read
+        cube = open_cube(cube_path)
+        metric_data, dates = cube.variable(stem), cube.dates
+    else:
         with open(filename, 'rb') as handle:
-            PICKLE_DATA = pickle.load(handle)
-    except FileNotFoundError:
-        print(f"Warning: File {filename} not found. Skipping variable '{var}'.")
+            metric_data, dates = pickle.load(handle), read_dates(data_dir)
+    if case_filter:
+        # Only the rows of the matching init dates; "all_present" means every plotted model has them
+        metric_data = filter_metrics({model_key: metric_data[model_key] for model_key in models_to_plot if model_key in metric_data},
+                                     dates, case_filter, case_labels)
+    return metric_data
+
+def compute_plot_data():
+    """Means, error bands and significance markers of every panel (cached by arverify/cache.py)."""
+    MOMENTS = MomentStore.load(moments_path) if os.path.exists(moments_path) and not case_filter else None  # aggregates cover every case
+    if MOMENTS is not None and not MOMENTS.is_current([metric_filename(var) for var in variables] + [cube_path]):
+        print(f"Warning: {moments_path} is older than the fig_1 pickles or cube. Ignoring it "
+              f"(rebuild with python -m arverify.moments build {moments_path} {data_dir}).")
+        MOMENTS = None
+    CASE_DATA = {}
+    if error_band == "bootstrap" or significance:
+        # Per-case scores of every (variable, model), for the bootstrap and the paired tests
+        for var in variables:
+            try:
+                with stage("load", figure="fig1", variable=var):
+                    metric_data = load_metric(metric_filename(var))
+            except (FileNotFoundError, KeyError):
+                continue
+            CASE_DATA[var] = {model_key: metric_data[model_key] for model_key in models_to_plot if model_key in metric_data}
+
+    BOOTSTRAP_CI = {}
+    if error_band == "bootstrap":
+        # Intervals for every (variable, model) in one batch, spread over a process pool
+        case_matrices = {(var, model_key): data for var, per_model in CASE_DATA.items() for model_key, data in per_model.items()}
+        with stage("compute", figure="fig1", step="bootstrap"):
+            BOOTSTRAP_CI = bootstrap_cis(case_matrices, n_boot=10000, seed=0)
+
+    SIGNIFICANT = {}
+    tested = {var: per_model for var, per_model in CASE_DATA.items() if significance in per_model and len(per_model) > 1}
+    if tested:
+        # Every model against the reference, for all variables and leads in one batch
+        with stage("compute", figure="fig1", step="significance"):
+            results = paired_tests(tested, reference=significance, n_perm=10000, seed=0)
+            mask = significance_mask(results, significance_test)
+        for v, var in enumerate(results["variables"]):
+            for k, (model_key, _) in enumerate(results["pairs"]):
+                SIGNIFICANT[(var, model_key)] = mask[v, k]
+    elif significance:
+        print(f"Warning: no per-case scores for reference model '{significance}'. Skipping the significance markers.")
+
+    means, sems, missing = {}, {}, []
+    for var in variables:
+        filename = metric_filename(var)
+        stem = os.path.basename(filename).split('.')[0]
+        if MOMENTS is not None and MOMENTS.has_variable(stem):
+            # Running aggregates (see arverify/moments.py); no per-case data needs to be read
+            store = MOMENTS
+        else:
+            try:
+                with stage("load", figure="fig1", variable=var):
+                    PICKLE_DATA = load_metric(filename)
+            except (FileNotFoundError, KeyError):
+                print(f"Warning: File {filename} not found. Skipping variable '{var}'.")
+                missing.append(var)
+                continue
+            store = MomentStore()
+        means[var], sems[var] = {}, {}
+        for model_key in models_to_plot:
+            if store is not MOMENTS and model_key in PICKLE_DATA:
+                with stage("compute", figure="fig1", variable=var, model=model_key):
+                    store.update(stem, model_key, PICKLE_DATA[model_key])
+            if (stem, model_key) not in store:
+                print(f"Warning: Model key '{model_key}' not found in {filename} for variable '{var}'. Plotting NaNs for this model.")
+                means[var][model_key] = np.full_like(x2, np.nan)
+                sems[var][model_key] = np.full_like(x2, np.nan)
+                continue
+
+            # Mean over cases and SEM (std / sqrt(n), 0 where a lead time has no samples)
+            means[var][model_key] = store.mean(stem, model_key)
+            sems[var][model_key] = store.sem(stem, model_key)
+    return {"means": means, "sems": sems, "missing": missing, "bootstrap": BOOTSTRAP_CI, "significant": SIGNIFICANT}
+
+# Re-styling or re-saving reads the cached curves instead of the metric files (python -m arverify.cache)
+PLOT_DATA = memoize("fig1_v1",
+                    [metric_filename(var) for var in variables] + [cube_path, moments_path, f"{data_dir}/{DATES_FILE}"] + ([case_labels] if case_labels else []),
+                    {"variables": variables, "models": models_to_plot, "region": region, "error_band": error_band,
+                     "significance": significance, "significance_test": significance_test, "case_filter": case_filter},
+                    compute_plot_data, enabled=use_cache)
+BOOTSTRAP_CI = PLOT_DATA["bootstrap"]
+SIGNIFICANT = PLOT_DATA["significant"]
+
+for i, var in enumerate(variables):
+    row = i // 2
+    col = i % 2
+    ax = axs[row, col]
+
+    if var in PLOT_DATA["missing"]:
         ax.text(0.5, 0.5, f"Data not found for\\n{var}", ha='center', va='center', transform=ax.transAxes)
         ax.set_title(f"{var} (Data Missing)")
         if row == 1: ax.set_xlabel('Lead Time (Days)')
@@ -83,28 +198,11 @@ for i, var in enumerate(variables):
         ax.grid(True, linestyle='--', alpha=0.6)
         if i == 0: ax.legend() # Still add legend to first panel even if data is missing for it
         continue # Skip to the next variable
-    models_to_plot = ["fourcastnet", "fourcastnetv2", "panguweather", "tigge", "graphcast37", "aurora"]
-    plotted_means = {}
-    plotted_sems = {}
-
-    for model_key in models_to_plot:
-        if model_key not in PICKLE_DATA:
-            print(f"Warning: Model key '{model_key}' not found in {filename} for variable '{var}'. Plotting NaNs for this model.")
-            plotted_means[model_key] = np.full_like(x2, np.nan)
-            plotted_sems[model_key] = np.full_like(x2, np.nan)
-            continue
-
-        data = PICKLE_DATA[model_key]
-        plotted_means[model_key] = np.nanmean(data, axis=0)
-        data_std = np.nanstd(data, axis=0)
-        n_samples = np.sum(~np.isnan(data), axis=0) # Count non-NaN samples for each lead time
-        
-        # Calculate SEM, avoid division by zero or sqrt of zero if n_samples is 0
-        plotted_sems[model_key] = np.zeros_like(data_std, dtype=float) # Initialize with zeros
-        valid_samples_mask = n_samples > 0
-        plotted_sems[model_key][valid_samples_mask] = data_std[valid_samples_mask] / np.sqrt(n_samples[valid_samples_mask])
+    plotted_means = PLOT_DATA["means"][var]
+    plotted_sems = PLOT_DATA["sems"][var]
 
     # Plot lines
+    begin("render", figure="fig1", variable=var)
     # Using .get() with a default NaN array for robustness if a key was still missed (though handled above)
     ax.plot(x2, plotted_means.get("fourcastnet", np.full_like(x2, np.nan)), label="FourCastNet", color=colors["fourcastnet"])
     ax.plot(x2, plotted_means.get("tigge", np.full_like(x2, np.nan)), label="HRES", color=colors["HRES"], linewidth=3, linestyle="--")
@@ -113,14 +211,25 @@ for i, var in enumerate(variables):
     ax.plot(x2, plotted_means.get("graphcast37", np.full_like(x2, np.nan)), label="GraphCast", color=colors["graphcast37"])
     ax.plot(x2, plotted_means.get("aurora", np.full_like(x2, np.nan)), label="Aurora", color=colors["aurora"])
     
-    # Plot standard error with fill_between
+    # Plot standard error (or the bootstrap interval) with fill_between
     for model_key in models_to_plot:
+        if (var, model_key) in BOOTSTRAP_CI:
+            ci_lower, ci_upper = BOOTSTRAP_CI[(var, model_key)]
+            ax.fill_between(x2, ci_lower, ci_upper, color=colors.get(model_key, '#808080'), alpha=0.2)
         # Check if means and sems exist for the model_key (they should due to pre-initialization)
-        if model_key in plotted_means and model_key in plotted_sems:
+        elif model_key in plotted_means and model_key in plotted_sems:
              ax.fill_between(x2, plotted_means[model_key] - plotted_sems[model_key], 
                             plotted_means[model_key] + plotted_sems[model_key], 
                             color=colors.get(model_key, '#808080'), alpha=0.2) # Use .get for color too
 
+    # Mark the leads where a model differs significantly from the reference model
+    for model_key in models_to_plot:
+        significant = SIGNIFICANT.get((var, model_key))
+        if significant is not None and significant.any():
+            n = min(len(x2), len(significant))
+            ax.plot(x2[:n][significant[:n]], plotted_means[model_key][:n][significant[:n]], linestyle="none",
+                    marker="o", markersize=5, color=colors.get(model_key, '#808080'))
+
     # Set titles and labels
     if var == "TMQ":
         title_str = "Integrated Water Vapor"
@@ -166,9 +275,17 @@ for i, var in enumerate(variables):
         # This will apply to the current auto-generated ticks.
         current_yticks = ax.get_yticks()
         ax.set_yticklabels([int(y/100) for y in current_yticks])
+    end()
 
-fig.suptitle("RMSE on U.S. West Coast vs Lead Time", y=0.97, x=0.51, fontsize=20, fontweight='bold') # Updated title
-plt.tight_layout()
-if save: plt.savefig(save_path, dpi=300, bbox_inches='tight')
+fig.suptitle(f"RMSE on {REGIONS.get(region, {}).get('title', region)} vs Lead Time", y=0.97, x=0.51, fontsize=20, fontweight='bold') # Updated title
+if SIGNIFICANT:
+    reference_label = "HRES" if significance == "tigge" else significance
+    fig.text(0.51, 0.0, f"Dots: mean differs from {reference_label} at p < 0.05 ({'sign-flip permutation' if significance_test == 'permutation' else 'Diebold-Mariano'} test on shared init dates)",
+             ha="center", va="top", fontsize=14)
+with stage("render", figure="fig1"):
+    plt.tight_layout()
+if save:
+    with stage("save", figure="fig1"):
+        plt.savefig(save_path, dpi=300, bbox_inches='tight')
 plt.show()
 # %%
@@ -2,13 +2,20 @@
 #%%
 import numpy as np
 import matplotlib.pyplot as plt
-import xarray as xr
-import matplotlib.lines as mlines
-import pickle
+from matplotlib import cbook
 import os
-darkmode = False
-save = False
-save_path = "/glade/work/idavis/AR_CR_project/paper_figs/fig_2.pdf"
+from arverify.ragged import load_landfall_errors
+from arverify.cache import memoize
+from arverify.cases import filter_landfall_errors
+from arverify.sketch import SketchStore, TDigest, window_sketch
+from arverify.config import param
+from arverify.trace import begin, end, stage
+darkmode = param("darkmode", False)
+save = param("save", False)
+save_path = param("save_path", "/glade/work/idavis/AR_CR_project/paper_figs/fig_2.pdf")
+case_filter = param("case_filter", None)  # e.g. "DJF" or "20240101-20240229": only errors from these init dates (arverify/cases.py)
+case_labels = param("case_labels", None)  # JSON of AR categories / named events for "category>=3" or "event=NAME" filters
+use_cache = param("cache", True)  # reuse the box statistics while the inputs and the windows are unchanged (arverify/cache.py)
 
 if darkmode:
     plt.style.use('dark_background')
@@ -61,6 +68,7 @@ TICK_SIZE = 18 * font_multiplier
 model_list = ["tigge", "graphcast37", "panguweather", "fourcastnet", "fourcastnetv2", "aurora_ft"]
 # data_dir = "/glade/work/idavis/AR_CR_project/rmse_data/"
 data_dir = "./data/fig_2/"
+sketch_path = os.path.join(data_dir, "landfall_sketches.npz")  # per-lead t-digests (arverify/sketch.py), used when present; approximate box statistics
 
 # Define timesteps and create labels (accounting for 6-hour intervals)
 timesteps = [17, 29, 41]
@@ -78,32 +86,62 @@ model_names_capitalized = {
     'aurora_ft': 'Aurora'
 }
 
-# Initialize data dictionary
-data = {t: [] for t in timesteps}
-
-# Load data for each model
-for model in model_list:
-    filename = os.path.join(data_dir, f"{model}_lat_landfall_error_degrees.pkl")
-    # os.system(f"cp {filename} /glade/work/idavis/AR_CR_project/minimally_reproducable_figs/data/fig_2/{model}_lat_landfall_error_degrees.pkl")
-
-    if os.path.exists(filename):
-        with open(filename, 'rb') as f:
-            all_lle = pickle.load(f)
+def model_filename(model):
+    return os.path.join(data_dir, f"{model}_lat_landfall_error_degrees.pkl")
+
+def compute_box_stats():
+    """Box statistics of every (window, model); cached by arverify/cache.py."""
+    # Initialize data dictionary; each entry is the box statistics of one model's window
+    data = {t: [] for t in timesteps}
+    with stage("load", figure="fig2", step="sketches"):
+        # The stored sketches merge every case, so a case filter reads the errors themselves
+        stored_sketches = SketchStore.load(sketch_path) if os.path.exists(sketch_path) and not case_filter else SketchStore()
+
+    # Load data for each model
+    for model in model_list:
+        if model in stored_sketches and not stored_sketches.is_current(model, [model_filename(model), model_filename(model)[:-len(".pkl")]]):
+            print(f"Warning: the {model} sketches in {sketch_path} are older than its landfall errors. Reading the errors instead "
+                  f"(python -m arverify.sketch {sketch_path} {data_dir} --models {model} rebuilds them).")
+        elif model in stored_sketches:
+            # Persisted sketches (python -m arverify.sketch): approximate statistics without reading the errors
             for t in timesteps:
-                if t <= len(all_lle):
-                    errors = all_lle[t-window:t]
-                    errors = np.hstack(errors) if isinstance(errors, list) else errors
-                    data[t].append(errors)
-                else:
-                    data[t].append([])
-    else:
-        print(f"File not found for model: {model}")
-        for t in timesteps:
-            data[t].append([])
+                data[t].append(window_sketch(stored_sketches[model], t-window, t).box_stats())
+            continue
+        filename = model_filename(model)
+        # os.system(f"cp {filename} /glade/work/idavis/AR_CR_project/minimally_reproducable_figs/data/fig_2/{model}_lat_landfall_error_degrees.pkl")
+        # Prefer the ragged store (python -m arverify.migrate ./data); windows are then zero-copy slices
+        if os.path.isdir(filename[:-len(".pkl")]):
+            filename = filename[:-len(".pkl")]
+
+        if os.path.exists(filename):
+            with stage("load", figure="fig2", model=model):
+                all_lle = load_landfall_errors(filename)
+                if case_filter:
+                    all_lle = filter_landfall_errors(all_lle, case_filter, case_labels)
+            # Exact statistics of the pooled errors of each window, as ax.boxplot would compute them
+            with stage("compute", figure="fig2", model=model):
+                for t in timesteps:
+                    if t <= len(all_lle):
+                        data[t].append(cbook.boxplot_stats(np.asarray(all_lle.window(t-window, t)))[0])
+                    else:
+                        data[t].append(TDigest().box_stats())
+        else:
+            print(f"File not found for model: {model}")
+            for t in timesteps:
+                data[t].append(TDigest().box_stats())
+    return data
+
+# Re-styling or re-saving reads the cached box statistics instead of the landfall errors (python -m arverify.cache)
+data = memoize("fig2_v2",
+               [sketch_path] + [path for model in model_list for path in (model_filename(model), model_filename(model)[:-len(".pkl")])]
+               + ([case_labels] if case_labels else []),
+               {"models": model_list, "timesteps": timesteps, "window": window, "case_filter": case_filter},
+               compute_box_stats, enabled=use_cache)
 
 
 # Keep existing model configuration and data loading code...
 
+begin("render", figure="fig2")
 # Calculate subplot layout
 n_plots = len(timesteps)
 n_cols = min(3, n_plots)
@@ -125,13 +163,13 @@ for idx, t in enumerate(timesteps):
     
     # Create box plot
     positions = np.arange(len(model_list)) + 1
-    bp = ax.boxplot(data[t], positions=positions, 
-                   patch_artist=True,  # Fill boxes with color
-                   medianprops=dict(color="black", linewidth=1.5),
-                   flierprops=dict(marker='o', markerfacecolor='gray', 
-                                 markersize=4, alpha=1),
-                   showfliers=False,
-                   widths=0.7)
+    bp = ax.bxp(data[t], positions=positions, 
+                patch_artist=True,  # Fill boxes with color
+                medianprops=dict(color="black", linewidth=1.5),
+                flierprops=dict(marker='o', markerfacecolor='gray', 
+                              markersize=4, alpha=1),
+                showfliers=False,
+                widths=0.7)
     
     # Color boxes
     for i, box in enumerate(bp['boxes']):
@@ -162,8 +200,10 @@ for idx, t in enumerate(timesteps):
 plt.suptitle("USWC Meridional Landfall Error at Various Lead Times", y=0.985,fontsize=TITLE_SIZE+3, fontweight='bold')
 
 plt.tight_layout()
+end()
 if save:
-    plt.savefig(save_path, dpi=300, bbox_inches='tight')
+    with stage("save", figure="fig2"):
+        plt.savefig(save_path, dpi=300, bbox_inches='tight')
 
 plt.show()
 #%%
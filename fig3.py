@@ -2,13 +2,18 @@
 #%%
 import numpy as np
 import matplotlib.pyplot as plt
-import xarray as xr
 import matplotlib.lines as mlines
-import pickle
 import os
-darkmode = False
-save = False
-save_path = "/glade/work/idavis/AR_CR_project/paper_figs/fig_3.pdf"
+from arverify.bootstrap import bootstrap_cis
+from arverify.significance import paired_tests, significance_mask
+from arverify.loading import open_models
+from arverify.cache import memoize
+from arverify.cases import filter_fig3
+from arverify.config import param
+from arverify.trace import begin, end, stage
+darkmode = param("darkmode", False)
+save = param("save", False)
+save_path = param("save_path", "/glade/work/idavis/AR_CR_project/paper_figs/fig_3.pdf")
 
 if darkmode:
     plt.style.use('dark_background')
@@ -49,19 +54,101 @@ else:
 
 
 # FAR, POD, CSI
-USWC = 1
-landfalling = 0
-threshold = 1000 # 1000 or 500 km
-
-USWC_str = "_USWC" if USWC else ""
+USWC = param("USWC", 1)
+landfalling = param("landfalling", 0)
+threshold = param("threshold", 1000) # 1000 or 500 km
+error_band = param("error_band", "sem")  # "sem" for +/-1 standard error, "bootstrap" for a 95% block-bootstrap interval (needs the per-case {metric}_{threshold}_cases variables)
+significance = param("significance", None)  # reference model file prefix, e.g. "tigge": dots mark leads where a model differs from it at p < 0.05 (arverify/significance.py; needs the per-case variables)
+significance_test = param("significance_test", "permutation")  # or "dm" for Diebold-Mariano
+case_filter = param("case_filter", None)  # e.g. "DJF & all_present": recompute the scores from these init dates only (arverify/cases.py; needs the per-case variables too)
+case_labels = param("case_labels", None)  # JSON of AR categories / named events for "category>=3" or "event=NAME" filters
+use_cache = param("cache", True)  # reuse the computed curves while the inputs and the settings above are unchanged (arverify/cache.py)
+
+region = param("region", "USWC" if USWC else None)  # other regions: python -m arverify.contingency ... --regions NAME
+USWC_str = f"_{region}" if region else ""
 landfalling_str = "_landfalling" if landfalling else ""
-# Load the data
-gc = xr.open_dataset(f"./data/fig_3/graphcast37_metrics{USWC_str}{landfalling_str}.nc")
-pw = xr.open_dataset(f"./data/fig_3/panguweather_metrics{USWC_str}{landfalling_str}.nc")
-tigge = xr.open_dataset(f"./data/fig_3/tigge_metrics{USWC_str}{landfalling_str}.nc")
-fc = xr.open_dataset(f"./data/fig_3/fourcastnet_metrics{USWC_str}{landfalling_str}.nc")
-fcv2 = xr.open_dataset(f"./data/fig_3/fourcastnetv2_metrics{USWC_str}{landfalling_str}.nc")
-aur = xr.open_dataset(f"./data/fig_3/aurora_ft_metrics{USWC_str}{landfalling_str}.nc")
+# Display name -> file prefix, in plotting order
+model_files = {
+    "HRES": "tigge",
+    "PanguWeather": "panguweather",
+    "GraphCast": "graphcast37",
+    "FourCastNet V2": "fourcastnetv2",
+    "FourCastNet": "fourcastnet",
+    "Aurora": "aurora_ft"
+}
+# Metrics to plot
+metrics = ["CSI", "POD", "FAR"]
+metric_paths = {model_name: f"./data/fig_3/{prefix}_metrics{USWC_str}{landfalling_str}.nc" for model_name, prefix in model_files.items()}
+
+def compute_plot_data():
+    """Curves and error bands of every (metric, model); cached by arverify/cache.py."""
+    # Load the data: all files are opened concurrently and stacked along a "model" dimension
+    # (std/count attrs become {var}_std / {var}_count variables, see arverify/loading.py)
+    with stage("load", figure="fig3"):
+        metrics_ds = open_models(metric_paths)
+    if case_filter:
+        with stage("compute", figure="fig3", step="case_filter"):
+            metrics_ds = filter_fig3(metrics_ds, case_filter, case_labels)
+
+    # Prepare the data in a dictionary for easier iteration
+    models = {model_name: metrics_ds.sel(model=model_name) for model_name in model_files}
+
+    # Per-case scores of every (metric, model), for the bootstrap and the paired tests. open_models joins
+    # the files with join="outer", so a model whose file has no per-case variables still has them here,
+    # filled with NaN; the rows of every model line up on the shared "dates" coordinate.
+    case_matrices = {}
+    if error_band == "bootstrap" or significance:
+        for metric in metrics:
+            for model_name, model_data in models.items():
+                cases = f"{metric}_{threshold}_cases"
+                if cases in model_data and model_data[cases].notnull().any():
+                    case_matrices[(metric, model_name)] = model_data[cases].transpose("dates", "time").values
+                elif error_band == "bootstrap":
+                    print(f"No per-case {metric}_{threshold} values for {model_name}; using the standard error band.")
+
+    BOOTSTRAP_CI = {}
+    if error_band == "bootstrap":
+        # Intervals for every (metric, model) in one batch, spread over a process pool
+        with stage("compute", figure="fig3", step="bootstrap"):
+            BOOTSTRAP_CI = bootstrap_cis(case_matrices, n_boot=10000, seed=0)
+
+    SIGNIFICANT = {}
+    reference = next((name for name, prefix in model_files.items() if significance in (name, prefix)), None)
+    tested = {}
+    for metric in metrics:
+        per_model = {model_name: data for (m, model_name), data in case_matrices.items() if m == metric}
+        if reference in per_model and len(per_model) > 1:
+            tested[metric] = per_model
+    if tested:
+        # Every model against the reference, for all metrics and leads in one batch
+        with stage("compute", figure="fig3", step="significance"):
+            results = paired_tests(tested, reference=reference, n_perm=10000, seed=0)
+            mask = significance_mask(results, significance_test)
+        for v, metric in enumerate(results["variables"]):
+            for k, (model_name, _) in enumerate(results["pairs"]):
+                SIGNIFICANT[(metric, model_name)] = mask[v, k]
+    elif significance:
+        print(f"Warning: no per-case {threshold} km scores for reference model '{significance}'. "
+              f"Skipping the significance markers.")
+
+    means, std_errors = {}, {}
+    for metric in metrics:
+        # Standard error for every model at once
+        std_error = metrics_ds[f"{metric}_{threshold}_std"] / np.sqrt(metrics_ds[f"{metric}_{threshold}_count"])
+        for model_name, model_data in models.items():
+            means[(metric, model_name)] = model_data[f"{metric}_{threshold}"].values
+            std_errors[(metric, model_name)] = std_error.sel(model=model_name).values
+    return {"time": metrics_ds["time"].values, "means": means, "std_errors": std_errors, "bootstrap": BOOTSTRAP_CI,
+            "significant": SIGNIFICANT}
+
+# Re-styling or re-saving reads the cached curves instead of the netCDF files (python -m arverify.cache)
+PLOT_DATA = memoize("fig3_v3", list(metric_paths.values()) + ([case_labels] if case_labels else []),
+                    {"metrics": metrics, "models": model_files, "threshold": threshold, "region": region,
+                     "landfalling": landfalling, "error_band": error_band, "case_filter": case_filter,
+                     "significance": significance, "significance_test": significance_test},
+                    compute_plot_data, enabled=use_cache)
+BOOTSTRAP_CI = PLOT_DATA["bootstrap"]
+SIGNIFICANT = PLOT_DATA["significant"]
 
 # copy all of the above datasets to ./data/fig_3/
 # os.system(f"cp /glade/work/idavis/AR_CR_project/rmse_data/graphcast37_metrics{USWC_str}{landfalling_str}.nc ./data/fig_3/")
@@ -71,19 +158,7 @@ aur = xr.open_dataset(f"./data/fig_3/aurora_ft_metrics{USWC_str}{landfalling_str
 # os.system(f"cp /glade/work/idavis/AR_CR_project/rmse_data/fourcastnetv2_metrics{USWC_str}{landfalling_str}.nc ./data/fig_3/")
 # os.system(f"cp /glade/work/idavis/AR_CR_project/rmse_data/aurora_ft_metrics{USWC_str}{landfalling_str}.nc ./data/fig_3/")  
 
-# Prepare the data in a dictionary for easier iteration
-models = {
-    "HRES": tigge,
-    "PanguWeather": pw,
-    "GraphCast": gc,
-    "FourCastNet V2": fcv2,
-    "FourCastNet": fc,
-    "Aurora": aur
-}
-
-# Metrics to plot
-metrics = ["CSI", "POD", "FAR"]
-
+begin("render", figure="fig3")
 # Create a figure for each metric
 figs, axs = plt.subplots(3, 1, figsize=(10, 15))
 
@@ -91,26 +166,37 @@ figs, axs = plt.subplots(3, 1, figsize=(10, 15))
 for i, metric in enumerate(metrics):
     # Create a list to hold custom legend entries
     custom_legend_entries = []
-    
-    for model_name, model_data in models.items():
+    for model_name in model_files:
         # Plot the actual data
-        x = model_data["time"] * 6 / 24  # convert from steps to days
+        x = PLOT_DATA["time"] * 6 / 24  # convert from steps to days
+        curve = PLOT_DATA["means"][(metric, model_name)]
         if model_name == "HRES":
-            axs[i].plot(x, model_data[f"{metric}_{threshold}"], 
+            axs[i].plot(x, curve, 
                        color=colors[model_name], 
                        linestyle='--',
                        linewidth=3)
         else:
-            axs[i].plot(x, model_data[f"{metric}_{threshold}"], 
+            axs[i].plot(x, curve, 
                        color=colors[model_name], 
                        linestyle='-')
         
-        std_error = model_data[f"{metric}_{threshold}"].attrs["std"] / np.sqrt(model_data[f"{metric}_{threshold}"].attrs["count"])
-        axs[i].fill_between(x, model_data[f"{metric}_{threshold}"] - std_error, 
-                           model_data[f"{metric}_{threshold}"] + std_error, 
-                           color=colors[model_name], 
-                           alpha=0.3)
+        if (metric, model_name) in BOOTSTRAP_CI:
+            ci_lower, ci_upper = BOOTSTRAP_CI[(metric, model_name)]
+            axs[i].fill_between(x, ci_lower, ci_upper, color=colors[model_name], alpha=0.3)
+        else:
+            std_error = PLOT_DATA["std_errors"][(metric, model_name)]
+            axs[i].fill_between(x, curve - std_error, 
+                               curve + std_error, 
+                               color=colors[model_name], 
+                               alpha=0.3)
         
+        # Mark the leads where the model differs significantly from the reference model
+        significant = SIGNIFICANT.get((metric, model_name))
+        if significant is not None and significant.any():
+            n = min(len(x), len(significant))
+            axs[i].plot(x[:n][significant[:n]], curve[:n][significant[:n]], linestyle="none",
+                        marker="o", markersize=5, color=colors[model_name])
+
         # Add a custom legend entry for each model
         custom_legend_entries.append(mlines.Line2D([], [], color=colors[model_name], label=model_name))
 
@@ -147,8 +233,14 @@ for ax in axs:
 axs[0].legend(handles=custom_legend_entries, fontsize=16)
 
 plt.suptitle("CSI, POD, and FAR vs. Leadtime", y=0.985,fontsize=20+3, fontweight='bold')
+if SIGNIFICANT:
+    reference_label = next(name for name, prefix in model_files.items() if significance in (name, prefix))
+    figs.text(0.5, 0.0, f"Dots: mean differs from {reference_label} at p < 0.05 ({'sign-flip permutation' if significance_test == 'permutation' else 'Diebold-Mariano'} test on shared init dates)",
+              ha="center", va="top", fontsize=14)
 
 plt.tight_layout()
+end()
 if save:
-    plt.savefig(save_path, dpi=300, bbox_inches='tight')
+    with stage("save", figure="fig3"):
+        plt.savefig(save_path, dpi=300, bbox_inches='tight')
 plt.show()
@@ -6,15 +6,19 @@ import cartopy.feature as cfeature
 import xarray as xr
 import matplotlib.colors as mcolors
 import matplotlib.colorbar as mcolorbar
-from datetime import datetime
+from datetime import datetime, timedelta
 import os
 from matplotlib.patches import Rectangle
 from matplotlib.lines import Line2D
+from arverify.catalog import CATALOG_PATH, open_catalog
+from arverify.config import param
+from arverify.trace import begin, end, stage
 #%%
 # Add darkmode parameter
-darkmode = False  # Set to False for light mode
-save = False
-save_path = "/glade/work/idavis/AR_CR_project/paper_figs/fig_4.pdf"
+darkmode = param("darkmode", False)  # Set to False for light mode
+save = param("save", False)
+save_path = param("save_path", "/glade/work/idavis/AR_CR_project/paper_figs/fig_4.pdf")
+catalog_path = param("catalog", CATALOG_PATH)  # file paths and time axes of the archive (python -m arverify.catalog)
 
 
 # DO NOT CHANGE THESE PARAMETERS
@@ -51,45 +55,32 @@ diff_str = ""
 
 time_step = n_days * 4 + n_hours
 
-ds = xr.open_dataset(f"/glade/campaign/univ/ucub0156/runs/processed/{date}/{model}/{model}.nc")
-if model == "fourcastnet":
-    ds = ds.isel(lat=slice(0,-1))
-ar_mask = xr.open_dataset(f"/glade/campaign/univ/ucub0156/runs/masked/{date}/{model}_processed.nc")["class_masks"]
+begin("load", figure="fig4-era5", model=model)
+# Valid time of the step from the archive catalog; no forecast file is opened
+catalog = open_catalog(catalog_path, models=[model], dates=[date])
+if (model, date) not in catalog:
+    print(f"Warning: {model} initialized {date} is not in the archive catalog. Assuming 6-hourly steps from 00 UTC.")
 
-if model == "fourcastnet":
-    ds = ds.isel(lat=slice(0,-1))
+def step_valid_time(step):
+    if (model, date) in catalog:
+        return catalog.valid_time(model, date, step)
+    return datetime.strptime(date, "%Y%m%d") + timedelta(hours=6 * step)
 
-
-# Get the Unix timestamp from the dataset
-timestamp = ds['time'][time_step].values.astype(int)
-
-# Convert the Unix timestamp from nanoseconds to seconds
-timestamp_in_seconds = timestamp / 1e9
-
-# Convert the Unix timestamp to a datetime object in UTC
-dt = datetime.utcfromtimestamp(timestamp_in_seconds)
+dt = step_valid_time(time_step)
 
 hour = dt.hour
 day = dt.date()
 
 if hour != 0:
     time_step = time_step - 1
-
-    # Get the Unix timestamp from the dataset
-    timestamp = ds['time'][time_step].values.astype(int)
-
-    # Convert the Unix timestamp from nanoseconds to seconds
-    timestamp_in_seconds = timestamp / 1e9
-
-    # Convert the Unix timestamp to a datetime object in UTC
-    dt = datetime.utcfromtimestamp(timestamp_in_seconds)
+    dt = step_valid_time(time_step)
 
     hour = dt.hour
     day = dt.date()
 
 
 print(f"Initialized {date} 0000 UTC, Valid: {dt} UTC, {model}")
-print(f"ds: Valid {ds.time[time_step].values} UTC")
+print(f"ds: Valid {np.datetime64(dt, 'ns')} UTC")
 
 # Load data from the combined file
 ds_combined = xr.open_dataset(f"./data/fig_4/{model}_combined.nc")
@@ -102,6 +93,8 @@ TMQ = ds_combined['TMQ'].values
 ar_mask = ds_combined['ar_mask'].values
 lons = ds_combined['lon'].values
 lats = ds_combined['lat'].values
+end()
+begin("render", figure="fig4-era5", model=model)
 
 if diff:
     # This block might need adjustment depending on what `diff` is supposed to do with combined files.
@@ -273,6 +266,7 @@ if model == 'Tigge':
 
 # plt.title(f"ERA5:  Valid {dt} UTC\n IWV$_{{(mm;\\ shaded)}}$, 850-hPa Wind$_{{(m/s;\\ vectors)}}$, SLP$_{{(hPa;\\ contours)}}$", x=0.5, y=1.08)
 plt.title(f"ERA5: Valid 2024-03-15 00 UTC", y=1.03)
+end()
 
 
 if save:
@@ -287,6 +281,7 @@ if save:
     # else:
     #     plt.savefig(f"/glade/work/idavis/AR_CR_project/figures/plot_like_cw3e/{model}_{date}_valid_{day}_{hour}{darkmode_str}{diff_str}.png", dpi=300, bbox_inches='tight')
 
-    plt.savefig(save_path, dpi=300, bbox_inches='tight')
+    with stage("save", figure="fig4-era5"):
+        plt.savefig(save_path, dpi=300, bbox_inches='tight')
 plt.show()
 # %%